@@ -12,6 +12,11 @@ from db.base import Base
 from db.models.user import User
 from db.models.chat_message import ChatMessage
 from db.models.chat import Chat
+from db.models.rate_limit import RateLimitBucket, ActiveStream
+from db.models.idempotency_key import IdempotencyKey
+from db.models.model_version import ModelVersion
+from db.models.advice_template import AdviceTemplate
+from db.models.student_precomputed import StudentPrecomputed
 from config import settings
 
 config = context.config
@@ -0,0 +1,39 @@
+"""add rate limit tables
+
+Revision ID: 003_add_rate_limit_tables
+Revises: 002_add_chats_and_chat_id
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '003_add_rate_limit_tables'
+down_revision = '002_add_chats_and_chat_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+    op.create_table(
+        'active_streams',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('chat_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('stream_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'chat_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('active_streams')
+    op.drop_table('rate_limit_buckets')
@@ -0,0 +1,46 @@
+"""add model_versions table
+
+Revision ID: 005_add_model_versions
+Revises: 004_add_idempotency_keys
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '005_add_model_versions'
+down_revision = '004_add_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'model_versions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('name', sa.String(64), nullable=False),
+        sa.Column('version', sa.String(64), nullable=False),
+        sa.Column('path', sa.String(512), nullable=False),
+        sa.Column('metrics', postgresql.JSONB(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('activated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint('name', 'version', name='uq_model_versions_name_version'),
+    )
+    op.create_index('ix_model_versions_name', 'model_versions', ['name'])
+    # не больше одной активной версии на семейство
+    op.create_index(
+        'uq_model_versions_active',
+        'model_versions',
+        ['name'],
+        unique=True,
+        postgresql_where=sa.text('is_active'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_model_versions_active', table_name='model_versions')
+    op.drop_index('ix_model_versions_name', table_name='model_versions')
+    op.drop_table('model_versions')
@@ -0,0 +1,34 @@
+"""add advice_templates table
+
+Revision ID: 006_add_advice_templates
+Revises: 005_add_model_versions
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '006_add_advice_templates'
+down_revision = '005_add_model_versions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'advice_templates',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('subject', sa.String(255), nullable=False),
+        sa.Column('topic', sa.String(255), nullable=False),
+        sa.Column('bucket', sa.String(32), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('model', sa.String(128), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint('subject', 'topic', 'bucket', name='uq_advice_templates_subject_topic_bucket'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('advice_templates')
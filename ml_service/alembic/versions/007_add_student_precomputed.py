@@ -0,0 +1,35 @@
+"""add student_precomputed table
+
+Revision ID: 007_add_student_precomputed
+Revises: 006_add_advice_templates
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '007_add_student_precomputed'
+down_revision = '006_add_advice_templates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'student_precomputed',
+        sa.Column('external_user_id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('features', postgresql.JSONB(), nullable=False),
+        sa.Column('ml_results', postgresql.JSONB(), nullable=False),
+        sa.Column('student_context', sa.Text(), nullable=False),
+        sa.Column('model_version', sa.String(255), nullable=False),
+        sa.Column('computed_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_student_precomputed_expires_at', 'student_precomputed', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_student_precomputed_expires_at', table_name='student_precomputed')
+    op.drop_table('student_precomputed')
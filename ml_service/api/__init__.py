@@ -5,6 +5,7 @@ from fastapi import APIRouter
 
 from .auth.router import router as auth_router
 from .ai.router import router as ml_router  
+from .admin.router import router as admin_router
 
 router = APIRouter()
 
@@ -20,3 +21,9 @@ router.include_router(
     prefix="/ml",
     tags=["ML"]
 )
+
+# Служебные роуты (реестр моделей)
+router.include_router(
+    admin_router,
+    tags=["Admin"]
+)
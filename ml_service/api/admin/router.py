@@ -0,0 +1,46 @@
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException
+
+from config import settings
+from services.advice import advice_templates
+from services.executor import cpu_executor
+from services.feature_cache import student_feature_cache
+from services.llm_router import llm_router
+from services.ml_model import model_registries, topic_batcher
+
+
+router = APIRouter(prefix="/api/admin")
+
+
+def check_admin_token(token: str | None) -> None:
+    # пустой ADMIN_TOKEN — админские эндпоинты выключены
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Нет доступа")
+
+
+@router.get("/models")
+async def models_status(x_admin_token: str | None = Header(default=None)):
+    """Активные версии моделей воркера: время загрузки, память, запросы в работе"""
+    check_admin_token(x_admin_token)
+    return {
+        "models": [registry.status() for registry in model_registries],
+        "batching": topic_batcher.stats(),
+        "feature_cache": student_feature_cache.stats(),
+        "cpu_executor": cpu_executor.stats(),
+        "advice": advice_templates.stats(),
+        "llm_routes": llm_router.stats(),
+    }
+
+
+@router.post("/models/refresh")
+async def models_refresh(x_admin_token: str | None = Header(default=None)):
+    """Сверить активные версии с реестром сейчас, не дожидаясь опроса"""
+    check_admin_token(x_admin_token)
+    swapped = [await registry.refresh() for registry in model_registries]
+    return {
+        "swapped": any(swapped),
+        "models": [registry.status() for registry in model_registries],
+    }
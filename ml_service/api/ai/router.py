@@ -1,18 +1,30 @@
 # ml_service/api/ai/router.py
 import uuid
-from fastapi import APIRouter, Depends, Query, HTTPException
+from datetime import timezone
+from fastapi import APIRouter, Depends, Query, HTTPException, Header, Request
 from fastapi.responses import StreamingResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from services.hf_gpt import HFClient
-from services.features import collect_student_features
-from services.ml_model import predict_topic_needs
-from db.session import AsyncSessionLocal
+from sqlalchemy import select, delete, func, or_, text
+from services.llm_router import llm_router
+from services.llm_backends import LLMBackend
+from services.feature_cache import get_student_features, prefetch_student_features, student_feature_cache
+from services.ml_model import predict_topic_needs_batched
+from services.prompt import build_messages, history_start, history_window, student_blocks
+from services.peer_index import peer_hint
+from services.advice import advice_templates
+from services.executor import cpu_executor
+from services.admission import admission, RateLimitExceeded
+from services.idempotency import idempotency, IdempotencyClaim, IdempotencyConflict
 from db.models.chat_message import ChatMessage
 from db.models.chat import Chat
 from config import settings
+from api.core.deps import (
+    security,
+    get_db,
+    get_user_id_from_token,
+    get_current_user_id,
+)
 from api.ai.schemas import (
     AIMessageRequest,
     AIMessageResponse,
@@ -23,96 +35,356 @@ from api.ai.schemas import (
     ChatItem,
     ChatsListResponse,
     DeleteChatResponse,
+    DeleteAllChatsResponse,
     EditMessageRequest,
 )
 from fastapi import Response
 
 
 router = APIRouter(prefix="/api/ai")
-hf_client = HFClient()
-security = HTTPBearer()  # "Authorization: Bearer <token>"
 
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+# ======================
+# helpers
+# ======================
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+class MarkdownStream(StreamingResponse):
+    """
+    Стрим ответа. on_close вызывается, когда ответ закончен, в том числе
+    если клиент ушёл раньше, чем генератор начал итерироваться (тогда
+    его finally не выполнится) — так слот генерации не висит до TTL.
+    """
+
+    def __init__(self, chunks, on_close=None):
+        super().__init__(chunks, media_type="text/markdown; charset=utf-8", headers=STREAM_HEADERS)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.on_close is not None:
+                await self.on_close()
+
+
+def markdown_stream(chunks, on_close=None) -> StreamingResponse:
+    return MarkdownStream(chunks, on_close)
+
+
+def generation_stream(chunks, handle, claim: IdempotencyClaim | None) -> StreamingResponse:
+    """
+    Ответ с генерацией. С Idempotency-Key генерация идёт в фоне и переживёт
+    обрыв соединения клиента — слот освобождает сам генератор; без ключа
+    слот освобождается и по окончании ответа.
+    """
+    if claim is not None:
+        return markdown_stream(claim.run(chunks))
+    return markdown_stream(chunks, on_close=handle.release)
+
 
+async def student_topic_needs(user_id: uuid.UUID, features):
+    """Результаты модели: посчитанные заранее (student_precomputed) или сейчас"""
+    precomputed = student_feature_cache.precomputed(user_id, features)
+    if precomputed is not None:
+        return precomputed.ml_results
+    return await predict_topic_needs_batched(features)
+
+
+async def student_prompt_blocks(user_id: uuid.UUID, features, ml_results, message: str):
+    """(постоянный блок данных студента, темы, связанные с вопросом)"""
+    precomputed = student_feature_cache.precomputed(user_id, features)
+    # блок собран из тех же ml_results (модель могла смениться между вызовами)
+    if precomputed is not None and precomputed.ml_results is ml_results:
+        stable_context, hint = precomputed.student_context, None
+    else:
+        stable_context, hint = None, peer_hint(features)
+    return await cpu_executor.run(
+        student_blocks,
+        features,
+        ml_results,
+        student_feature_cache.topic_index(user_id, features),
+        message,
+        hint,
+        settings.PROMPT_TOPICS_K,
+        settings.PROMPT_URGENT_DAYS,
+        stable_context,
+    )
+
+
+async def text_stream(text: str):
+    """Готовый ответ одним чанком (в том же формате, что и стрим LLM)"""
+    yield text
+
+
+async def get_idempotency_claim(
+    request: Request,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """
+    Захват Idempotency-Key для генерации. Если эндпоинт упал до старта
+    генерации (404, 429, ошибка Django), ключ освобождается для повтора.
+    """
+    if not idempotency_key:
+        yield None
+        return
+
+    try:
+        external_user_id = get_user_id_from_token(credentials.credentials)
+    except ValueError:
+        # ошибку токена вернёт сам эндпоинт
+        yield None
+        return
 
-def get_user_id_from_token(access_token: str) -> uuid.UUID:
-    """Извлекает user_id из JWT токена"""
     try:
-        payload = jwt.decode(
-            access_token,
-            settings.JWT_SECRET_KEY,
-            algorithms=[settings.JWT_ALGORITHM],
+        claim = await idempotency.begin(
+            external_user_id,
+            idempotency_key,
+            f"{request.method} {request.url.path}",
+            await request.body(),
         )
-        # В Django SimpleJWT используется 'user_id' в payload
-        user_id = payload.get("user_id") or payload.get("sub")
-        if user_id is None:
-            raise ValueError("User ID not found in token")
-        return uuid.UUID(str(user_id))
-    except (JWTError, ValueError, TypeError) as e:
-        raise ValueError(f"Invalid token: {e}")
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
+    try:
+        yield claim
+    except Exception:
+        await claim.abandon()
+        raise
 
-# ======================
-# helpers
-# ======================
-def build_student_context(features: dict, ml_results: dict) -> str:
-    parts = []
 
-    for topic, data in features.items():
-        avg = data.get("avg_score")
-        fails = data.get("fails")
-        days = data.get("days_until_event")
-        is_test = data.get("is_test")
-        is_exam = data.get("is_exam")
+def rate_limited(e: RateLimitExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=e.detail,
+        headers={"Retry-After": e.retry_after_header},
+    )
 
-        line = f"Тема: {topic}. "
-        if avg is not None:
-            line += f"Средняя оценка {avg}. "
-        if fails:
-            line += f"Провалов {fails}. "
-        if days is not None:
-            if is_exam:
-                line += f"Экзамен через {days} дней. "
-            elif is_test:
-                line += f"Контрольная через {days} дней. "
 
-        parts.append(line)
+# Вставка ответа с проверкой владельца в том же запросе: если чат удалили
+# (в том числе в другом воркере), строка не вставится
+INSERT_MESSAGE_SQL = text("""
+INSERT INTO chat_messages (id, chat_id, external_user_id, user_message, ai_response, created_at)
+SELECT :id, :chat_id, :user_id, :user_message, :ai_response, now()
+WHERE EXISTS (
+    SELECT 1 FROM chats WHERE id = :chat_id AND external_user_id = :user_id
+)
+RETURNING id
+""")
 
-    for topic, ml in ml_results.items():
-        if ml.get("need_review"):
-            parts.append(f"По теме {topic} модель советует повторить материал.")
 
-    return " ".join(parts)
+async def insert_chat_message(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    external_user_id: uuid.UUID,
+    user_message: str,
+    ai_response: str,
+) -> uuid.UUID | None:
+    """Сохранить пару вопрос/ответ; None — чата уже нет или он чужой"""
+    result = await db.execute(
+        INSERT_MESSAGE_SQL,
+        {
+            "id": uuid.uuid4(),
+            "chat_id": chat_id,
+            "user_id": external_user_id,
+            "user_message": user_message,
+            "ai_response": ai_response,
+        },
+    )
+    message_id = result.scalar_one_or_none()
+    await db.commit()
+    return message_id
 
 
-async def get_chat_history_before_message(
+async def get_chat_turns(
     db: AsyncSession,
     chat_id: uuid.UUID,
+    external_user_id: uuid.UUID,
+    max_turns: int,
+) -> list[tuple[str, str]] | None:
+    """
+    Окно истории промпта (history_start): прошлые ходы чата (вопрос, ответ)
+    от старых к новым. Из базы читаются только последние max_turns ходов
+    и их общее число. None — чата нет или он не принадлежит пользователю.
+    """
+    result = await db.execute(
+        select(ChatMessage.user_message, ChatMessage.ai_response, func.count(ChatMessage.id).over())
+        .select_from(Chat)
+        .outerjoin(ChatMessage, ChatMessage.chat_id == Chat.id)
+        .where(Chat.id == chat_id)
+        .where(Chat.external_user_id == external_user_id)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(max_turns if max_turns > 0 else None)
+    )
+    rows = result.all()
+    if not rows:
+        return None
+
+    # у чата без сообщений — одна строка из NULL и total = 0
+    total = rows[0][2]
+    turns = [(user_message, ai_response) for user_message, ai_response, _ in reversed(rows[:total])]
+    return turns[history_start(total, max_turns) - (total - len(turns)):]
+
+
+async def get_message_with_history(
+    db: AsyncSession,
     message_id: uuid.UUID,
-) -> list[ChatMessage]:
-    """Получить историю чата до указанного сообщения (для контекста)"""
-    # Сначала получаем время создания редактируемого сообщения
-    msg_result = await db.execute(
-        select(ChatMessage.created_at)
+    external_user_id: uuid.UUID,
+) -> tuple[ChatMessage | None, list[ChatMessage]]:
+    """
+    Одним запросом получить редактируемое сообщение и историю чата до него.
+    Владение проверяется в CTE через join с chats.
+    """
+    target = (
+        select(
+            ChatMessage.id,
+            ChatMessage.chat_id,
+            ChatMessage.created_at,
+        )
+        .join(Chat, Chat.id == ChatMessage.chat_id)
         .where(ChatMessage.id == message_id)
+        .where(ChatMessage.external_user_id == external_user_id)
+        .where(Chat.external_user_id == external_user_id)
+        .cte("target")
     )
-    msg_time = msg_result.scalar_one_or_none()
-    
-    if not msg_time:
-        return []
-    
-    # Получаем все сообщения до этого времени
+
     result = await db.execute(
         select(ChatMessage)
+        .join(target, ChatMessage.chat_id == target.c.chat_id)
+        .where(
+            or_(
+                ChatMessage.id == target.c.id,
+                ChatMessage.created_at < target.c.created_at,
+            )
+        )
+        .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+    )
+    rows = result.scalars().all()
+
+    chat_message = next((m for m in rows if m.id == message_id), None)
+    if chat_message is None:
+        return None, []
+
+    history = [m for m in rows if m.id != message_id]
+    return chat_message, history
+
+
+# Готовый JSON для /history: пары user/assistant разворачиваются через
+# LATERAL VALUES и агрегируются json_agg в том же порядке, что и в ORM-версии
+# (id разводит сообщения с одинаковым created_at). created_at — как
+# datetime.isoformat(): без дробной части, если микросекунд нет
+HISTORY_JSON_SQL = text("""
+WITH msgs AS (
+    SELECT m.id, m.chat_id, m.user_message, m.ai_response, m.created_at
+    FROM chat_messages m
+    JOIN chats c ON c.id = m.chat_id
+    WHERE m.chat_id = :chat_id
+      AND c.external_user_id = :user_id
+    ORDER BY m.created_at ASC, m.id ASC
+    LIMIT :limit
+)
+SELECT
+    (SELECT count(*) FROM msgs) AS total,
+    json_build_object(
+        'messages',
+        coalesce(
+            json_agg(
+                json_build_object(
+                    'id', m.id::text,
+                    'chat_id', m.chat_id::text,
+                    'role', r.role,
+                    'text', r.body,
+                    'created_at',
+                    to_char(m.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+                    || CASE
+                        WHEN date_trunc('second', m.created_at) = m.created_at THEN ''
+                        ELSE to_char(m.created_at AT TIME ZONE 'UTC', '.US')
+                    END
+                    || '+00:00'
+                )
+                ORDER BY m.created_at ASC, m.id ASC, r.ord ASC
+            ),
+            '[]'::json
+        )
+    )::text AS body
+FROM msgs m
+CROSS JOIN LATERAL (
+    VALUES (0, 'user', m.user_message), (1, 'assistant', m.ai_response)
+) AS r(ord, role, body)
+WHERE r.body <> ''
+""")
+
+
+async def fetch_history_json(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    external_user_id: uuid.UUID,
+    limit: int,
+) -> tuple[int, str]:
+    """История чата готовым JSON-текстом: (число сообщений, тело ответа)"""
+    result = await db.execute(
+        HISTORY_JSON_SQL,
+        {"chat_id": chat_id, "user_id": external_user_id, "limit": limit},
+    )
+    total, body = result.one()
+    return total, body
+
+
+async def fetch_history_items(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    external_user_id: uuid.UUID,
+    limit: int,
+) -> list[ChatHistoryItem]:
+    """История чата через ORM и Pydantic (медленный путь)"""
+    # тянем сообщения, владение чатом проверяется тем же запросом
+    result = await db.execute(
+        select(ChatMessage)
+        .join(Chat, Chat.id == ChatMessage.chat_id)
         .where(ChatMessage.chat_id == chat_id)
-        .where(ChatMessage.id != message_id)
-        .where(ChatMessage.created_at < msg_time)
-        .order_by(ChatMessage.created_at.asc())
+        .where(Chat.external_user_id == external_user_id)
+        .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+        .limit(limit)
     )
-    return result.scalars().all()
+    rows = result.scalars().all()
+
+    messages: list[ChatHistoryItem] = []
+
+    for msg in rows:
+        # в UTC, как в HISTORY_JSON_SQL
+        created = msg.created_at.astimezone(timezone.utc).isoformat()
+
+        # USER
+        if msg.user_message:
+            messages.append(
+                ChatHistoryItem(
+                    id=str(msg.id),
+                    chat_id=str(msg.chat_id),
+                    role="user",
+                    text=msg.user_message,
+                    created_at=created,
+                )
+            )
+
+        # ASSISTANT
+        if msg.ai_response:
+            messages.append(
+                ChatHistoryItem(
+                    id=str(msg.id),
+                    chat_id=str(msg.chat_id),
+                    role="assistant",
+                    text=msg.ai_response,
+                    created_at=created,
+                )
+            )
+
+    return messages
 
 
 # ======================
@@ -121,17 +393,10 @@ async def get_chat_history_before_message(
 @router.post("/chats", response_model=CreateChatResponse)
 async def create_chat(
     payload: CreateChatRequest,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    external_user_id: uuid.UUID = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_db),
 ):
     """Создать новый чат"""
-    access_token = credentials.credentials
-    
-    try:
-        external_user_id = get_user_id_from_token(access_token)
-    except ValueError:
-        raise HTTPException(status_code=401, detail="Неверный токен")
-    
     # Создаем новый чат
     chat = Chat(
         external_user_id=external_user_id,
@@ -161,6 +426,9 @@ async def get_chats(
     except ValueError:
         return ChatsListResponse(chats=[])
     
+    # Студент открывает чаты — следом почти всегда будет /message
+    prefetch_student_features(external_user_id, access_token)
+    
     # Получаем все чаты пользователя
     result = await db.execute(
         select(Chat)
@@ -197,18 +465,19 @@ async def delete_chat(
     except ValueError:
         raise HTTPException(status_code=400, detail="Неверный формат chat_id")
     
-    # Проверяем, что чат существует и принадлежит пользователю
-    chat_result = await db.execute(
-        select(Chat)
+    # Один DELETE ... RETURNING: проверка владельца и удаление сразу.
+    # Сообщения удаляет Postgres по ON DELETE CASCADE, в память они не грузятся
+    result = await db.execute(
+        delete(Chat)
         .where(Chat.id == chat_uuid)
         .where(Chat.external_user_id == external_user_id)
+        .returning(Chat.id)
+        .execution_options(synchronize_session=False)
     )
-    chat = chat_result.scalar_one_or_none()
-    if not chat:
+    deleted_id = result.scalar_one_or_none()
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Чат не найден")
-    
-    # Удаляем чат (сообщения удалятся автоматически благодаря CASCADE)
-    db.delete(chat)
+
     await db.commit()
     
     return DeleteChatResponse(
@@ -217,11 +486,33 @@ async def delete_chat(
     )
 
 
+@router.delete("/chats", response_model=DeleteAllChatsResponse)
+async def delete_all_chats(
+    external_user_id: uuid.UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Удалить все чаты пользователя"""
+    result = await db.execute(
+        delete(Chat)
+        .where(Chat.external_user_id == external_user_id)
+        .returning(Chat.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_ids = result.scalars().all()
+    await db.commit()
+
+    return DeleteAllChatsResponse(
+        message="Чаты успешно удалены",
+        deleted_chat_ids=[str(deleted_id) for deleted_id in deleted_ids],
+    )
+
+
 @router.post("/message")
 async def message(
     payload: AIMessageRequest,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db),
+    claim: IdempotencyClaim | None = Depends(get_idempotency_claim),
 ):
     access_token = credentials.credentials
     
@@ -239,39 +530,63 @@ async def message(
         print(f"❌ [MESSAGE] Ошибка парсинга данных: {e}")
         raise HTTPException(status_code=400, detail=f"Неверный формат данных: {e}")
     
-    # Проверяем, что чат существует и принадлежит пользователю
+    # Повтор с тем же Idempotency-Key: подключаемся к идущему стриму
+    # или отдаём сохранённый ответ, новую генерацию не запускаем
+    if claim is not None and claim.replay is not None:
+        print(f"🔁 [MESSAGE] Повтор по Idempotency-Key, отдаём существующий ответ")
+        return markdown_stream(claim.replay)
+    
+    # Проверяем, что чат существует и принадлежит пользователю, — тем же
+    # запросом, что читает окно истории для промпта
     print(f"🔍 [MESSAGE] Проверяем существование чата...")
-    chat_result = await db.execute(
-        select(Chat)
-        .where(Chat.id == chat_id)
-        .where(Chat.external_user_id == external_user_id)
-    )
-    chat = chat_result.scalar_one_or_none()
-    if not chat:
+    history = await get_chat_turns(db, chat_id, external_user_id, settings.PROMPT_HISTORY_TURNS)
+    if history is None:
         print(f"❌ [MESSAGE] Чат не найден или не принадлежит пользователю")
         raise HTTPException(status_code=404, detail="Чат не найден")
-    print(f"✅ [MESSAGE] Чат найден: {chat.title}")
+    print(f"✅ [MESSAGE] Чат найден")
     
-    features = await collect_student_features(access_token)
-    ml_results = predict_topic_needs(features)
-    student_context = build_student_context(features, ml_results)
-
-    # Упрощенный промпт
-    prompt = f"""
-Информация о студенте:
-{student_context}
-
-Вопрос студента:
-"{payload.message}"
+    # Лимит сообщений в минуту — токен списывается только за запрос в свой чат,
+    # отказ — до похода в Django и модели
+    try:
+        await admission.check_rate(external_user_id)
+    except RateLimitExceeded as e:
+        print(f"⛔ [MESSAGE] Rate limit: {e.detail}")
+        raise rate_limited(e)
+    
+    features = await get_student_features(external_user_id, access_token)
+    ml_results = await student_topic_needs(external_user_id, features)
+
+    # Общий вопрос («как подготовиться?») — отвечаем готовым советом для
+    # самой срочной темы, без LLM и без слота генерации
+    advice = advice_templates.match(
+        payload.message, features, ml_results, student_feature_cache.topic_index(external_user_id, features)
+    )
+    if advice is not None:
+        print(f"⚡ [MESSAGE] Ответ из готового совета, LLM не вызываем")
+        if await insert_chat_message(db, chat_id, external_user_id, payload.message, advice) is None:
+            print(f"❌ [MESSAGE] Чат удалён, пока собирали ответ")
+            raise HTTPException(status_code=404, detail="Чат не найден")
+        chunks = text_stream(advice)
+        if claim is not None:
+            # ответ уже сохранён — повтор получит его же
+            claim.succeed()
+            chunks = claim.run(chunks)
+        return markdown_stream(chunks)
+
+    student_context, related_context = await student_prompt_blocks(
+        external_user_id, features, ml_results, payload.message
+    )
 
-Напиши один совет (30-50 слов) для этого студента на русском языке.
-Совет должен быть конкретным и мотивирующим.
-Если данных по другим предметам нет, опирайся только на то, что известно (например, {student_context}).
-"""
+    # Системная инструкция и данные студента — постоянный префикс, дальше
+    # прошлые ходы чата (только дописываются), вопрос — в конце
+    prompt = build_messages(student_context, payload.message, related_context, history)
 # 🔥 ЛОГИРОВАНИЕ ЗАПРОСА (INPUT)
     print("\n" + "="*50)
     print("🚀 [INPUT] CONTEXT & PROMPT:")
     print(f"Context: {student_context}")
+    if related_context:
+        print(f"Related: {related_context}")
+    print(f"History: {len(history)} сообщений")
     print("-" * 20)
     print(f"User Msg: {payload.message}")
     print("="*50 + "\n")
@@ -284,11 +599,24 @@ async def message(
     print(f"📨 [MESSAGE] Chat ID: {chat_id}")
     print(f"📨 [MESSAGE] User message: {payload.message[:100]}...")
     
+    route = llm_router.classify(payload.message, prompt, len(history))
+    print(f"🧭 [MESSAGE] Маршрут LLM: {route}")
+    
+    # Регистрируем генерацию: предыдущая в этом чате будет вытеснена
+    try:
+        handle = await admission.open_stream(external_user_id, chat_id)
+    except RateLimitExceeded as e:
+        print(f"⛔ [MESSAGE] Лимит активных стримов: {e.detail}")
+        raise rate_limited(e)
+    
     async def stream_generator():
         nonlocal full_response, chunk_count
+        failed = False
         try:
             print(f"🔄 [MESSAGE] Начало стриминга от HF")
-            async for chunk in hf_client.ask_stream(prompt):
+            async for chunk in handle.guard(llm_router.stream(route, prompt)):
+                if chunk in LLMBackend.STREAM_ERROR_TEXTS:
+                    failed = True
                 if chunk:
                     full_response += chunk
                     chunk_count += 1
@@ -303,23 +631,25 @@ async def message(
             print(f"📊 [MESSAGE] Полная длина ответа: {len(full_response)} символов")
             print(f"📊 [MESSAGE] Ответ (первые 200 символов): {full_response[:200]}...")
             
+            if handle.superseded:
+                print(f"⏹️ [MESSAGE] Генерация вытеснена новым сообщением в чате, не сохраняем")
+                return
+            
             # Сохраняем в БД после завершения стриминга
             if full_response and full_response.strip():
                 try:
                     print(f"💾 [MESSAGE] Сохраняем сообщение в БД...")
-                    chat_message = ChatMessage(
-                        chat_id=chat_id,
-                        external_user_id=external_user_id,
-                        user_message=payload.message,
-                        ai_response=full_response.strip(),
+                    message_id = await insert_chat_message(
+                        db, chat_id, external_user_id, payload.message, full_response.strip()
                     )
-                    db.add(chat_message)
-                    await db.flush()
-                    await db.commit()
-                    await db.refresh(chat_message)
-                    print(f"✅ [MESSAGE] Сообщение успешно сохранено в БД")
-                    print(f"✅ [MESSAGE] ID сообщения: {chat_message.id}")
-                    print(f"✅ [MESSAGE] Проверка ai_response: '{chat_message.ai_response[:100]}...'")
+                    if message_id is None:
+                        print(f"⚠️ [MESSAGE] Чат удалён во время генерации, ответ не сохраняем")
+                    else:
+                        print(f"✅ [MESSAGE] Сообщение успешно сохранено в БД")
+                        print(f"✅ [MESSAGE] ID сообщения: {message_id}")
+                        # ответ с ошибкой модели повтор по Idempotency-Key не получит
+                        if claim is not None and not failed:
+                            claim.succeed()
                 except Exception as e:
                     print(f"❌ [MESSAGE] Ошибка сохранения в БД: {e}")
                     import traceback
@@ -335,16 +665,10 @@ async def message(
             import traceback
             traceback.print_exc()
             yield f"Произошла ошибка при получении ответа.\n"
+        finally:
+            await handle.release()
         
-    return StreamingResponse(
-        stream_generator(),
-        media_type="text/markdown; charset=utf-8",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
-    )
+    return generation_stream(stream_generator(), handle, claim)
 
 
 @router.get("/history", response_model=ChatHistoryResponse)
@@ -362,53 +686,18 @@ async def get_chat_history(
     except ValueError:
         return ChatHistoryResponse(messages=[])
 
-    # проверяем чат
-    chat_result = await db.execute(
-        select(Chat)
-        .where(Chat.id == chat_uuid)
-        .where(Chat.external_user_id == external_user_id)
-    )
-    chat = chat_result.scalar_one_or_none()
-    if not chat:
-        return ChatHistoryResponse(messages=[])
-
-    # тянем сообщения
-    result = await db.execute(
-        select(ChatMessage)
-        .where(ChatMessage.chat_id == chat_uuid)
-        .order_by(ChatMessage.created_at.asc())
-        .limit(limit)
-    )
-    rows = result.scalars().all()
-
-    messages: list[ChatHistoryItem] = []
+    # Фичи для следующего /message грузятся, пока отдаём историю
+    prefetch_student_features(external_user_id, access_token)
 
-    for msg in rows:
-        created = msg.created_at.isoformat()
-
-        # USER
-        if msg.user_message:
-            messages.append(
-                ChatHistoryItem(
-                    id=str(msg.id),
-                    chat_id=str(msg.chat_id),
-                    role="user",
-                    text=msg.user_message,
-                    created_at=created,
-                )
-            )
+    if settings.HISTORY_SQL_JSON:
+        # Быстрый путь: Postgres отдаёт готовое тело ответа,
+        # Response возвращается как есть — FastAPI не валидирует его повторно
+        _, body = await fetch_history_json(
+            db, chat_uuid, external_user_id, limit
+        )
+        return Response(content=body, media_type="application/json")
 
-        # ASSISTANT
-        if msg.ai_response:
-            messages.append(
-                ChatHistoryItem(
-                    id=str(msg.id),
-                    chat_id=str(msg.chat_id),
-                    role="assistant",
-                    text=msg.ai_response,
-                    created_at=created,
-                )
-            )
+    messages = await fetch_history_items(db, chat_uuid, external_user_id, limit)
 
     return ChatHistoryResponse(messages=messages)
 
@@ -419,6 +708,7 @@ async def edit_message(
     payload: EditMessageRequest,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db),
+    claim: IdempotencyClaim | None = Depends(get_idempotency_claim),
 ):
     """Редактировать сообщение пользователя и получить новый ответ от AI"""
     access_token = credentials.credentials
@@ -429,119 +719,98 @@ async def edit_message(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Неверный формат данных: {e}")
     
-    # Находим сообщение
-    msg_result = await db.execute(
-        select(ChatMessage)
-        .where(ChatMessage.id == msg_uuid)
-        .where(ChatMessage.external_user_id == external_user_id)
+    # Повтор с тем же Idempotency-Key: сообщение уже отредактировано,
+    # отдаём идущий или сохранённый ответ
+    if claim is not None and claim.replay is not None:
+        return markdown_stream(claim.replay)
+    
+    # Находим сообщение (в своём чате) и историю до него одним запросом
+    chat_message, history_messages = await get_message_with_history(
+        db, msg_uuid, external_user_id
     )
-    chat_message = msg_result.scalar_one_or_none()
     if not chat_message:
         raise HTTPException(status_code=404, detail="Сообщение не найдено")
     
-    # Проверяем, что чат принадлежит пользователю
-    chat_result = await db.execute(
-        select(Chat)
-        .where(Chat.id == chat_message.chat_id)
-        .where(Chat.external_user_id == external_user_id)
-    )
-    chat = chat_result.scalar_one_or_none()
-    if not chat:
-        raise HTTPException(status_code=404, detail="Чат не найден")
+    # Лимит сообщений в минуту — после проверки владельца, до похода в Django
+    try:
+        await admission.check_rate(external_user_id)
+    except RateLimitExceeded as e:
+        raise rate_limited(e)
     
-    # Получаем историю чата до этого сообщения для контекста
-    history_messages = await get_chat_history_before_message(
-        db, chat_message.chat_id, msg_uuid
+    # Получаем фичи студента
+    features = await get_student_features(external_user_id, access_token)
+    ml_results = await student_topic_needs(external_user_id, features)
+    student_context, related_context = await student_prompt_blocks(
+        external_user_id, features, ml_results, payload.new_text
     )
     
-    # Сохраняем время создания редактируемого сообщения
-    edit_message_time = chat_message.created_at
-    
-    # Удаляем все сообщения после редактируемого (как в ChatGPT)
-    # Удаляем сообщения, которые были созданы после редактируемого
-    deleted_result = await db.execute(
-        delete(ChatMessage)
-        .where(ChatMessage.chat_id == chat_message.chat_id)
-        .where(ChatMessage.created_at > edit_message_time)
-        .where(ChatMessage.external_user_id == external_user_id)  # Безопасность: только свои сообщения
+    # История до редактируемого сообщения идёт между данными студента
+    # и вопросом — префикс промпта от хода к ходу только дописывается
+    history = history_window(
+        [(m.user_message, m.ai_response) for m in history_messages], settings.PROMPT_HISTORY_TURNS
     )
-    
-    # Логируем количество удаленных сообщений
-    deleted_count = deleted_result.rowcount if hasattr(deleted_result, 'rowcount') else 0
-    print(f"✏️ [EDIT] Удалено сообщений после редактируемого: {deleted_count}")
-    
-    # Обновляем текст сообщения пользователя
-    chat_message.user_message = payload.new_text
-    # Очищаем старый ответ AI
-    chat_message.ai_response = ""
-    
-    # Сохраняем изменения
-    await db.commit()
-    await db.refresh(chat_message)
-    
-    # Получаем фичи студента
-    features = await collect_student_features(access_token)
-    ml_results = predict_topic_needs(features)
-    student_context = build_student_context(features, ml_results)
-    
-    # Строим контекст из истории чата
-    history_context = ""
-    if history_messages:
-        history_parts = []
-        for hist_msg in history_messages:
-            if hist_msg.user_message:
-                history_parts.append(f"Пользователь: {hist_msg.user_message}")
-            if hist_msg.ai_response:
-                history_parts.append(f"Ассистент: {hist_msg.ai_response}")
-        history_context = "\n".join(history_parts)
-    
-    # Формируем промпт с учетом истории
-    if history_context:
-        prompt = f"""
-Информация о студенте:
-{student_context}
-
-Предыдущая переписка:
-{history_context}
-
-Вопрос студента (отредактированный):
-"{payload.new_text}"
-
-Напиши один совет (30-50 слов) для этого студента на русском языке.
-Совет должен быть конкретным и мотивирующим.
-Если данных по другим предметам нет, опирайся только на то, что известно.
-"""
-    else:
-        prompt = f"""
-Информация о студенте:
-{student_context}
-
-Вопрос студента:
-"{payload.new_text}"
-
-Напиши один совет (30-50 слов) для этого студента на русском языке.
-Совет должен быть конкретным и мотивирующим.
-Если данных по другим предметам нет, опирайся только на то, что известно (например, {student_context}).
-"""
+    prompt = build_messages(student_context, payload.new_text, related_context, history)
     
     # Логируем запрос
     print("\n" + "="*50)
     print("✏️ [EDIT] CONTEXT & PROMPT:")
     print(f"Context: {student_context}")
-    if history_context:
-        print(f"History: {history_context[:200]}...")
+    if related_context:
+        print(f"Related: {related_context}")
+    print(f"History: {len(history)} сообщений")
     print("-" * 20)
     print(f"Edited Msg: {payload.new_text}")
     print("="*50 + "\n")
     
+    route = llm_router.classify(payload.new_text, prompt, len(history))
+    
+    # Регистрируем генерацию до изменения БД: при отказе сообщение не трогаем,
+    # а предыдущая генерация в этом чате будет вытеснена
+    try:
+        handle = await admission.open_stream(external_user_id, chat_message.chat_id)
+    except RateLimitExceeded as e:
+        raise rate_limited(e)
+    
+    try:
+        # Сохраняем время создания редактируемого сообщения
+        edit_message_time = chat_message.created_at
+    
+        # Удаляем все сообщения после редактируемого (как в ChatGPT)
+        # Удаляем сообщения, которые были созданы после редактируемого
+        deleted_result = await db.execute(
+            delete(ChatMessage)
+            .where(ChatMessage.chat_id == chat_message.chat_id)
+            .where(ChatMessage.created_at > edit_message_time)
+            .where(ChatMessage.external_user_id == external_user_id)  # Безопасность: только свои сообщения
+        )
+    
+        # Логируем количество удаленных сообщений
+        deleted_count = deleted_result.rowcount if hasattr(deleted_result, 'rowcount') else 0
+        print(f"✏️ [EDIT] Удалено сообщений после редактируемого: {deleted_count}")
+    
+        # Обновляем текст сообщения пользователя
+        chat_message.user_message = payload.new_text
+        # Очищаем старый ответ AI
+        chat_message.ai_response = ""
+    
+        # Сохраняем изменения
+        await db.commit()
+        await db.refresh(chat_message)
+    except Exception:
+        await handle.release()
+        raise
+    
     # Собираем полный ответ для сохранения в БД
     full_response = ""
     message_id_to_update = chat_message.id  # Сохраняем UUID напрямую
     
     async def stream_generator():
         nonlocal full_response, message_id_to_update
+        failed = False
         try:
-            async for chunk in hf_client.ask_stream(prompt):
+            async for chunk in handle.guard(llm_router.stream(route, prompt)):
+                if chunk in LLMBackend.STREAM_ERROR_TEXTS:
+                    failed = True
                 full_response += chunk
                 # Отправляем Markdown напрямую без оборачивания в data:
                 yield chunk
@@ -549,6 +818,10 @@ async def edit_message(
             # Обновляем ответ AI в БД после завершения стриминга
             print(f"🔍 [EDIT] Стриминг завершен, full_response длина: {len(full_response)}")
             
+            if handle.superseded:
+                print(f"⏹️ [EDIT] Генерация вытеснена новым сообщением в чате, не сохраняем")
+                return
+            
             if full_response and full_response.strip():
                 try:
                     # Перезагружаем сообщение из БД, чтобы убедиться, что оно привязано к сессии
@@ -567,6 +840,8 @@ async def edit_message(
                         await db.refresh(msg_to_update)  # Обновляем объект из БД
                         print(f"✅ [EDIT] Ответ AI сохранен в БД: {len(full_response)} символов")
                         print(f"✅ [EDIT] Проверка: ai_response = '{msg_to_update.ai_response[:50]}...'")
+                        if claim is not None and not failed:
+                            claim.succeed()
                     else:
                         print(f"❌ [EDIT] Сообщение {message_id_to_update} не найдено для обновления")
                 except Exception as e:
@@ -584,16 +859,10 @@ async def edit_message(
             import traceback
             traceback.print_exc()
             yield f"Произошла ошибка при получении ответа.\n"
+        finally:
+            await handle.release()
     
-    return StreamingResponse(
-        stream_generator(),
-        media_type="text/markdown; charset=utf-8",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
-    )
+    return generation_stream(stream_generator(), handle, claim)
 
 @router.options("/messages/{message_id}")
 async def options_edit_message(message_id: str):
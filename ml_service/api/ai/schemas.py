@@ -57,6 +57,11 @@ class DeleteChatResponse(BaseModel):
     deleted_chat_id: str
 
 
+class DeleteAllChatsResponse(BaseModel):
+    message: str
+    deleted_chat_ids: list[str]
+
+
 # ======================
 # Модели для редактирования сообщений
 # ======================
@@ -1,17 +1,25 @@
-import httpx
+import asyncio
+import hashlib
+import time
+
 from config import settings
+from services.django_client import get_client
+
+
+# Single-flight для refresh: sha256(refresh) → задача запроса к Django
+_refresh_inflight: dict[bytes, asyncio.Task] = {}
+# Короткий кэш результатов refresh: sha256(refresh) → (ответ, истекает_в)
+_refresh_results: dict[bytes, tuple[dict, float]] = {}
 
 
 async def auth_login(username: str, password: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{settings.AUTH_SERVER_URL}/api/core/auth/login/",
-            json={
-                "username": username,
-                "password": password,
-            },
-            timeout=10,
-        )
+    response = await get_client().post(
+        "/api/core/auth/login/",
+        json={
+            "username": username,
+            "password": password,
+        },
+    )
 
     if response.status_code != 200:
         raise ValueError("Invalid credentials")
@@ -19,15 +27,45 @@ async def auth_login(username: str, password: str):
     return response.json()
 
 
-async def auth_refresh(refresh_token: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{settings.AUTH_SERVER_URL}/api/core/auth/refresh/",
-            json={"refresh": refresh_token},
-            timeout=10,
-        )
+async def _forward_refresh(key: bytes, refresh_token: str) -> dict:
+    response = await get_client().post(
+        "/api/core/auth/refresh/",
+        json={"refresh": refresh_token},
+    )
 
     if response.status_code != 200:
         raise ValueError("Invalid refresh token")
 
-    return response.json()
+    data = response.json()
+
+    now = time.monotonic()
+    for stale_key in [k for k, (_, exp) in _refresh_results.items() if exp <= now]:
+        del _refresh_results[stale_key]
+    _refresh_results[key] = (data, now + settings.AUTH_REFRESH_CACHE_TTL)
+
+    return data
+
+
+async def auth_refresh(refresh_token: str):
+    """
+    Обновление токенов с дедупликацией.
+
+    Django ротирует refresh-токен, поэтому из нескольких одновременных
+    запросов с одним токеном успешным был бы только первый. Здесь все они
+    ждут один запрос к Django, а ещё AUTH_REFRESH_CACHE_TTL секунд
+    после него получают тот же ответ.
+    """
+    key = hashlib.sha256(refresh_token.encode()).digest()
+
+    cached = _refresh_results.get(key)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    task = _refresh_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_forward_refresh(key, refresh_token))
+        _refresh_inflight[key] = task
+        task.add_done_callback(lambda _: _refresh_inflight.pop(key, None))
+
+    # shield: отмена одного клиента не должна отменять общий запрос
+    return await asyncio.shield(task)
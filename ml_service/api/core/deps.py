@@ -1,14 +1,24 @@
-from fastapi import Depends, HTTPException, Request
+import uuid
+
+from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.session import AsyncSessionLocal
 from db.models.user import User
-from datetime import datetime
+from api.core.token_cache import TokenCache
 
 from config import settings
 
+try:
+    # PyJWT проверяет HS256 заметно быстрее python-jose
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
+
 security = HTTPBearer()  # "Authorization: Bearer <token>"
+token_cache = TokenCache(settings.JWT_CACHE_SIZE)
 
 
 async def get_db():
@@ -16,26 +26,70 @@ async def get_db():
         yield session
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db),
-):
-    token = credentials.credentials
+def decode_access_token(access_token: str) -> dict:
+    """Проверить подпись и срок JWT, вернуть payload (ValueError при ошибке)"""
+    if pyjwt is not None:
+        try:
+            return pyjwt.decode(
+                access_token,
+                settings.JWT_SECRET_KEY,
+                algorithms=[settings.JWT_ALGORITHM],
+            )
+        except pyjwt.PyJWTError as e:
+            raise ValueError(f"Invalid token: {e}")
+
     try:
-        payload = jwt.decode(
-            token,
+        return jwt.decode(
+            access_token,
             settings.JWT_SECRET_KEY,
             algorithms=[settings.JWT_ALGORITHM],
         )
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Неверный токен")
-    except JWTError:
+    except JWTError as e:
+        raise ValueError(f"Invalid token: {e}")
+
+
+def get_user_id_from_token(access_token: str) -> uuid.UUID:
+    """Извлекает user_id из JWT токена (с кэшем проверенных токенов)"""
+    key = TokenCache.key(access_token)
+    user_id = token_cache.get(key)
+    if user_id is not None:
+        return user_id
+
+    payload = decode_access_token(access_token)
+
+    # В Django SimpleJWT используется 'user_id' в payload
+    raw_user_id = payload.get("user_id") or payload.get("sub")
+    if raw_user_id is None:
+        raise ValueError("Invalid token: User ID not found in token")
+    try:
+        user_id = uuid.UUID(str(raw_user_id))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid token: {e}")
+
+    # Токены без exp не кэшируем: непонятно, до какого момента они валидны
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        token_cache.set(key, user_id, float(exp))
+
+    return user_id
+
+
+async def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> uuid.UUID:
+    try:
+        return get_user_id_from_token(credentials.credentials)
+    except ValueError:
         raise HTTPException(status_code=401, detail="Неверный токен")
 
+
+async def get_current_user(
+    external_user_id: uuid.UUID = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db),
+):
     # ищем пользователя в БД
     result = await db.execute(
-        select(User).where(User.id == user_id)
+        select(User).where(User.external_user_id == external_user_id)
     )
     user = result.scalar_one_or_none()
     if not user:
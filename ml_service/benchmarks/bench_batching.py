@@ -0,0 +1,87 @@
+"""
+Бенчмарк микробатчинга инференса: пропускная способность и задержка
+при разном окне батча. Модель — пайплайн из обучения на синтетических данных.
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_batching.py --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+
+from services.batcher import MicroBatcher
+from services.ml_model import FEATURE_COLUMNS, TopicNeedModel, features_to_matrix
+from services.topic_features import TopicFeatures
+from training.train_topic_model import new_pipeline
+
+
+def make_model() -> TopicNeedModel:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, len(FEATURE_COLUMNS)))
+    y = (X[:, 0] + rng.normal(size=len(X)) < 0).astype(int)
+    return TopicNeedModel(new_pipeline().fit(X, y), FEATURE_COLUMNS, 0.5, "bench", "")
+
+
+def make_features(topics: int) -> list:
+    rng = np.random.default_rng()
+    features = []
+    for i in range(topics):
+        topic = TopicFeatures.from_parts("Предмет", f"Тема {i}")
+        for col in FEATURE_COLUMNS:
+            setattr(topic, col, float(rng.normal()))
+        features.append(topic)
+    return features
+
+
+async def run(model, window_ms: float, max_rows: int, requests: int, concurrency: int, topics: int) -> dict:
+    batcher = MicroBatcher(lambda m, X: m.predict_proba(X), max_rows=max_rows, window_ms=window_ms)
+    features = [make_features(topics) for _ in range(64)]
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            _, X = features_to_matrix(features[i % len(features)], model.feature_columns)
+            await batcher.submit(model, X)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    lat = np.array(latencies) * 1000
+    return {
+        "rps": requests / elapsed,
+        "p50": float(np.percentile(lat, 50)),
+        "p99": float(np.percentile(lat, 99)),
+        "avg_batch_rows": batcher.stats()["avg_batch_rows"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--topics", type=int, default=10, help="тем (строк) на запрос")
+    parser.add_argument("--max-rows", type=int, default=256)
+    parser.add_argument("--windows", default="0,1,3,5,10", help="окна батча в мс через запятую")
+    args = parser.parse_args()
+
+    model = make_model()
+    print(f"{'window ms':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'rows/batch':>10}")
+    for window in (float(w) for w in args.windows.split(",")):
+        r = asyncio.run(run(model, window, args.max_rows, args.requests, args.concurrency, args.topics))
+        print(f"{window:>9.1f} {r['rps']:>9.0f} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['avg_batch_rows']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк задержки event loop: «стримы» отдают чанк каждые 10 мс,
+параллельно идут тяжёлые сборки фич (студент с тысячами оценок).
+Сравнивается выполнение прямо в loop и через cpu_executor (потоки/процессы).
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_event_loop_lag.py --streams 50 --jobs 40 --grades 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from services.executor import CpuExecutor
+from services.features import build_topic_features
+from bench_features import make_grades, make_schedule
+
+
+TICK = 0.010
+
+
+async def stream(lags: list, stop: asyncio.Event) -> None:
+    """Имитация стрима: ждём чанк TICK секунд и меряем, насколько опоздали"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - expected)
+
+
+async def run(kind: str, args, schedule, grades) -> dict:
+    executor = CpuExecutor(kind, args.workers, max_pending=64)
+    lags: list[float] = []
+    stop = asyncio.Event()
+    streams = [asyncio.create_task(stream(lags, stop)) for _ in range(args.streams)]
+
+    # прогрев пула (spawn процессов) вне замера
+    await executor.run(build_topic_features, [], [])
+    await asyncio.sleep(0.1)
+    lags.clear()
+
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def job() -> None:
+        async with semaphore:
+            await executor.run(build_topic_features, schedule, grades)
+
+    await asyncio.gather(*(job() for _ in range(args.jobs)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await asyncio.gather(*streams)
+    executor.shutdown()
+
+    lag = np.array(lags) * 1000
+    return {
+        "jobs_per_sec": args.jobs / elapsed,
+        "p50": float(np.percentile(lag, 50)),
+        "p99": float(np.percentile(lag, 99)),
+        "max": float(lag.max()),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--grades", type=int, default=20000, help="оценок у студента")
+    parser.add_argument("--kinds", default="inline,thread,process")
+    args = parser.parse_args()
+
+    random.seed(0)
+    schedule, grades = make_schedule(500), make_grades(args.grades)
+
+    print(f"{'executor':<8} {'jobs/s':>7} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for kind in args.kinds.split(","):
+        r = asyncio.run(run(kind, args, schedule, grades))
+        print(f"{kind:<8} {r['jobs_per_sec']:>7.1f} {r['p50']:>11.2f} {r['p99']:>11.2f} {r['max']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
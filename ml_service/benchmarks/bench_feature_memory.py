@@ -0,0 +1,86 @@
+"""
+Память на фичи одного студента в кэше: словарь словарей (как было
+в collect_student_features) против списка TopicFeatures.
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_feature_memory.py --students 1000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from services import features_columnar
+from services.features import merge_topic_features
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_features import make_grades, make_schedule
+
+
+def merge_dicts(schedule_features: dict, grade_features: dict) -> dict:
+    """Прежнее объединение фич: dict "subject :: topic" → dict"""
+    result = {}
+    for key in set(schedule_features) | set(grade_features):
+        subject, topic = key
+        merged = {"subject": subject, "topic": topic}
+        merged.update(grade_features.get(key, {}))
+        merged.update(schedule_features.get(key, {}))
+        result[f"{subject} :: {topic}"] = merged
+    return result
+
+
+def payloads(students: int, grades: int, schedule: int) -> list:
+    # как после json.loads: у каждого студента свои копии строк
+    return [
+        json.loads(json.dumps((make_schedule(schedule), make_grades(grades))))
+        for _ in range(students)
+    ]
+
+
+def measure(name: str, build, data: list) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = [build(*features_pair) for features_pair in data]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    per_student = (after - before) / len(cache)
+    topics = sum(len(item) for item in cache) / len(cache)
+    print(f"{name:<16} {per_student / 1024:>8.1f} KiB/студент  ({topics:.0f} тем)")
+    return per_student
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--grades", type=int, default=400)
+    parser.add_argument("--schedule", type=int, default=120)
+    args = parser.parse_args()
+
+    random.seed(0)
+    data = [
+        (
+            features_columnar.extract_schedule_features(schedule),
+            features_columnar.extract_grade_features(grades),
+        )
+        for schedule, grades in payloads(args.students, args.grades, args.schedule)
+    ]
+
+    dicts = measure("dict of dicts", merge_dicts, data)
+    # первый проход наполняет vocabulary — он общий на процесс
+    merge_topic_features(*data[0])
+    slots = measure("TopicFeatures", merge_topic_features, data)
+    print(f"экономия: {(1 - slots / dicts) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Бенчмарк извлечения фич: обход словарей (services/features.py)
+против колоночной версии (services/features_columnar.py).
+Заодно проверяет, что результаты совпадают вплоть до типов (4 и 4.0).
+Прогоняет размеры из --sizes: по ним выбраны пороги
+FEATURES_COLUMNAR_MIN_GRADES и FEATURES_COLUMNAR_MIN_SCHEDULE.
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_features.py --students 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from services import features, features_columnar
+
+
+SUBJECTS = [f"Предмет {i}" for i in range(8)]
+TOPICS = [f"Тема {i}" for i in range(30)]
+
+
+def make_grades(n: int) -> list:
+    start = date.today() - timedelta(days=365)
+    blocks = []
+    for subject in SUBJECTS:
+        blocks.append({
+            "subject": {"title": subject},
+            "grades": [
+                {
+                    "topic": random.choice(TOPICS),
+                    "value": random.choice([2, 3, 4, 5, 4.0, 5.0, 4.5, None]),
+                    "weight": random.choice([1, 1, 2]),
+                    "work_date": (start + timedelta(days=random.randint(0, 365))).isoformat(),
+                }
+                for _ in range(n // len(SUBJECTS))
+            ],
+        })
+    return blocks
+
+
+def make_schedule(n: int) -> list:
+    return [
+        {
+            "topic": random.choice(TOPICS),
+            "subject": {"title": random.choice(SUBJECTS)},
+            "due_date": (date.today() + timedelta(days=random.randint(-30, 60))).isoformat(),
+            "starts_at": "10:40:00",
+            "ends_at": "12:10:00",
+            "is_test": random.random() < 0.2,
+        }
+        for _ in range(n)
+    ]
+
+
+def same(a, b) -> bool:
+    """Равенство с учётом типов и порядка ключей: 4 != 4.0"""
+    return repr(a) == repr(b)
+
+
+def bench(name: str, fn, repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+    print(f"{name:<40} {elapsed:>9.2f} ms")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=lambda v: [int(x) for x in v.split(",")],
+        default=[20, 50, 200, 500, 1000, 2000, 5000],
+        help="оценок у одного студента и занятий в расписании, через запятую",
+    )
+    parser.add_argument("--students", type=int, default=2000, help="студентов в пакетной задаче")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    batch = [make_grades(50) for _ in range(args.students)]
+    for size in args.sizes:
+        grades = make_grades(size)
+        schedule = make_schedule(size)
+        assert same(features.extract_grade_features(grades), features_columnar.extract_grade_features(grades))
+        assert same(features.extract_schedule_features(schedule), features_columnar.extract_schedule_features(schedule))
+
+        print(f"одного студента, {size} оценок:")
+        bench("  dict", lambda: features.extract_grade_features(grades), args.repeat)
+        bench("  columnar", lambda: features_columnar.extract_grade_features(grades), args.repeat)
+
+        print(f"расписание, {size} занятий:")
+        bench("  dict", lambda: features.extract_schedule_features(schedule), args.repeat)
+        bench("  columnar", lambda: features_columnar.extract_schedule_features(schedule), args.repeat)
+
+    assert same([features.extract_grade_features(g) for g in batch], features_columnar.extract_grade_features_many(batch))
+
+    print(f"пакет, {args.students} студентов по 50 оценок:")
+    bench("  dict", lambda: [features.extract_grade_features(g) for g in batch], 1)
+    bench("  columnar (по одному)", lambda: [features_columnar.extract_grade_features(g) for g in batch], 1)
+    bench("  columnar (одним проходом)", lambda: features_columnar.extract_grade_features_many(batch), 1)
+
+if __name__ == "__main__":
+    main()
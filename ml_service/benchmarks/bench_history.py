@@ -0,0 +1,107 @@
+"""
+Бенчмарк /history: ORM + Pydantic против json_agg в Postgres.
+
+Создаёт во временном чате N сообщений (по умолчанию 5000), замеряет оба
+пути и удаляет чат. Запуск из ml_service/:
+
+    python benchmarks/bench_history.py --messages 5000 --runs 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import delete, insert
+
+from db.session import AsyncSessionLocal
+from db.models.chat import Chat
+from db.models.chat_message import ChatMessage
+from api.ai.router import fetch_history_items, fetch_history_json
+from api.ai.schemas import ChatHistoryResponse
+
+
+async def seed(messages: int) -> tuple[uuid.UUID, uuid.UUID]:
+    user_id = uuid.uuid4()
+    chat_id = uuid.uuid4()
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            insert(Chat).values(id=chat_id, external_user_id=user_id, title="bench")
+        )
+        await db.execute(
+            insert(ChatMessage),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "chat_id": chat_id,
+                    "external_user_id": user_id,
+                    "user_message": f"Вопрос #{i}: как подготовиться к контрольной?",
+                    "ai_response": f"Ответ #{i}: повтори темы с низкими оценками " * 4,
+                    "created_at": start + timedelta(seconds=i),
+                }
+                for i in range(messages)
+            ],
+        )
+        await db.commit()
+
+    return chat_id, user_id
+
+
+async def cleanup(chat_id: uuid.UUID) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Chat).where(Chat.id == chat_id))
+        await db.commit()
+
+
+async def measure(runs: int, fn) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await fn(db)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(messages: int, runs: int) -> None:
+    chat_id, user_id = await seed(messages)
+
+    async def orm_path(db):
+        items = await fetch_history_items(db, chat_id, user_id, messages)
+        # то, что FastAPI делает с response_model: валидация + сериализация
+        body = ChatHistoryResponse(messages=items)
+        return ChatHistoryResponse.model_validate(body.model_dump()).model_dump_json()
+
+    async def sql_json_path(db):
+        _, body = await fetch_history_json(db, chat_id, user_id, messages)
+        return body.encode()
+
+    try:
+        # прогрев соединений пула
+        await measure(2, sql_json_path)
+
+        for name, fn in (("orm+pydantic", orm_path), ("postgres json_agg", sql_json_path)):
+            timings = await measure(runs, fn)
+            print(
+                f"{name:>18}: median {statistics.median(timings):8.2f} ms, "
+                f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.2f} ms "
+                f"({messages} сообщений, {runs} прогонов)"
+            )
+    finally:
+        await cleanup(chat_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.runs))
@@ -0,0 +1,74 @@
+"""
+Бенчмарк проверки access-токена: python-jose, PyJWT и кэш проверенных токенов.
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_jwt.py --iterations 20000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from jose import jwt as jose_jwt
+
+from config import settings
+from api.core import deps
+
+
+def make_token() -> str:
+    return jose_jwt.encode(
+        {
+            "token_type": "access",
+            "user_id": str(uuid.uuid4()),
+            "exp": int(time.time()) + 15 * 60,
+        },
+        settings.JWT_SECRET_KEY,
+        algorithm=settings.JWT_ALGORITHM,
+    )
+
+
+def bench(name: str, fn, iterations: int) -> None:
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - started) / iterations * 1e6
+    print(f"{name:>22}: {per_call:8.2f} µs / запрос")
+
+
+def main(iterations: int) -> None:
+    token = make_token()
+
+    bench(
+        "python-jose decode",
+        lambda: jose_jwt.decode(
+            token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
+        ),
+        iterations,
+    )
+
+    if deps.pyjwt is not None:
+        bench(
+            "PyJWT decode",
+            lambda: deps.pyjwt.decode(
+                token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
+            ),
+            iterations,
+        )
+    else:
+        print("PyJWT не установлен, пропускаем")
+
+    bench("кэш (sha256 + LRU)", lambda: deps.get_user_id_from_token(token), iterations)
+    print(f"token cache: {deps.token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.iterations)
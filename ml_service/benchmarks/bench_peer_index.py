@@ -0,0 +1,114 @@
+"""
+Бенчмарк индекса «студенты как ты»: построение PCA + IVF на синтетических
+профилях (оценки по темам порождены несколькими скрытыми факторами, как
+у реальных студентов), загрузка через mmap, время k-NN подсказки на запрос
+и recall соседей относительно точного BallTree.
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_peer_index.py --students 50000 --topics 64
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.neighbors import BallTree
+
+from services.peer_index import PeerIndex
+from services.topic_features import TopicFeatures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--topics", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--components", type=int, default=8)
+    parser.add_argument("--lists", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    topics = [f"Предмет {i % 8} :: Тема {i}" for i in range(args.topics)]
+    factors = rng.normal(size=(args.students, 4))
+    loadings = rng.normal(scale=0.5, size=(4, args.topics))
+    before = 3.8 + factors @ loadings + rng.normal(scale=0.2, size=(args.students, args.topics))
+    before[rng.random(before.shape) < 0.6] = np.nan
+    gains = rng.normal(0.2, 0.6, size=before.shape).astype(np.float32)
+
+    fill = np.nanmean(before, axis=0)
+    scale = np.nanstd(before, axis=0)
+    Z = (np.where(np.isnan(before), fill, before) - fill) / scale
+
+    started = time.perf_counter()
+    pca = PCA(n_components=args.components, random_state=42).fit(Z)
+    Y = pca.transform(Z)
+    coarse = MiniBatchKMeans(n_clusters=args.lists, n_init=3, batch_size=4096, random_state=42).fit(Y)
+    order = np.argsort(coarse.labels_, kind="stable")
+    offsets = np.r_[0, np.cumsum(np.bincount(coarse.labels_, minlength=args.lists))]
+    print(
+        f"PCA {args.topics} → {args.components} (дисперсия {pca.explained_variance_ratio_.sum():.2f}) "
+        f"+ IVF {args.lists} списков по {args.students} студентам за {time.perf_counter() - started:.2f} с"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.joblib")
+        joblib.dump({
+            "topics": topics, "fill": fill, "scale": scale,
+            "components": pca.components_, "center": pca.mean_,
+            "centroids": coarse.cluster_centers_.astype(np.float32), "offsets": offsets,
+            "points": Y[order].astype(np.float32), "gains": gains[order], "nprobe": args.nprobe,
+            "min_topics": 3, "improved_gain": 0.5, "version": "bench",
+        }, path)
+        print(f"артефакт: {os.path.getsize(path) / 2**20:.1f} MiB")
+
+        started = time.perf_counter()
+        index = PeerIndex.load(path)
+        print(f"загрузка (mmap): {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        students = []
+        for _ in range(64):
+            features = []
+            for column in rng.choice(args.topics, size=20, replace=False):
+                subject, topic = topics[column].split(" :: ")
+                f = TopicFeatures.from_parts(subject, topic)
+                f.avg_score = round(float(np.clip(rng.normal(3.8, 0.7), 2, 5)), 3)
+                features.append(f)
+            students.append(features)
+
+        latencies = []
+        for i in range(args.queries):
+            started = time.perf_counter()
+            index.hint(students[i % len(students)], args.k)
+            latencies.append(time.perf_counter() - started)
+
+        lat = np.array(latencies) * 1e6
+        print(f"hint k={args.k}: p50 {np.percentile(lat, 50):.0f} мкс, p99 {np.percentile(lat, 99):.0f} мкс")
+        print("пример:", index.hint(students[0], args.k))
+
+        # recall: сравниваем с точным поиском по тем же сжатым векторам
+        tree = BallTree(index.points)
+        recall = []
+        for features in students:
+            vector = index.profile(features)
+            if vector is None:
+                continue
+            approx = set(index.neighbours(vector, args.k).tolist())
+            z = (np.where(np.isnan(vector), index.fill, vector) - index.fill) / index.scale
+            _, exact = tree.query(((z - index.center) @ index.components.T).reshape(1, -1), k=args.k)
+            recall.append(len(approx & set(exact[0].tolist())) / args.k)
+        print(f"recall@{args.k} против BallTree: {np.mean(recall):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Бенчмарк раскладки промпта для кэша префикса на стороне модели.
+
+Имитируется многоходовой чат одного студента. Старая раскладка — одна
+user-строка «данные студента (ранжированные по вопросу) + переписка +
+вопрос», новая — список сообщений из services/prompt.py.
+
+Без сервера считается общий префикс с промптом прошлого хода — его сервер
+может взять из KV-кэша. С --url ходы отправляются на
+OpenAI-совместимый сервер (llama.cpp, vLLM) и меряется время до первого
+токена и число токенов промпта из кэша (usage / timings).
+
+Запуск из ml_service/:
+
+    python benchmarks/bench_prompt_cache.py --turns 8
+    python benchmarks/bench_prompt_cache.py --turns 8 --url http://localhost:8080/v1/chat/completions --model local
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.features import build_topic_features
+from services.hf_gpt import OpenAICompatibleClient
+from services.llm_backends import FakeLLMClient
+from services.ml_model import predict_topic_needs
+from services.prompt import SYSTEM_PROMPT, build_messages, stable_topics, student_blocks
+from services.student_context import build_student_context
+from services.topic_relevance import TopicIndex
+from bench_features import SUBJECTS, TOPICS, make_grades, make_schedule
+
+
+K = 8
+URGENT_DAYS = 3
+
+
+def questions(n: int) -> list[str]:
+    templates = [
+        "Как подготовиться по теме «{topic}» по предмету «{subject}»?",
+        "Что повторить к контрольной по {subject}?",
+        "Объясни, почему у меня плохо получается {topic}",
+        "С чего начать, если я отстал по {subject}?",
+    ]
+    return [
+        random.choice(templates).format(subject=random.choice(SUBJECTS), topic=random.choice(TOPICS))
+        for _ in range(n)
+    ]
+
+
+def legacy_prompt(features, ml_results, index, question, history) -> list:
+    """Раскладка до services/prompt.py: всё в одной user-строке"""
+    stable = stable_topics(features, ml_results, K, URGENT_DAYS)
+    related = {id(f) for f in stable + index.relevant(question, K)}
+    context = build_student_context([f for f in features if id(f) in related], ml_results)
+    parts = [f"Информация о студенте:\n{context}"]
+    if history:
+        lines = []
+        for user_message, ai_response in history:
+            lines.append(f"Пользователь: {user_message}")
+            lines.append(f"Ассистент: {ai_response}")
+        parts.append("Предыдущая переписка:\n" + "\n".join(lines))
+    parts.append(f'Вопрос студента:\n"{question}"')
+    parts.append("Напиши один совет (30-50 слов) для этого студента на русском языке.")
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT.split("\n")[0]},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+def new_prompt(features, ml_results, index, question, history) -> list:
+    student_context, related_context = student_blocks(
+        features, ml_results, index, question, None, K, URGENT_DAYS
+    )
+    return build_messages(student_context, question, related_context, history)
+
+
+def serialize(messages: list) -> str:
+    """Примерно как шаблон чата: по этому тексту сервер ищет общий префикс"""
+    return "".join(f"<|{m['role']}|>\n{m['content']}\n" for m in messages)
+
+
+def common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def chat(layout, features, ml_results, index, qs) -> list[list]:
+    answers = FakeLLMClient()
+    history, prompts = [], []
+    for question in qs:
+        messages = layout(features, ml_results, index, question, list(history))
+        prompts.append(messages)
+        history.append((question, answers.answer(messages)))
+    return prompts
+
+
+async def measure(client: OpenAICompatibleClient, prompts: list[list]) -> tuple[list, list]:
+    ttfts, cached = [], []
+    for messages in prompts:
+        started = time.perf_counter()
+        first = None
+        async for chunk in client.ask_stream(messages):
+            if first is None and chunk:
+                first = time.perf_counter() - started
+        ttfts.append(first or 0.0)
+        cached.append(client.prompt_cache.cached_tokens)
+    # накопленные счётчики → по ходам
+    cached = [c - p for c, p in zip(cached, [0] + cached[:-1])]
+    return ttfts, cached
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=8, help="ходов в чате")
+    parser.add_argument("--grades", type=int, default=3000)
+    parser.add_argument("--schedule", type=int, default=300)
+    parser.add_argument("--url", default="", help="OpenAI-совместимый /v1/chat/completions")
+    parser.add_argument("--model", default="local")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    features = build_topic_features(make_schedule(args.schedule), make_grades(args.grades))
+    ml_results = predict_topic_needs(features)
+    index = TopicIndex(features)
+    qs = questions(args.turns)
+    print(f"тем у студента: {len(features)}, ходов: {args.turns}")
+
+    layouts = {"old": legacy_prompt, "new": new_prompt}
+    prompts = {name: chat(layout, features, ml_results, index, qs) for name, layout in layouts.items()}
+
+    for name, turns in prompts.items():
+        texts = [serialize(m) for m in turns]
+        shared = [common_prefix(prev, cur) for prev, cur in zip(texts, texts[1:])]
+        # доля прошлого промпта, которая осталась префиксом, и доля нового, взятая из кэша
+        kept = statistics.mean(n / len(prev) for n, prev in zip(shared, texts))
+        reused = statistics.mean(n / len(cur) for n, cur in zip(shared, texts[1:]))
+        print(
+            f"{name}: средняя длина промпта {statistics.mean(map(len, texts)):.0f} символов, "
+            f"прошлый промпт в префиксе {kept:.0%}, новый промпт из кэша {reused:.0%}"
+        )
+
+    if not args.url:
+        return
+
+    for name, turns in prompts.items():
+        client = OpenAICompatibleClient(args.model, args.url)
+        ttfts, cached = asyncio.run(measure(client, turns))
+        print(
+            f"{name}: TTFT p50 {statistics.median(ttfts[1:]) * 1000:.0f} мс "
+            f"(первый ход {ttfts[0] * 1000:.0f} мс), токенов из кэша по ходам: {cached}"
+        )
+
+
+if __name__ == "__main__":
+    main()
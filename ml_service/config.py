@@ -15,6 +15,17 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_PORT: int = 5432
 
+    # Пул соединений (на каждый воркер uvicorn)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Открыть DB_POOL_SIZE соединений при старте, а не на первых запросах
+    DB_POOL_WARMUP: bool = True
+    # Работа через PgBouncer в transaction mode: без prepared statements
+    DB_PGBOUNCER: bool = False
+
     @property
     def DATABASE_URL(self) -> str:
         return (
@@ -22,6 +33,26 @@ class Settings(BaseSettings):
             f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
         )
 
+    # База Django — только для офлайн-обучения (training/)
+    DJANGO_DB_HOST: str = "db_django"
+    DJANGO_DB_NAME: str = "urfu_db"
+    DJANGO_DB_USER: str = "urfu_user"
+    DJANGO_DB_PASSWORD: str = "urfu_password"
+    DJANGO_DB_PORT: int = 5432
+
+    @property
+    def DJANGO_DATABASE_DSN(self) -> str:
+        return (
+            f"host={self.DJANGO_DB_HOST} port={self.DJANGO_DB_PORT} "
+            f"dbname={self.DJANGO_DB_NAME} user={self.DJANGO_DB_USER} "
+            f"password={self.DJANGO_DB_PASSWORD}"
+        )
+
+    # Студент, на котором training/precompute_upcoming.py сверяет свои фичи
+    # (из SQL по базе Django) с фичами из Core API
+    PRECOMPUTE_CHECK_USERNAME: str = ""
+    PRECOMPUTE_CHECK_PASSWORD: str = ""
+
     # =========================
     # АВТОРИЗАЦИЯ
     # =========================
@@ -29,6 +60,12 @@ class Settings(BaseSettings):
     JWT_PUBLIC_KEY: str = "PUBLIC_KEY_FROM_AUTH"
     JWT_SECRET_KEY: str = "django-insecure-rh!+beoqrde_haod&xhod)jbjxx7jh$o2m!lhg(1h1kbxi!(my"
     JWT_ALGORITHM: str = "HS256"
+    # Сколько проверенных access-токенов держать в памяти воркера
+    JWT_CACHE_SIZE: int = 10000
+    # Пул соединений к Django: прокси авторизации и Core API (фичи студента)
+    AUTH_HTTP_MAX_CONNECTIONS: int = 20
+    # Сколько секунд отдавать один и тот же результат refresh повторным запросам
+    AUTH_REFRESH_CACHE_TTL: float = 10.0
 
     # =========================
     # CORS — ДЛЯ РАЗРАБОТКИ БЕЗ БОЛИ
@@ -43,11 +80,118 @@ class Settings(BaseSettings):
         "http://155.212.144.126:3000",
     ]
 
+    # =========================
+    # ЧАТЫ
+    # =========================
+    # /history собирается в JSON прямо в Postgres (json_agg), без ORM и Pydantic
+    HISTORY_SQL_JSON: bool = True
+
+    # =========================
+    # ЛИМИТЫ НА ГЕНЕРАЦИЮ
+    # =========================
+    # memory — счётчики в воркере, postgres — общие для всех воркеров
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_MESSAGES_PER_MINUTE: float = 6.0
+    RATE_LIMIT_BURST: int = 5
+    RATE_LIMIT_MAX_ACTIVE_STREAMS: int = 2
+    # Через сколько секунд незакрытый стрим считается мёртвым
+    RATE_LIMIT_STREAM_TTL: float = 300.0
+    RATE_LIMIT_STREAM_RETRY_AFTER: float = 5.0
+    # Как часто стрим сверяется с active_streams (postgres): вытеснение
+    # новым сообщением, отправленным в другой воркер
+    RATE_LIMIT_SUPERSEDE_POLL: float = 1.0
+
+    # Idempotency-Key: сколько хранить ответ, как часто чистить, сколько ждать
+    # генерацию, идущую в другом воркере
+    IDEMPOTENCY_TTL: int = 86400
+    IDEMPOTENCY_CLEANUP_INTERVAL: int = 3600
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 300.0
+    # Аренда ключа на время генерации: воркер продлевает её, пока генерирует;
+    # если воркер упал, через столько секунд ключ можно захватить заново
+    IDEMPOTENCY_LEASE: float = 30.0
+
     # =========================
     # ML
     # =========================
     MODEL_PATH: str = "models/"
+    # Токен для /api/admin/* (пустой — админские эндпоинты выключены)
+    ADMIN_TOKEN: str = ""
+    # Как часто воркер сверяет активные версии моделей с model_versions
+    MODEL_REGISTRY_POLL_INTERVAL: float = 30.0
+    # Где считать CPU-этапы (фичи, контекст, модель): thread | process | inline,
+    # размер пула и сколько задач может ждать одновременно
+    CPU_EXECUTOR: str = "thread"
+    CPU_EXECUTOR_WORKERS: int = 4
+    CPU_EXECUTOR_MAX_PENDING: int = 64
+    # Сколько соседей брать из индекса «студенты как ты»
+    PEER_INDEX_K: int = 10
+    # С какого числа оценок / занятий считать фичи колоночно
+    # (services/features_columnar.py) вместо обхода словарей: на меньших
+    # ответах накладные расходы NumPy дороже (benchmarks/bench_features.py).
+    # 0 — колоночный расчёт выключен
+    FEATURES_COLUMNAR_MIN_GRADES: int = 5000
+    FEATURES_COLUMNAR_MIN_SCHEDULE: int = 500
+    # Процессный кэш фич студента: сколько пользователей и сколько секунд
+    FEATURE_CACHE_SIZE: int = 5000
+    FEATURE_CACHE_TTL: float = 120.0
+    # Предзагружать фичи в кэш при открытии чата (/chats, /history)
+    FEATURE_PREFETCH: bool = True
+    # Брать фичи и контекст, посчитанные заранее (training/precompute_upcoming.py),
+    # вместо похода в Core API при промахе кэша
+    STUDENT_PRECOMPUTED_ENABLED: bool = True
+    # Сколько секунд после расчёта запись годится: оценки и расписание,
+    # изменённые позже, воркер увидит только после этого
+    STUDENT_PRECOMPUTED_MAX_AGE: float = 7200.0
+    # Микробатчинг инференса: сколько ждать соседние запросы и предельный размер
+    # батча в строках (0 мс — без батчинга, каждый запрос отдельно в потоке)
+    INFERENCE_BATCH_WINDOW_MS: float = 3.0
+    INFERENCE_BATCH_MAX_ROWS: int = 256
+    # Промпт (services/prompt.py): сколько тем «повторить» в постоянном блоке
+    # данных студента и сколько близких к вопросу тем в последнем сообщении
+    # (0 — все темы в постоянном блоке); темы с контрольной или экзаменом
+    # в ближайшие PROMPT_URGENT_DAYS дней идут в постоянный блок всегда
+    PROMPT_TOPICS_K: int = 8
+    PROMPT_URGENT_DAYS: int = 3
+    # Сколько прошлых ходов чата класть в промпт (старые отбрасываются блоками
+    # по половине окна, чтобы префикс промпта не сдвигался каждый ход)
+    PROMPT_HISTORY_TURNS: int = 20
+    # Готовые советы по состоянию темы (services/advice.py): отвечать ими на
+    # общие вопросы без LLM и как часто перечитывать таблицу advice_templates
+    ADVICE_TEMPLATES_ENABLED: bool = True
+    ADVICE_REFRESH_INTERVAL: float = 300.0
+    # С какой близости (TopicIndex) слово вопроса считается названием темы студента
+    ADVICE_MENTION_MIN_SCORE: float = 0.2
     HF_API_KEY: str = ""
+    # Бэкенд LLM (services/llm_backends.py): hf | openai | fake; у быстрой модели
+    # может быть свой (пусто — как у сильной), например локальный llama.cpp
+    LLM_BACKEND: str = "hf"
+    LLM_FAST_BACKEND: str = ""
+    # OpenAI-совместимый сервер для бэкенда openai
+    LLM_OPENAI_API_URL: str = "http://localhost:8080/v1/chat/completions"
+    LLM_OPENAI_API_KEY: str = ""
+    # Пауза перед каждым чанком у бэкенда fake (имитация модели в бенчмарках)
+    LLM_FAKE_DELAY_MS: float = 0.0
+    # Просить usage в конце стрима (stream_options.include_usage): по нему
+    # считается доля промпта из кэша префикса; выключить для серверов без поддержки
+    LLM_STREAM_USAGE: bool = True
+    # Маршрутизация LLM (services/llm_router.py): сильная модель для сложных
+    # вопросов, быстрая (пусто — не используется) для коротких советов
+    LLM_STRONG_MODEL: str = "zai-org/GLM-4.7"
+    LLM_FAST_MODEL: str = ""
+    # Пороги быстрой модели: длина промпта, сообщений в истории, слов в вопросе
+    LLM_FAST_MAX_PROMPT_CHARS: int = 1500
+    LLM_FAST_MAX_HISTORY: int = 2
+    LLM_FAST_MAX_QUESTION_WORDS: int = 30
+    # Хеджирование сильной модели (services/llm_hedging.py): куда дублировать
+    # запрос без первого токена (модель, например другой провайдер «model:provider»,
+    # и/или URL; оба пусто — выключено), начальная и минимальная задержка хеджа,
+    # перцентиль времени до первого токена и доля запросов, которую можно дублировать
+    LLM_HEDGE_MODEL: str = ""
+    LLM_HEDGE_API_URL: str = ""
+    LLM_HEDGE_DELAY: float = 3.0
+    LLM_HEDGE_MIN_DELAY: float = 0.5
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    LLM_HEDGE_BUDGET: float = 0.1
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import String, Text, DateTime, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from db.base import Base
+
+
+class AdviceTemplate(Base):
+    """Заранее сгенерированный совет по (предмет, тема, состояние темы)"""
+
+    __tablename__ = "advice_templates"
+    __table_args__ = (
+        UniqueConstraint("subject", "topic", "bucket", name="uq_advice_templates_subject_topic_bucket"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4,
+    )
+
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    topic: Mapped[str] = mapped_column(String(255), nullable=False)
+
+    # exam_soon | recent_fails | low_avg | on_track (services/advice.py)
+    bucket: Mapped[str] = mapped_column(String(32), nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+
+    # модель, которой сгенерирован совет
+    model: Mapped[str | None] = mapped_column(String(128), nullable=True)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
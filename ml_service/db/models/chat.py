@@ -31,9 +31,12 @@ class Chat(Base):
         index=True,
     )
 
-    # Связь с сообщениями
+    # Связь с сообщениями.
+    # passive_deletes: сообщения удаляет сам Postgres (ON DELETE CASCADE),
+    # ORM не подгружает их в память при удалении чата
     messages: Mapped[list["ChatMessage"]] = relationship(
         "ChatMessage",
         back_populates="chat",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import String, Text, DateTime, PrimaryKeyConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from db.base import Base
+
+
+class IdempotencyKey(Base):
+    """Idempotency-Key запроса на генерацию и сохранённый ответ"""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "key"),
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True))
+    key: Mapped[str] = mapped_column(String(255))
+
+    # sha256 от пути и тела запроса: тот же ключ с другим телом — ошибка
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    # in_progress | completed
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    response_text: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        index=True,
+    )
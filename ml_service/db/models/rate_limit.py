@@ -0,0 +1,46 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import Float, DateTime, PrimaryKeyConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from db.base import Base
+
+
+class RateLimitBucket(Base):
+    """Token bucket пользователя (RATE_LIMIT_BACKEND=postgres)"""
+
+    __tablename__ = "rate_limit_buckets"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+    )
+
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+
+class ActiveStream(Base):
+    """Идущая генерация: не больше одной на чат (RATE_LIMIT_BACKEND=postgres)"""
+
+    __tablename__ = "active_streams"
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "chat_id"),
+    )
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True))
+    chat_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True))
+
+    stream_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+
+    started_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
@@ -0,0 +1,39 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import String, Text, DateTime
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from db.base import Base
+
+
+class StudentPrecomputed(Base):
+    """
+    Фичи, результаты модели и блок данных студента, посчитанные заранее
+    (training/precompute_upcoming.py) для студентов с близкими контрольными
+    """
+
+    __tablename__ = "student_precomputed"
+
+    # Django Student.id (он же user_id в токене)
+    external_user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+    )
+
+    # Список TopicFeatures.to_dict()
+    features: Mapped[list] = mapped_column(JSONB, nullable=False)
+    # Ответ predict_topic_needs: ключ темы → need_review / score / cluster
+    ml_results: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    # Постоянный блок данных студента для промпта (services/prompt.py)
+    student_context: Mapped[str] = mapped_column(Text, nullable=False)
+
+    # Версии моделей на момент расчёта (services/ml_model.py: models_version)
+    model_version: Mapped[str] = mapped_column(String(255), nullable=False)
+
+    computed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
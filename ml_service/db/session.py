@@ -1,13 +1,86 @@
+import asyncio
+import uuid
+
+from loguru import logger
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from config import settings
 
+
+def _connect_args() -> dict:
+    if not settings.DB_PGBOUNCER:
+        return {}
+
+    # PgBouncer в transaction mode отдаёт каждую транзакцию случайному
+    # серверному соединению, поэтому кэш prepared statements asyncpg
+    # и SQLAlchemy отключаем, а имена делаем уникальными
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+
 engine = create_async_engine(
     settings.DATABASE_URL,
     echo=False,
     future=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
 )
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
     expire_on_commit=False,
 )
+
+
+async def warmup_pool() -> None:
+    """Открыть минимальное число соединений пула при старте воркера"""
+    if not settings.DB_POOL_WARMUP or settings.DB_POOL_SIZE <= 0:
+        return
+
+    async def _open():
+        conn = await engine.connect()
+        try:
+            await conn.execute(text("SELECT 1"))
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    results = await asyncio.gather(
+        *(_open() for _ in range(settings.DB_POOL_SIZE)),
+        return_exceptions=True,
+    )
+    # открытые соединения возвращаем в пул, даже если часть не открылась
+    conns = [r for r in results if not isinstance(r, BaseException)]
+    for conn in conns:
+        await conn.close()
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        logger.warning(f"DB pool warm-up failed ({len(errors)} of {len(results)}): {errors[0]}")
+        return
+    logger.info(f"DB pool warmed up: {len(conns)} connections")
+
+
+def pool_stats() -> dict:
+    """Загруженность пула соединений текущего воркера"""
+    pool = engine.pool
+    checked_out = pool.checkedout()
+    capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": pool.overflow(),
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3) if capacity else None,
+        "pgbouncer": settings.DB_PGBOUNCER,
+    }
@@ -1,6 +1,9 @@
 """
 FastAPI сервис для ML функционала
 """
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
@@ -14,11 +17,37 @@ logger.add("logs/ml_service.log", rotation="10 MB", retention="7 days", level="I
 
 from config import settings
 from api import router
+from db.session import engine, warmup_pool, pool_stats
+from services.django_client import close_client as close_django_client
+from services.idempotency import idempotency
+from services.ml_model import model_registries
+from services.executor import cpu_executor
+from services.advice import advice_templates
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warmup_pool()
+    for registry in model_registries:
+        await registry.refresh()
+    background = [
+        asyncio.create_task(idempotency.cleanup_loop()),
+        asyncio.create_task(advice_templates.refresh_loop()),
+        *(asyncio.create_task(registry.watch()) for registry in model_registries),
+    ]
+    yield
+    for task in background:
+        task.cancel()
+    cpu_executor.shutdown()
+    await close_django_client()
+    await engine.dispose()
+
 
 app = FastAPI(
     title="URFU ML Service",
     description="ML сервис для анализа данных студентов",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 logger.info(f"CORS ORIGINS: {settings.CORS_ORIGINS}")
@@ -42,5 +71,6 @@ async def health():
     return {
         "status": "healthy",
         "service": "ml_service",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "db_pool": pool_stats(),
     }
@@ -0,0 +1,335 @@
+"""
+Допуск запросов к генерации: token bucket на сообщения в минуту
+и лимит одновременных стримов на пользователя.
+
+Новый запрос в тот же чат вытесняет старую генерацию. Состояние по умолчанию
+живёт в памяти воркера (RATE_LIMIT_BACKEND=memory); для нескольких воркеров
+счётчики можно вынести в Postgres (RATE_LIMIT_BACKEND=postgres). Тогда
+вытеснение видно и из других воркеров: идущий стрим раз в
+RATE_LIMIT_SUPERSEDE_POLL секунд сверяет свой stream_id с active_streams.
+"""
+import asyncio
+import math
+import time
+import uuid
+from contextlib import suppress
+from typing import AsyncGenerator, AsyncIterator
+
+from loguru import logger
+from sqlalchemy import text
+
+from config import settings
+from db.session import AsyncSessionLocal
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+# ======================
+# Бэкенды счётчиков
+# ======================
+class MemoryAdmissionBackend:
+    """Token bucket и активные стримы в памяти текущего воркера"""
+
+    MAX_BUCKETS = 10000
+    # состояние видно только этому воркеру — вытеснение целиком локальное
+    shared = False
+
+    def __init__(self, capacity: float, rate_per_sec: float, max_streams: int, stream_ttl: float):
+        self.capacity = capacity
+        self.rate = rate_per_sec
+        self.max_streams = max_streams
+        self.stream_ttl = stream_ttl
+        # user_id → (токены, время последнего пополнения)
+        self._buckets: dict[uuid.UUID, tuple[float, float]] = {}
+        # user_id → {chat_id: (stream_id, started_at)}
+        self._streams: dict[uuid.UUID, dict[uuid.UUID, tuple[uuid.UUID, float]]] = {}
+
+    async def take_token(self, user_id: uuid.UUID) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(user_id, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+
+        if tokens < 1:
+            self._buckets[user_id] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+        self._buckets[user_id] = (tokens - 1, now)
+        if len(self._buckets) > self.MAX_BUCKETS:
+            self._prune_buckets(now)
+        return 0.0
+
+    def _prune_buckets(self, now: float) -> None:
+        # полностью восстановившиеся корзины ничем не отличаются от отсутствующих
+        refill_time = self.capacity / self.rate
+        for user_id in [u for u, (_, upd) in self._buckets.items() if now - upd >= refill_time]:
+            del self._buckets[user_id]
+
+    async def open_stream(self, user_id: uuid.UUID, chat_id: uuid.UUID, stream_id: uuid.UUID) -> bool:
+        now = time.monotonic()
+        streams = self._streams.setdefault(user_id, {})
+        for stale_chat in [c for c, (_, started) in streams.items() if now - started > self.stream_ttl]:
+            del streams[stale_chat]
+
+        # стрим в том же чате будет вытеснен и в лимите не учитывается
+        others = sum(1 for c in streams if c != chat_id)
+        if others >= self.max_streams:
+            return False
+
+        streams[chat_id] = (stream_id, now)
+        return True
+
+    async def close_stream(self, user_id: uuid.UUID, chat_id: uuid.UUID, stream_id: uuid.UUID) -> None:
+        streams = self._streams.get(user_id)
+        if not streams:
+            return
+        current = streams.get(chat_id)
+        if current is not None and current[0] == stream_id:
+            del streams[chat_id]
+        if not streams:
+            self._streams.pop(user_id, None)
+
+
+class PostgresAdmissionBackend:
+    """Те же счётчики в таблицах ML-базы — общие для всех воркеров"""
+
+    shared = True
+
+    TAKE_TOKEN_SQL = text("""
+        INSERT INTO rate_limit_buckets AS b (user_id, tokens, updated_at)
+        VALUES (:user_id, CAST(:capacity AS float8) - 1, now())
+        ON CONFLICT (user_id) DO UPDATE SET
+            tokens = LEAST(
+                CAST(:capacity AS float8),
+                b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * CAST(:rate AS float8)
+            ) - 1,
+            updated_at = now()
+        WHERE LEAST(
+            CAST(:capacity AS float8),
+            b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * CAST(:rate AS float8)
+        ) >= 1
+        RETURNING tokens
+    """)
+
+    RETRY_AFTER_SQL = text("""
+        SELECT (1 - LEAST(
+            CAST(:capacity AS float8),
+            tokens + EXTRACT(EPOCH FROM now() - updated_at) * CAST(:rate AS float8)
+        )) / CAST(:rate AS float8)
+        FROM rate_limit_buckets
+        WHERE user_id = :user_id
+    """)
+
+    OPEN_STREAM_SQL = text("""
+        INSERT INTO active_streams (user_id, chat_id, stream_id, started_at)
+        SELECT :user_id, :chat_id, :stream_id, now()
+        WHERE (
+            SELECT count(*) FROM active_streams
+            WHERE user_id = :user_id
+              AND chat_id <> :chat_id
+              AND started_at > now() - make_interval(secs => CAST(:ttl AS float8))
+        ) < CAST(:max_streams AS integer)
+        ON CONFLICT (user_id, chat_id) DO UPDATE SET
+            stream_id = EXCLUDED.stream_id,
+            started_at = EXCLUDED.started_at
+        RETURNING stream_id
+    """)
+
+    def __init__(self, capacity: float, rate_per_sec: float, max_streams: int, stream_ttl: float):
+        self.capacity = capacity
+        self.rate = rate_per_sec
+        self.max_streams = max_streams
+        self.stream_ttl = stream_ttl
+
+    async def take_token(self, user_id: uuid.UUID) -> float:
+        params = {"user_id": user_id, "capacity": self.capacity, "rate": self.rate}
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(self.TAKE_TOKEN_SQL, params)
+            taken = result.scalar_one_or_none()
+            await db.commit()
+            if taken is not None:
+                return 0.0
+
+            retry = await db.execute(self.RETRY_AFTER_SQL, params)
+            return float(retry.scalar_one_or_none() or 1.0 / self.rate)
+
+    async def open_stream(self, user_id: uuid.UUID, chat_id: uuid.UUID, stream_id: uuid.UUID) -> bool:
+        async with AsyncSessionLocal() as db:
+            # сериализуем открытие стримов одного пользователя между воркерами
+            await db.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                {"key": str(user_id)},
+            )
+            result = await db.execute(
+                self.OPEN_STREAM_SQL,
+                {
+                    "user_id": user_id,
+                    "chat_id": chat_id,
+                    "stream_id": stream_id,
+                    "ttl": self.stream_ttl,
+                    "max_streams": self.max_streams,
+                },
+            )
+            opened = result.scalar_one_or_none() is not None
+            await db.commit()
+            return opened
+
+    async def close_stream(self, user_id: uuid.UUID, chat_id: uuid.UUID, stream_id: uuid.UUID) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                text("""
+                    DELETE FROM active_streams
+                    WHERE user_id = :user_id AND chat_id = :chat_id AND stream_id = :stream_id
+                """),
+                {"user_id": user_id, "chat_id": chat_id, "stream_id": stream_id},
+            )
+            await db.commit()
+
+    async def current_stream(self, user_id: uuid.UUID, chat_id: uuid.UUID) -> uuid.UUID | None:
+        """stream_id последней генерации в чате (из любого воркера)"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                text("""
+                    SELECT stream_id FROM active_streams
+                    WHERE user_id = :user_id AND chat_id = :chat_id
+                """),
+                {"user_id": user_id, "chat_id": chat_id},
+            )
+            return result.scalar_one_or_none()
+
+
+# ======================
+# Контроллер допуска
+# ======================
+class StreamHandle:
+    """Активная генерация: её можно вытеснить новым запросом в тот же чат"""
+
+    def __init__(self, controller: "AdmissionController", user_id: uuid.UUID, chat_id: uuid.UUID):
+        self.controller = controller
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.stream_id = uuid.uuid4()
+        self._superseded = asyncio.Event()
+        self._released = False
+
+    @property
+    def superseded(self) -> bool:
+        return self._superseded.is_set()
+
+    def supersede(self) -> None:
+        self._superseded.set()
+
+    async def guard(self, stream: AsyncGenerator[str, None]) -> AsyncIterator[str]:
+        """
+        Пробрасывает чанки генерации, пока стрим не вытеснен.
+        При вытеснении ожидание следующего чанка отменяется сразу,
+        а не после его прихода, и апстрим-запрос закрывается.
+        """
+        superseded_wait = asyncio.ensure_future(self._superseded.wait())
+        watcher = None
+        if self.controller.backend.shared:
+            watcher = asyncio.ensure_future(self.controller.watch_supersede(self))
+        next_chunk = None
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(stream.__anext__())
+                await asyncio.wait(
+                    {next_chunk, superseded_wait},
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not next_chunk.done():
+                    return
+
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            superseded_wait.cancel()
+            if watcher is not None:
+                watcher.cancel()
+            if next_chunk is not None and not next_chunk.done():
+                next_chunk.cancel()
+                with suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await next_chunk
+            await stream.aclose()
+
+    async def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        await self.controller.release(self)
+
+
+class AdmissionController:
+    def __init__(self, backend):
+        self.backend = backend
+        # (user_id, chat_id) → текущая генерация в этом воркере
+        self._local: dict[tuple[uuid.UUID, uuid.UUID], StreamHandle] = {}
+
+    async def check_rate(self, user_id: uuid.UUID) -> None:
+        """Списать токен за сообщение или сразу отказать (RateLimitExceeded)"""
+        retry_after = await self.backend.take_token(user_id)
+        if retry_after > 0:
+            raise RateLimitExceeded("Слишком много сообщений, попробуй чуть позже", retry_after)
+
+    async def open_stream(self, user_id: uuid.UUID, chat_id: uuid.UUID) -> StreamHandle:
+        """Зарегистрировать генерацию, вытеснив предыдущую в этом же чате"""
+        handle = StreamHandle(self, user_id, chat_id)
+        if not await self.backend.open_stream(user_id, chat_id, handle.stream_id):
+            raise RateLimitExceeded(
+                "Слишком много одновременных ответов, дождись завершения текущих",
+                settings.RATE_LIMIT_STREAM_RETRY_AFTER,
+            )
+
+        previous = self._local.get((user_id, chat_id))
+        if previous is not None:
+            previous.supersede()
+        self._local[(user_id, chat_id)] = handle
+        return handle
+
+    async def watch_supersede(self, handle: StreamHandle) -> None:
+        """Вытеснение из другого воркера: в active_streams уже чужой stream_id"""
+        while not handle.superseded:
+            await asyncio.sleep(settings.RATE_LIMIT_SUPERSEDE_POLL)
+            try:
+                current = await self.backend.current_stream(handle.user_id, handle.chat_id)
+            except Exception as e:
+                logger.warning(f"Active stream lookup failed: {e}")
+                continue
+            if current is not None and current != handle.stream_id:
+                handle.supersede()
+
+    async def release(self, handle: StreamHandle) -> None:
+        key = (handle.user_id, handle.chat_id)
+        if self._local.get(key) is handle:
+            del self._local[key]
+        await self.backend.close_stream(handle.user_id, handle.chat_id, handle.stream_id)
+
+
+def _make_backend():
+    backend_cls = {
+        "memory": MemoryAdmissionBackend,
+        "postgres": PostgresAdmissionBackend,
+    }.get(settings.RATE_LIMIT_BACKEND)
+    if backend_cls is None:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+
+    return backend_cls(
+        capacity=settings.RATE_LIMIT_BURST,
+        rate_per_sec=settings.RATE_LIMIT_MESSAGES_PER_MINUTE / 60,
+        max_streams=settings.RATE_LIMIT_MAX_ACTIVE_STREAMS,
+        stream_ttl=settings.RATE_LIMIT_STREAM_TTL,
+    )
+
+
+admission = AdmissionController(_make_backend())
@@ -0,0 +1,192 @@
+"""
+Готовые советы по состоянию темы — ответ без обращения к LLM.
+
+Общие вопросы («как подготовиться к контрольной?») зависят только от
+грубого состояния темы. Состояние (bucket) считается из фич и результата
+predict_topic_needs, советы по (предмет, тема, bucket) заранее генерирует
+training/refresh_advice_templates.py сильной моделью и кладёт в таблицу
+advice_templates. Воркер держит их в памяти и периодически перечитывает.
+
+Дешёвый классификатор (регулярные выражения) решает, можно ли ответить
+шаблоном: вопрос должен быть общим и не требовать разбора конкретной задачи.
+Названный в вопросе предмет или тема ищется по TopicIndex студента
+(n-граммы переживают падежи: «по физике» → «Физика»); если названо то,
+чего у студента нет, отвечает LLM.
+"""
+import asyncio
+import re
+from typing import Any, Dict, List, Tuple
+
+from loguru import logger
+from sqlalchemy import text
+
+from config import settings
+from db.session import AsyncSessionLocal
+from services.topic_features import TopicFeatures
+from services.topic_relevance import TopicIndex
+
+
+# Состояния темы в порядке срочности: для общего вопроса берём самую срочную тему
+BUCKETS: Dict[str, str] = {
+    "exam_soon": "через 0–3 дня контрольная или экзамен по теме",
+    "recent_fails": "по теме есть проваленные работы",
+    "low_avg": "средняя оценка по теме ниже 4 или модель советует повторить",
+    "on_track": "по теме всё в порядке, нужно поддерживать уровень",
+}
+BUCKET_PRIORITY = {bucket: i for i, bucket in enumerate(BUCKETS)}
+
+
+def topic_bucket(features: TopicFeatures, ml: Dict[str, Any] | None) -> str:
+    days = features.days_until_event
+    has_event = features.is_exam or features.is_test or features.is_control or features.is_final
+    if has_event and days is not None and 0 <= days <= 3:
+        return "exam_soon"
+    if features.fails:
+        return "recent_fails"
+    if (features.avg_score is not None and features.avg_score < 4) or (ml and ml.get("need_review")):
+        return "low_avg"
+    return "on_track"
+
+
+# ======================
+# Классификатор вопроса
+# ======================
+GENERIC_PATTERNS = [
+    re.compile(p)
+    for p in (
+        r"как (мне )?(лучше |быстрее |правильно )?(подготовиться|готовиться|подтянуть|исправить|сдать|повторить|улучшить|разобраться)",
+        r"(с чего|откуда) (мне )?(начать|начинать)",
+        r"что (мне )?(повторить|почитать|делать|подтянуть|учить)",
+        r"(дай|посоветуй|подскажи)\b.{0,30}\b(совет|как|что)",
+        r"^(совет|помоги)\b",
+    )
+]
+
+# Вопросы по содержанию: их нужно разбирать, шаблон не подойдёт
+SPECIFIC_PATTERNS = [
+    re.compile(p)
+    for p in (
+        r"\b(объясни|реши|решить|докажи|вычисли|найди|почему|что такое|пример|задач[аиу])",
+        r"[=+*/^∫∑√]|\d+\s*[xх]\b|`",
+    )
+]
+
+MAX_GENERIC_WORDS = 25
+
+# Слова общих вопросов, которые не бывают названием предмета или темы
+QUESTION_WORDS = {
+    "как", "мне", "меня", "мой", "моя", "мои", "моей", "это", "эту", "этой", "для",
+    "что", "чего", "откуда", "дай", "очень", "уже", "еще", "все", "всё",
+}
+QUESTION_STEMS = (
+    "подготов", "готов", "подтян", "исправ", "сдат", "сдам", "повтор", "улучш", "разобра",
+    "начат", "начин", "почита", "дела", "учит", "посовет", "подскаж", "помог", "совет",
+    "лучш", "быстр", "правильн", "контрольн", "экзамен", "зачет", "тест", "сесси",
+    "работ", "оценк", "предмет", "тема", "теме", "темы", "тему", "темой",
+    "пожалуйст", "завтра", "сегодня", "скоро", "недел",
+)
+
+# Доля от лучшей близости, с которой тема тоже считается названной
+MENTION_RELATIVE = 0.6
+
+
+def normalize(message: str) -> str:
+    return " ".join(message.lower().replace("ё", "е").split())
+
+
+def is_generic_question(message: str) -> bool:
+    normalized = normalize(message)
+    if not normalized or len(normalized.split()) > MAX_GENERIC_WORDS:
+        return False
+    if any(p.search(normalized) for p in SPECIFIC_PATTERNS):
+        return False
+    return any(p.search(normalized) for p in GENERIC_PATTERNS)
+
+
+def named_words(message: str) -> List[str]:
+    """Слова вопроса, которые могут быть названием предмета или темы"""
+    return [
+        word for word in re.findall(r"[а-яa-z0-9]+", normalize(message))
+        if len(word) >= 3 and word not in QUESTION_WORDS and not word.startswith(QUESTION_STEMS)
+    ]
+
+
+# ======================
+# Хранилище шаблонов
+# ======================
+class AdviceTemplates:
+    LOAD_SQL = text("SELECT subject, topic, bucket, text FROM advice_templates")
+
+    def __init__(self):
+        self._templates: Dict[Tuple[str, str, str], str] = {}
+        self.hits = 0
+        self.misses = 0
+        # в вопросе назван предмет или тема, которых у студента нет
+        self.unmatched = 0
+
+    async def refresh(self) -> None:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(self.LOAD_SQL)).all()
+        self._templates = {(r.subject, r.topic, r.bucket): r.text for r in rows}
+
+    async def refresh_loop(self) -> None:
+        """Периодически перечитывает шаблоны (запускается в lifespan)"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Advice templates refresh failed: {e}")
+            await asyncio.sleep(settings.ADVICE_REFRESH_INTERVAL)
+
+    def match(
+        self,
+        message: str,
+        features: List[TopicFeatures],
+        ml_results: Dict[str, Dict[str, Any]],
+        index: TopicIndex,
+    ) -> str | None:
+        """
+        Готовый совет, если вопрос общий и для его темы есть шаблон.
+        index — TopicIndex по этим же features (из кэша фич).
+        """
+        if not settings.ADVICE_TEMPLATES_ENABLED or not self._templates or not features:
+            return None
+        if not is_generic_question(message):
+            return None
+
+        # если в вопросе названа тема или предмет — выбираем среди них
+        candidates = features
+        named = named_words(message)
+        if named:
+            scores = index.scores(" ".join(named))
+            best = max(scores, default=0.0)
+            if best < settings.ADVICE_MENTION_MIN_SCORE:
+                self.unmatched += 1
+                return None
+            candidates = [f for f, score in zip(index.features, scores) if score >= best * MENTION_RELATIVE]
+
+        def urgency(f: TopicFeatures) -> tuple:
+            ml = ml_results.get(f.key)
+            return BUCKET_PRIORITY[topic_bucket(f, ml)], -(ml or {}).get("score", 0.0)
+
+        target = min(candidates, key=urgency)
+        advice = self._templates.get(
+            (target.subject, target.topic, topic_bucket(target, ml_results.get(target.key)))
+        )
+        if advice is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return advice
+
+    def stats(self) -> dict:
+        return {
+            "templates": len(self._templates),
+            "hits": self.hits,
+            "misses": self.misses,
+            "unmatched": self.unmatched,
+        }
+
+
+advice_templates = AdviceTemplates()
@@ -0,0 +1,102 @@
+"""
+Микробатчинг инференса между запросами.
+
+Запросы, пришедшие почти одновременно, складывают свои матрицы фич в общий
+батч; через INFERENCE_BATCH_WINDOW_MS (или по набору INFERENCE_BATCH_MAX_ROWS
+строк) батч уходит одним вызовом модели в пуле потоков
+(services/executor.py), а результаты раздаются
+обратно по запросам. Event loop на время predict не блокируется.
+"""
+import asyncio
+from typing import Any, Callable
+
+import numpy as np
+
+from services.executor import cpu_executor
+
+
+class _Batch:
+    def __init__(self, model: Any):
+        self.model = model
+        self.items: list[tuple[np.ndarray, asyncio.Future]] = []
+        self.rows = 0
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        infer: Callable[[Any, np.ndarray], np.ndarray],
+        max_rows: int,
+        window_ms: float,
+    ):
+        # infer(model, X) → массив результатов по строкам X
+        self.infer = infer
+        self.max_rows = max_rows
+        self.window = window_ms / 1000
+        # батч копится отдельно для каждой версии модели (на время горячей замены)
+        self._pending: dict[int, _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, model: Any, X: np.ndarray) -> np.ndarray:
+        if self.window <= 0 or self.max_rows <= 1:
+            self.batches += 1
+            self.rows += len(X)
+            return await cpu_executor.run_local(self.infer, model, X)
+
+        loop = asyncio.get_running_loop()
+        key = id(model)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch(model)
+            batch.timer = loop.call_later(self.window, self._flush, key)
+
+        future = loop.create_future()
+        batch.items.append((X, future))
+        batch.rows += len(X)
+        if batch.rows >= self.max_rows:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: int) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        X = np.vstack([x for x, _ in batch.items])
+        try:
+            result = await cpu_executor.run_local(self.infer, batch.model, X)
+        except Exception as e:
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(X)
+
+        offset = 0
+        for x, future in batch.items:
+            # запрос мог быть отменён, пока батч считался
+            if not future.done():
+                future.set_result(result[offset:offset + len(x)])
+            offset += len(x)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_rows": round(self.rows / self.batches, 1) if self.batches else 0.0,
+            "window_ms": self.window * 1000,
+            "max_rows": self.max_rows,
+        }
@@ -1,26 +1,27 @@
-import httpx
 from typing import List, Dict, Any
-from config import settings
+
+from services.django_client import get_client
 
 
 class CoreAPIClient:
+    """
+    Запросы к Core API (Django) от имени студента. Ходит через общий пул
+    соединений воркера (services/django_client.py): повторные запросы и предзагрузка
+    фич переиспользуют уже открытые соединения.
+    """
+
     def __init__(self, access_token: str):
-        self.base_url = settings.AUTH_SERVER_URL.rstrip("/")
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
         }
 
     async def get_my_schedule(self) -> List[Dict[str, Any]]:
-        url = f"{self.base_url}/api/schedule/my-schedule/"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=self.headers)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await get_client().get("/api/schedule/my-schedule/", headers=self.headers)
+        resp.raise_for_status()
+        return resp.json()
 
     async def get_my_grades(self) -> List[Dict[str, Any]]:
-        url = f"{self.base_url}/api/grades/my-grades/"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=self.headers)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await get_client().get("/api/grades/my-grades/", headers=self.headers)
+        resp.raise_for_status()
+        return resp.json()
@@ -0,0 +1,29 @@
+import httpx
+
+from config import settings
+
+
+# Один пул соединений к Django на воркер вместо клиента на каждый вызов:
+# им пользуются прокси авторизации (api/auth/service.py) и Core API (services/core_api.py)
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=settings.AUTH_SERVER_URL.rstrip("/"),
+            timeout=10,
+            limits=httpx.Limits(
+                max_connections=settings.AUTH_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AUTH_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,96 @@
+"""
+Пул для CPU-работы вне event loop.
+
+Извлечение фич, сборка контекста и скоринг моделью не должны стопорить
+стримы других пользователей в том же воркере. CPU_EXECUTOR выбирает, где
+они выполняются:
+- thread — пул потоков (NumPy и sklearn отпускают GIL);
+- process — пул процессов (чистый Python тоже не держит GIL воркера;
+  аргументы и результат передаются через pickle);
+- inline — прямо в event loop (для отладки и сравнения).
+
+run() принимает только функции уровня модуля с pickle-совместимыми
+аргументами. Объекты, живущие в этом процессе (загруженные модели),
+передаются через run_local() — он всегда использует потоки.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from config import settings
+
+
+class CpuExecutor:
+    KINDS = ("thread", "process", "inline")
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown CPU_EXECUTOR: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: Executor | None = None
+        self._threads: ThreadPoolExecutor | None = None
+        # ограничение очереди: лишние задачи ждут в event loop, а не в пуле
+        self._slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                # spawn: форк процесса с запущенным event loop и потоками небезопасен
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._pool = self._get_threads()
+        return self._pool
+
+    def _get_threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu")
+        return self._threads
+
+    async def _submit(self, executor: Executor, fn: Callable, args: tuple) -> Any:
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, partial(fn, *args))
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """CPU-этап в настроенном пуле (thread / process / inline)"""
+        if self.kind == "inline":
+            return fn(*args)
+        return await self._submit(self._get_pool(), fn, args)
+
+    async def run_local(self, fn: Callable, *args) -> Any:
+        """CPU-этап над объектами этого процесса — всегда в потоке"""
+        if self.kind == "inline":
+            return fn(*args)
+        return await self._submit(self._get_threads(), fn, args)
+
+    def shutdown(self) -> None:
+        for pool in {self._pool, self._threads} - {None}:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._threads = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+        }
+
+
+cpu_executor = CpuExecutor(
+    settings.CPU_EXECUTOR,
+    settings.CPU_EXECUTOR_WORKERS,
+    settings.CPU_EXECUTOR_MAX_PENDING,
+)
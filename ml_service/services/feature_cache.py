@@ -0,0 +1,212 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import List
+
+from loguru import logger
+
+from config import settings
+from services.executor import cpu_executor
+from services.features import collect_student_features
+from services.precomputed import PrecomputedContext, load_precomputed
+from services.topic_features import TopicFeatures
+from services.topic_relevance import TopicIndex
+
+
+class StudentFeatureCache:
+    """
+    Процессный LRU-кэш external_user_id → фичи студента (TopicFeatures).
+
+    Оценки и расписание меняются редко, а в одном чате студент пишет
+    несколько сообщений подряд — запись живёт FEATURE_CACHE_TTL секунд,
+    и повторные сообщения не ходят в Core API. Рядом с фичами хранится
+    TopicIndex для выбора тем в промпт.
+
+    Записи, положенные предзагрузкой (prefetch_student_features), помечаются:
+    первое чтение такой записи считается попаданием предзагрузки.
+
+    Если фичи взяты из student_precomputed, рядом лежат и посчитанные
+    вместе с ними ml_results и блок контекста (precomputed).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[uuid.UUID, tuple[float, List[TopicFeatures], TopicIndex, PrecomputedContext | None]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # пользователи, чьи фичи положила предзагрузка и их ещё никто не прочитал
+        self._prefetched: set[uuid.UUID] = set()
+        self.prefetch_started = 0
+        self.prefetch_skipped = 0
+        self.prefetch_hits = 0
+        self.prefetch_failed = 0
+        # загрузки из student_precomputed: найдено / нет записи / ошибка БД
+        self.precomputed_hits = 0
+        self.precomputed_misses = 0
+        self.precomputed_failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def fresh(self, user_id: uuid.UUID) -> bool:
+        """Есть ли живая запись (без учёта в hits/misses)"""
+        entry = self._entries.get(user_id)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def consume_prefetch(self, user_id: uuid.UUID) -> None:
+        if user_id in self._prefetched:
+            self._prefetched.discard(user_id)
+            self.prefetch_hits += 1
+
+    def get(self, user_id: uuid.UUID) -> List[TopicFeatures] | None:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+                self._prefetched.discard(user_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        self.consume_prefetch(user_id)
+        return entry[1]
+
+    def set(
+        self,
+        user_id: uuid.UUID,
+        features: List[TopicFeatures],
+        index: TopicIndex | None = None,
+        prefetched: bool = False,
+        precomputed: PrecomputedContext | None = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, features, index or TopicIndex(features), precomputed)
+        self._entries.move_to_end(user_id)
+        if prefetched:
+            self._prefetched.add(user_id)
+        else:
+            self._prefetched.discard(user_id)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self._prefetched.discard(evicted)
+
+    def topic_index(self, user_id: uuid.UUID, features: List[TopicFeatures]) -> TopicIndex:
+        """Индекс тем, построенный при кэшировании этих фич (или новый, если кэш выключен)"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] is features:
+            return entry[2]
+        return TopicIndex(features)
+
+    def precomputed(self, user_id: uuid.UUID, features: List[TopicFeatures]) -> PrecomputedContext | None:
+        """ml_results и блок контекста к этим фичам, если они посчитаны текущими моделями"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] is features and entry[3] is not None and entry[3].current:
+            return entry[3]
+        return None
+
+    def discard(self, user_id: uuid.UUID) -> None:
+        self._entries.pop(user_id, None)
+        self._prefetched.discard(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "prefetch": {
+                "started": self.prefetch_started,
+                "skipped": self.prefetch_skipped,
+                "hits": self.prefetch_hits,
+                "failed": self.prefetch_failed,
+                "hit_rate": round(self.prefetch_hits / self.prefetch_started, 3) if self.prefetch_started else 0.0,
+            },
+            "precomputed": {
+                "hits": self.precomputed_hits,
+                "misses": self.precomputed_misses,
+                "failed": self.precomputed_failed,
+            },
+        }
+
+
+student_feature_cache = StudentFeatureCache(settings.FEATURE_CACHE_SIZE, settings.FEATURE_CACHE_TTL)
+
+
+# Single-flight загрузки фич: external_user_id → задача (запрос и предзагрузка
+# одного пользователя ждут один поход в Core API)
+_inflight: dict[uuid.UUID, asyncio.Task] = {}
+
+
+async def _load_precomputed(user_id: uuid.UUID) -> tuple[List[TopicFeatures], PrecomputedContext] | None:
+    try:
+        loaded = await load_precomputed(user_id)
+    except Exception as e:
+        # без своей записи обойдёмся Core API
+        student_feature_cache.precomputed_failed += 1
+        logger.warning(f"Precomputed features lookup failed for {user_id}: {e}")
+        return None
+    if loaded is None:
+        student_feature_cache.precomputed_misses += 1
+    else:
+        student_feature_cache.precomputed_hits += 1
+    return loaded
+
+
+async def _load_features(user_id: uuid.UUID, access_token: str, prefetched: bool) -> List[TopicFeatures]:
+    loaded = await _load_precomputed(user_id) if settings.STUDENT_PRECOMPUTED_ENABLED else None
+    if loaded is not None:
+        features, precomputed = loaded
+    else:
+        features, precomputed = await collect_student_features(access_token), None
+    # индекс тем строится в потоке, а не в event loop
+    index = await cpu_executor.run_local(TopicIndex, features)
+    student_feature_cache.set(user_id, features, index, prefetched=prefetched, precomputed=precomputed)
+    return features
+
+
+def _load_task(user_id: uuid.UUID, access_token: str, prefetched: bool = False) -> asyncio.Task:
+    task = _inflight.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_load_features(user_id, access_token, prefetched))
+        _inflight[user_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(user_id, None))
+    return task
+
+
+async def get_student_features(user_id: uuid.UUID, access_token: str) -> List[TopicFeatures]:
+    """Фичи студента из кэша, из идущей загрузки, из student_precomputed или из Core API"""
+    features = student_feature_cache.get(user_id)
+    if features is None:
+        # shield: отмена запроса не должна отменять общую загрузку
+        features = await asyncio.shield(_load_task(user_id, access_token))
+        # сообщение пришло, пока шла предзагрузка, — тоже её попадание
+        student_feature_cache.consume_prefetch(user_id)
+    return features
+
+
+def _prefetch_done(user_id: uuid.UUID, task: asyncio.Task) -> None:
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        student_feature_cache.prefetch_failed += 1
+        logger.warning(f"Feature prefetch failed for {user_id}: {task.exception()}")
+
+
+def prefetch_student_features(user_id: uuid.UUID, access_token: str) -> None:
+    """
+    Фоновая загрузка фич, пока студент открывает чат (/chats, /history):
+    следующий /message найдёт их в кэше. Повторно не запускается,
+    если фичи уже в кэше или загружаются.
+    """
+    if not settings.FEATURE_PREFETCH or not student_feature_cache.enabled:
+        return
+    if student_feature_cache.fresh(user_id) or user_id in _inflight:
+        student_feature_cache.prefetch_skipped += 1
+        return
+
+    student_feature_cache.prefetch_started += 1
+    task = _load_task(user_id, access_token, prefetched=True)
+    task.add_done_callback(lambda t: _prefetch_done(user_id, t))
@@ -2,7 +2,11 @@ from datetime import datetime, date, time
 from typing import Dict, List, Any, Tuple
 from collections import defaultdict
 
+from config import settings
+from services import features_columnar
 from services.core_api import CoreAPIClient
+from services.executor import cpu_executor
+from services.topic_features import TopicFeatures
 
 
 # -------------------------------
@@ -153,7 +157,43 @@ def extract_grade_features(grades_payload: List[Dict[str, Any]]) -> Dict[Tuple[s
 # 🔥 ГЛАВНАЯ ФУНКЦИЯ
 # -------------------------------
 
-async def collect_student_features(access_token: str) -> Dict[str, Dict]:
+def merge_topic_features(
+    schedule_features: Dict[Tuple[str, str], Dict],
+    grade_features: Dict[Tuple[str, str], Dict],
+) -> List[TopicFeatures]:
+    """Объединение по (subject, topic): сначала темы с оценками, затем остальные"""
+    keys = list(grade_features) + [key for key in schedule_features if key not in grade_features]
+    return [
+        TopicFeatures.from_parts(*key, grade_features.get(key), schedule_features.get(key))
+        for key in keys
+    ]
+
+
+def columnar(rows: int, threshold: int) -> bool:
+    """Колоночная версия окупается только на больших ответах"""
+    return 0 < threshold <= rows
+
+
+def build_topic_features(
+    schedule: List[Dict[str, Any]],
+    grades: List[Dict[str, Any]],
+) -> List[TopicFeatures]:
+    """Сырые ответы Core API → фичи по темам (CPU-этап, выполняется в cpu_executor)"""
+    if columnar(len(schedule), settings.FEATURES_COLUMNAR_MIN_SCHEDULE):
+        schedule_features = features_columnar.extract_schedule_features(schedule)
+    else:
+        schedule_features = extract_schedule_features(schedule)
+
+    total_grades = sum(len(block.get("grades", [])) for block in grades)
+    if columnar(total_grades, settings.FEATURES_COLUMNAR_MIN_GRADES):
+        grade_features = features_columnar.extract_grade_features(grades)
+    else:
+        grade_features = extract_grade_features(grades)
+
+    return merge_topic_features(schedule_features, grade_features)
+
+
+async def collect_student_features(access_token: str) -> List[TopicFeatures]:
     """
     Собирает расширенные фичи студента для ML:
     - оценки
@@ -167,25 +207,5 @@ async def collect_student_features(access_token: str) -> Dict[str, Dict]:
     schedule = await client.get_my_schedule()
     grades = await client.get_my_grades()
 
-    # 2️⃣ Извлекаем фичи
-    schedule_features = extract_schedule_features(schedule)
-    grade_features = extract_grade_features(grades)
-
-    # 3️⃣ Склеиваем
-    all_keys = set(schedule_features) | set(grade_features)
-    result = {}
-
-    for key in all_keys:
-        subject, topic = key
-
-        merged = {
-            "subject": subject,
-            "topic": topic,
-        }
-
-        merged.update(grade_features.get(key, {}))
-        merged.update(schedule_features.get(key, {}))
-
-        result[f"{subject} :: {topic}"] = merged
-
-    return result
+    # 2️⃣ Извлекаем и склеиваем фичи вне event loop
+    return await cpu_executor.run(build_topic_features, schedule, grades)
@@ -0,0 +1,257 @@
+"""
+Колоночная версия extract_schedule_features / extract_grade_features.
+
+Сырые ответы Core API один раз раскладываются в массивы, темы кодируются
+целыми числами, а средние, минимумы, провалы и давность считаются
+сгруппированными операциями NumPy. Даты и время разбираются по уникальным
+строкам (у студента их сотни, а не тысячи). Результат совпадает со
+словарями из services/features.py.
+"""
+from datetime import datetime, date
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+NAT = np.datetime64("NaT", "us")
+
+
+# -------------------------------
+# utils
+# -------------------------------
+
+def _parse_iso(value: Any) -> np.datetime64:
+    if not value:
+        return NAT
+    try:
+        dt = datetime.fromisoformat(value)
+    except Exception:
+        return NAT
+    # сравниваем по «настенному» времени, как и .date() в исходной версии
+    return np.datetime64(dt.replace(tzinfo=None), "us")
+
+
+def _parse_minutes(value: Any) -> int | None:
+    if not value:
+        return None
+    hh, mm, *_ = value.split(":")
+    return int(hh) * 60 + int(mm)
+
+
+def _map_unique(values: List[Any], parse) -> List[Any]:
+    """parse() по уникальным значениям, затем раздача по всем строкам"""
+    parsed = {v: parse(v) for v in dict.fromkeys(values)}
+    return [parsed[v] for v in values]
+
+
+def parse_iso_datetimes(values: List[Any]) -> np.ndarray:
+    """Строки ISO-дат → datetime64[us], NaT для пустых и битых значений"""
+    return np.array(_map_unique(values, _parse_iso), dtype="datetime64[us]").reshape(len(values))
+
+
+def _optional_ints(values: np.ndarray, present: np.ndarray) -> List[int | None]:
+    return [int(v) if ok else None for v, ok in zip(values.tolist(), present.tolist())]
+
+
+# -------------------------------
+# Расписание → фичи
+# -------------------------------
+
+def extract_schedule_features(schedule: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict]:
+    items = []
+    for item in schedule:
+        topic = item.get("topic")
+        subject = item.get("subject", {}).get("title")
+        if topic and subject:
+            items.append((subject, topic, item))
+
+    if not items:
+        return {}
+
+    due = parse_iso_datetimes([item.get("due_date") for _, _, item in items])
+    today = np.datetime64(date.today(), "D")
+    with np.errstate(invalid="ignore"):
+        days = (due.astype("datetime64[D]") - today).astype(np.int64)
+    days_until = _optional_ints(days, ~np.isnat(due))
+
+    starts = _map_unique([item.get("starts_at") for _, _, item in items], _parse_minutes)
+    ends = _map_unique([item.get("ends_at") for _, _, item in items], _parse_minutes)
+
+    features = {}
+    # последнее занятие по теме перезаписывает предыдущие — как в исходной версии
+    for i, (subject, topic, item) in enumerate(items):
+        features[(subject.strip(), topic.strip())] = {
+            "subject": subject,
+            "topic": topic,
+
+            "weekday": item.get("weekday"),
+
+            "starts_at_min": starts[i],
+            "ends_at_min": ends[i],
+
+            "teacher_department": item.get("teacher", {}).get("department"),
+
+            "is_test": item.get("is_test", False),
+            "is_exam": item.get("is_exam", False),
+            "is_lab": item.get("is_lab_work", False),
+            "is_control": item.get("is_control_work", False),
+            "is_final": item.get("is_final", False),
+
+            "max_score": item.get("max_score"),
+            "days_until_event": days_until[i],
+        }
+
+    return features
+
+
+# -------------------------------
+# Оценки → фичи
+# -------------------------------
+
+class GradeColumns:
+    """
+    Оценки одного или нескольких студентов в виде параллельных массивов.
+    student — индекс ответа /grades во входном списке, subject/topic —
+    коды в subject_labels/topic_labels (уже без пробелов по краям).
+    """
+
+    def __init__(self, grades_payloads: List[List[Dict[str, Any]]]):
+        block_students, block_subjects, block_sizes = [], [], []
+        topics, values, weights, dates = [], [], [], []
+
+        # единственный проход по JSON: колонки собираются целыми блоками
+        for student, grades_payload in enumerate(grades_payloads):
+            for subject_block in grades_payload:
+                subject = subject_block.get("subject", {}).get("title")
+                if not subject:
+                    continue
+
+                grades = subject_block.get("grades", [])
+                block_students.append(student)
+                block_subjects.append(subject.strip())
+                block_sizes.append(len(grades))
+
+                topics += [g.get("topic") for g in grades]
+                values += [g.get("value") for g in grades]
+                weights += [g.get("weight", 1) for g in grades]
+                dates += [g.get("work_date") for g in grades]
+
+        subject_codes, self.subject_labels = pd.factorize(np.array(block_subjects, dtype=object))
+        self.student = np.repeat(np.array(block_students, dtype=np.int64), block_sizes)
+        self.subject = np.repeat(subject_codes, block_sizes)
+
+        # темы: код исходной строки → код строки без пробелов, пустые → -1
+        raw_codes, raw_topics = pd.factorize(np.array(topics, dtype=object))
+        stripped = [t.strip() if t else None for t in raw_topics]
+        stripped_codes, self.topic_labels = pd.factorize(np.array(stripped, dtype=object))
+        self.topic = np.where(raw_codes >= 0, np.append(stripped_codes, -1)[raw_codes], -1)
+
+        # None превращается в NaN
+        self.value = np.array(values, dtype=np.float64).reshape(len(values))
+        self.has_value = ~np.isnan(self.value)
+        # min/max возвращают оценку в исходном типе (int или float)
+        self.is_int = np.fromiter((isinstance(v, int) for v in values), dtype=bool, count=len(values))
+        self.weight = np.array(weights, dtype=np.float64).reshape(len(weights))
+        self.work_date = parse_iso_datetimes(dates)
+
+
+def _first_is_int(is_int: np.ndarray, match: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Для каждой группы (отсортированной стабильно): целое ли первое совпавшее значение"""
+    positions = np.where(match, np.arange(len(match)), len(match))
+    first = np.minimum.reduceat(positions, starts)
+    return np.append(is_int, False)[first]
+
+
+def grade_features_from_columns(
+    columns: GradeColumns,
+    n_students: int,
+) -> List[Dict[Tuple[str, str], Dict]]:
+    result: List[Dict[Tuple[str, str], Dict]] = [{} for _ in range(n_students)]
+
+    has_date = ~np.isnat(columns.work_date)
+    # тема появляется, только если у неё есть оценка или разборчивая дата
+    keep = (columns.topic >= 0) & (columns.has_value | has_date)
+    if not keep.any():
+        return result
+
+    student = columns.student[keep]
+    subject = columns.subject[keep]
+    topic = columns.topic[keep]
+    has_value = columns.has_value[keep]
+    value = np.where(has_value, columns.value[keep], 0.0)
+    weight = np.where(has_value, columns.weight[keep], 0.0)
+    is_int = columns.is_int[keep] & has_value
+    work_date = columns.work_date[keep]
+
+    # группа = (студент, предмет, тема); коды в порядке первого появления,
+    # как ключи dict в исходной версии
+    n_subjects, n_topics = len(columns.subject_labels), len(columns.topic_labels)
+    codes, group_keys = pd.factorize((student * n_subjects + subject) * n_topics + topic)
+    n = len(group_keys)
+
+    total = np.bincount(codes, weights=has_value, minlength=n).astype(np.int64)
+    fails = np.bincount(codes, weights=has_value & (value < 4), minlength=n).astype(np.int64)
+    sum_w = np.bincount(codes, weights=weight, minlength=n)
+    sum_sw = np.bincount(codes, weights=value * weight, minlength=n)
+
+    # min/max/последняя дата — reduceat по отсортированным группам
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    min_score = np.minimum.reduceat(np.where(has_value, value, np.inf)[order], starts)
+    max_score = np.maximum.reduceat(np.where(has_value, value, -np.inf)[order], starts)
+    # NaT — минимальный int64, поэтому max его пропускает
+    last_date = np.maximum.reduceat(work_date.view(np.int64)[order], starts).view("datetime64[us]")
+
+    # min()/max() в исходной версии возвращают первое в порядке оценок
+    # из равных значений (4 или 4.0) — берём тип именно его
+    min_int = _first_is_int(is_int[order], has_value[order] & (value[order] == min_score[sorted_codes]), starts)
+    max_int = _first_is_int(is_int[order], has_value[order] & (value[order] == max_score[sorted_codes]), starts)
+
+    today = np.datetime64(datetime.utcnow(), "us")
+    with np.errstate(invalid="ignore"):
+        days = (today - last_date) // np.timedelta64(1, "D")
+    days_since = _optional_ints(days, ~np.isnat(last_date))
+
+    has_scores = (total > 0) & (sum_w != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg = sum_sw / sum_w
+
+    group_topic = group_keys % n_topics
+    group_subject = group_keys // n_topics % n_subjects
+    group_student = group_keys // (n_topics * n_subjects)
+
+    rows = zip(
+        group_student.tolist(), group_subject.tolist(), group_topic.tolist(),
+        avg.tolist(), has_scores.tolist(), total.tolist(), fails.tolist(),
+        min_score.tolist(), min_int.tolist(), max_score.tolist(), max_int.tolist(),
+        days_since,
+    )
+    for st, sj, tp, avg_i, scored, total_i, fails_i, min_i, min_is_int, max_i, max_is_int, days_i in rows:
+        subject_title = columns.subject_labels[sj]
+        topic_title = columns.topic_labels[tp]
+        result[st][(subject_title, topic_title)] = {
+            "subject": subject_title,
+            "topic": topic_title,
+
+            "avg_score": round(avg_i, 3) if scored else None,
+            "min_score": (int(min_i) if min_is_int else min_i) if total_i else None,
+            "max_score": (int(max_i) if max_is_int else max_i) if total_i else None,
+            "total_works": total_i,
+            "fails": fails_i,
+            "days_since_last_grade": days_i,
+        }
+
+    return result
+
+
+def extract_grade_features(grades_payload: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict]:
+    return grade_features_from_columns(GradeColumns([grades_payload]), 1)[0]
+
+
+def extract_grade_features_many(
+    grades_payloads: List[List[Dict[str, Any]]],
+) -> List[Dict[Tuple[str, str], Dict]]:
+    """Оценки тысяч студентов одним проходом (пакетные задачи)"""
+    return grade_features_from_columns(GradeColumns(grades_payloads), len(grades_payloads))
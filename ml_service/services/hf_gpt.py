@@ -6,34 +6,54 @@ import json
 import time
 from typing import AsyncGenerator
 from config import settings
+from services.llm_backends import LLMBackend, PromptCacheStats
 
 
-class HFClient:
-    def __init__(self, model: str = "zai-org/GLM-4.7"):
+class OpenAICompatibleClient(LLMBackend):
+    """
+    Клиент OpenAI-совместимого /v1/chat/completions: роутер HuggingFace
+    или локальный сервер (llama.cpp, vLLM). api_key пустой — без авторизации.
+    """
+
+    def __init__(self, model: str, api_url: str, api_key: str = ""):
         self.model = model
-        self.api_url = "https://router.huggingface.co/v1/chat/completions"
-        self.headers = {
-            "Authorization": f"Bearer {settings.HF_API_KEY}",
-            "Content-Type": "application/json",
-        }
+        self.api_url = api_url
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.prompt_cache = PromptCacheStats()
+
+    @staticmethod
+    def _messages(prompt: str | list, system: str) -> list:
+        """Готовый список сообщений (services/prompt.py) или строка с системной инструкцией"""
+        if isinstance(prompt, list):
+            return prompt
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ]
+
+    @staticmethod
+    def _cached_tokens(data: dict) -> int | None:
+        """Токены промпта из кэша: usage OpenAI/vLLM или timings llama.cpp"""
+        details = (data.get("usage") or {}).get("prompt_tokens_details") or {}
+        if details.get("cached_tokens") is not None:
+            return details["cached_tokens"]
+        timings = data.get("timings") or {}
+        return timings.get("cache_n")
 
     # =========================
     # Обычный НЕстрим запрос
     # =========================
-    async def ask(self, prompt: str) -> str:
+    async def ask(self, prompt: str | list) -> str:
         payload = {
             "model": self.model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты — поддерживающий AI-репетитор. "
-                        "Дай короткий, полезный совет студенту. "
-                        "Один абзац, на русском, сразу к делу."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
+            "messages": self._messages(
+                prompt,
+                "Ты — поддерживающий AI-репетитор. "
+                "Дай короткий, полезный совет студенту. "
+                "Один абзац, на русском, сразу к делу.",
+            ),
             "max_tokens": 1024,
             "temperature": 0.6,
         }
@@ -43,7 +63,7 @@ class HFClient:
 
             if resp.status_code != 200:
                 print(f"HF ERROR: {resp.status_code} {resp.text}")
-                return "Сейчас я занят вычислениями, попробуй чуть позже."
+                return self.BUSY_TEXT
 
             data = resp.json()
 
@@ -56,12 +76,12 @@ class HFClient:
             except Exception as e:
                 print(f"HF parse error: {e}")
 
-            return "Давай начнём с самых простых примеров и разберём их шаг за шагом."
+            return self.EMPTY_TEXT
 
     # =========================
     # СТРИМ как в ChatGPT
     # =========================
-    async def ask_stream(self, prompt: str) -> AsyncGenerator[str, None]:
+    async def ask_stream(self, prompt: str | list) -> AsyncGenerator[str, None]:
         """
         Возвращает ЧИСТЫЙ ТЕКСТ по кускам.
         Никаких data:, никаких JSON — только символы ответа.
@@ -69,28 +89,27 @@ class HFClient:
 
         payload = {
             "model": self.model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты — поддерживающий AI-репетитор. "
-                        "Дай короткий, полезный совет студенту. "
-                        "Один абзац, на русском, сразу к делу. "
-                        "Можно использовать Markdown."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
+            "messages": self._messages(
+                prompt,
+                "Ты — поддерживающий AI-репетитор. "
+                "Дай короткий, полезный совет студенту. "
+                "Один абзац, на русском, сразу к делу. "
+                "Можно использовать Markdown.",
+            ),
             "max_tokens": 1024,
             "temperature": 0.7,
             "stream": True,
         }
+        if settings.LLM_STREAM_USAGE:
+            # последний чанк придёт с usage — там видно, сколько промпта взято из кэша
+            payload["stream_options"] = {"include_usage": True}
 
         start_time = time.time()
         first_chunk_time = None
         full_response = ""
         chunk_count = 0
         line_count = 0
+        prompt_tokens = cached_tokens = None
 
         print(f"🚀 [HF_STREAM] Начало запроса к HuggingFace")
         print(f"🚀 [HF_STREAM] Model: {self.model}")
@@ -108,7 +127,7 @@ class HFClient:
                         err = await response.aread()
                         msg = f"HF STREAM ERROR {response.status_code}: {err.decode()}"
                         print(f"❌ [HF_STREAM] {msg}")
-                        yield "Ошибка генерации ответа."
+                        yield self.STREAM_ERROR_TEXT
                         return
 
                     print(f"📥 [HF_STREAM] Начинаем чтение строк...")
@@ -144,6 +163,10 @@ class HFClient:
                                 print(f"⚠️ [HF_STREAM] Ошибка парсинга JSON: {e}, data_str: {data_str[:100]}")
                             continue
 
+                        if data_json.get("usage") or data_json.get("timings"):
+                            prompt_tokens = (data_json.get("usage") or {}).get("prompt_tokens", prompt_tokens)
+                            cached_tokens = self._cached_tokens(data_json)
+
                         choices = data_json.get("choices", [])
                         if not choices:
                             if line_count <= 10:
@@ -180,9 +203,10 @@ class HFClient:
                 print(f"❌ [HF_STREAM] EXCEPTION: {e}")
                 import traceback
                 traceback.print_exc()
-                yield "Ошибка соединения с моделью."
+                yield self.CONNECTION_ERROR_TEXT
 
         total_time = time.time() - start_time
+        self.prompt_cache.record(prompt_tokens, cached_tokens, first_chunk_time)
         print("\n" + "=" * 50)
         print("🤖 [HF_STREAM] STREAM FINISHED")
         print(f"📊 [HF_STREAM] Всего строк обработано: {line_count}")
@@ -192,6 +216,8 @@ class HFClient:
             else "⏱️ [HF_STREAM] Первый чанк: не получен"
         )
         print(f"📦 [HF_STREAM] Всего чанков: {chunk_count}")
+        if cached_tokens is not None:
+            print(f"🗃️ [HF_STREAM] Токенов промпта из кэша: {cached_tokens} из {prompt_tokens}")
         print(f"⏱️ [HF_STREAM] Общее время: {total_time:.2f}s")
         print(f"📝 [HF_STREAM] Длина ответа: {len(full_response)} символов")
         if full_response:
@@ -200,3 +226,14 @@ class HFClient:
         else:
             print(f"⚠️ [HF_STREAM] ВНИМАНИЕ: Пустой ответ!")
         print("=" * 50 + "\n")
+
+
+    def stats(self) -> dict:
+        return {"prompt_cache": self.prompt_cache.to_dict()}
+
+
+class HFClient(OpenAICompatibleClient):
+    API_URL = "https://router.huggingface.co/v1/chat/completions"
+
+    def __init__(self, model: str = "zai-org/GLM-4.7", api_url: str | None = None):
+        super().__init__(model, api_url or self.API_URL, settings.HF_API_KEY)
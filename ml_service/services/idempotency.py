@@ -0,0 +1,305 @@
+"""
+Idempotency-Key для генераций (/message и редактирование сообщений).
+
+Первый запрос с ключом «захватывает» его в таблице idempotency_keys и
+запускает генерацию в фоне: ответ клиенту читается из буфера, поэтому
+обрыв соединения не убивает генерацию. Повтор с тем же ключом
+подключается к идущему стриму (в этом воркере) или получает сохранённый
+ответ — новая генерация не запускается.
+
+Ответ сохраняется, только если генерация прошла успешно (эндпоинт
+вызывает claim.succeed()); иначе ключ освобождается и повтор запустит
+генерацию заново. Пока генерация идёт, ключ арендован на
+IDEMPOTENCY_LEASE секунд и аренда продлевается: если воркер упал,
+повтор захватит ключ после её истечения, а не через IDEMPOTENCY_TTL.
+"""
+import asyncio
+import hashlib
+import uuid
+from typing import AsyncIterator
+
+from loguru import logger
+from sqlalchemy import text
+
+from config import settings
+from db.session import AsyncSessionLocal
+
+
+class IdempotencyConflict(Exception):
+    """Ключ уже использован для другого запроса"""
+
+
+class GenerationBroadcast:
+    """Буфер чанков одной генерации, который могут читать несколько клиентов"""
+
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def push(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class IdempotencyClaim:
+    """
+    Результат begin(): либо replay (готовый поток ответа для повтора),
+    либо право запустить генерацию через run().
+    """
+
+    def __init__(
+        self,
+        manager: "IdempotencyManager",
+        user_id: uuid.UUID,
+        key: str,
+        replay: AsyncIterator[str] | None = None,
+        claimed_at=None,
+    ):
+        self.manager = manager
+        self.user_id = user_id
+        self.key = key
+        self.replay = replay
+        # created_at захвата: после перехвата ключа по истёкшей аренде
+        # старый владелец не перезапишет чужую строку
+        self.claimed_at = claimed_at
+        self.started = False
+        self.succeeded = False
+
+    def succeed(self) -> None:
+        """Генерация завершилась успешно — её ответ можно отдавать повторам"""
+        self.succeeded = True
+
+    def run(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Запустить генерацию в фоне и вернуть поток для текущего клиента"""
+        self.started = True
+        broadcast = GenerationBroadcast()
+        self.manager.local[(self.user_id, self.key)] = broadcast
+        task = asyncio.create_task(self.manager.produce(self, chunks, broadcast))
+        self.manager.tasks.add(task)
+        task.add_done_callback(self.manager.tasks.discard)
+        return broadcast.subscribe()
+
+    async def abandon(self) -> None:
+        """Освободить ключ, если генерация так и не началась (404, 429, ошибка)"""
+        if self.replay is None and not self.started:
+            await self.manager.release(self)
+
+
+class IdempotencyManager:
+    CLAIM_SQL = text("""
+        INSERT INTO idempotency_keys AS k
+            (user_id, key, fingerprint, status, response_text, created_at, expires_at)
+        VALUES (
+            :user_id, :key, :fingerprint, 'in_progress', NULL, now(),
+            now() + make_interval(secs => CAST(:ttl AS float8))
+        )
+        ON CONFLICT (user_id, key) DO UPDATE SET
+            fingerprint = EXCLUDED.fingerprint,
+            status = 'in_progress',
+            response_text = NULL,
+            created_at = EXCLUDED.created_at,
+            expires_at = EXCLUDED.expires_at
+        WHERE k.expires_at < now()
+        RETURNING created_at
+    """)
+
+    LOOKUP_SQL = text("""
+        SELECT fingerprint, status, response_text, expires_at < now() AS expired
+        FROM idempotency_keys
+        WHERE user_id = :user_id AND key = :key
+    """)
+
+    def __init__(self):
+        # (user_id, key) → буфер идущей в этом воркере генерации
+        self.local: dict[tuple[uuid.UUID, str], GenerationBroadcast] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    @staticmethod
+    def fingerprint(scope: str, body: bytes) -> str:
+        return hashlib.sha256(scope.encode() + b"\0" + body).hexdigest()
+
+    async def begin(
+        self,
+        user_id: uuid.UUID,
+        key: str,
+        scope: str,
+        body: bytes,
+    ) -> IdempotencyClaim:
+        fingerprint = self.fingerprint(scope, body)
+        params = {
+            "user_id": user_id,
+            "key": key,
+            "fingerprint": fingerprint,
+            # до завершения ключ живёт по аренде, TTL — у готового ответа
+            "ttl": settings.IDEMPOTENCY_LEASE,
+        }
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(self.CLAIM_SQL, params)
+            claimed_at = result.scalar_one_or_none()
+            await db.commit()
+            if claimed_at is not None:
+                return IdempotencyClaim(self, user_id, key, claimed_at=claimed_at)
+
+            existing = (await db.execute(self.LOOKUP_SQL, params)).one_or_none()
+
+        if existing is None:
+            # ключ успели освободить между запросами — пробуем ещё раз
+            return await self.begin(user_id, key, scope, body)
+
+        if existing.fingerprint != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key уже использован для другого запроса")
+
+        if existing.status == "completed":
+            return IdempotencyClaim(self, user_id, key, replay=self._replay_text(existing.response_text))
+
+        broadcast = self.local.get((user_id, key))
+        if broadcast is not None:
+            return IdempotencyClaim(self, user_id, key, replay=broadcast.subscribe())
+
+        # генерация идёт в другом воркере — ждём её результат в БД
+        return IdempotencyClaim(self, user_id, key, replay=self._wait_remote(user_id, key))
+
+    async def produce(
+        self,
+        claim: IdempotencyClaim,
+        chunks: AsyncIterator[str],
+        broadcast: GenerationBroadcast,
+    ) -> None:
+        renewal = asyncio.create_task(self._renew_lease(claim))
+        try:
+            async for chunk in chunks:
+                broadcast.push(chunk)
+        except Exception as e:
+            logger.error(f"Idempotent generation failed: {e}")
+        finally:
+            renewal.cancel()
+            broadcast.finish()
+            self.local.pop((claim.user_id, claim.key), None)
+
+        # ошибку модели, вытесненную или оборванную генерацию не сохраняем:
+        # повтор с тем же ключом запустит генерацию заново
+        response_text = "".join(broadcast.chunks).strip()
+        if claim.succeeded and response_text:
+            await self.complete(claim, response_text)
+        else:
+            await self.release(claim)
+
+    async def _renew_lease(self, claim: IdempotencyClaim) -> None:
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_LEASE / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        text("""
+                            UPDATE idempotency_keys
+                            SET expires_at = now() + make_interval(secs => CAST(:lease AS float8))
+                            WHERE user_id = :user_id AND key = :key
+                              AND status = 'in_progress' AND created_at = :claimed_at
+                        """),
+                        {
+                            "user_id": claim.user_id,
+                            "key": claim.key,
+                            "claimed_at": claim.claimed_at,
+                            "lease": settings.IDEMPOTENCY_LEASE,
+                        },
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"Idempotency lease renewal failed: {e}")
+
+    async def complete(self, claim: IdempotencyClaim, response_text: str) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                text("""
+                    UPDATE idempotency_keys
+                    SET status = 'completed', response_text = :response_text,
+                        expires_at = now() + make_interval(secs => CAST(:ttl AS float8))
+                    WHERE user_id = :user_id AND key = :key AND created_at = :claimed_at
+                """),
+                {
+                    "user_id": claim.user_id,
+                    "key": claim.key,
+                    "claimed_at": claim.claimed_at,
+                    "response_text": response_text,
+                    "ttl": settings.IDEMPOTENCY_TTL,
+                },
+            )
+            await db.commit()
+
+    async def release(self, claim: IdempotencyClaim) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                text("""
+                    DELETE FROM idempotency_keys
+                    WHERE user_id = :user_id AND key = :key
+                      AND status = 'in_progress' AND created_at = :claimed_at
+                """),
+                {"user_id": claim.user_id, "key": claim.key, "claimed_at": claim.claimed_at},
+            )
+            await db.commit()
+
+    async def cleanup_expired(self) -> int:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                text("DELETE FROM idempotency_keys WHERE expires_at < now()")
+            )
+            await db.commit()
+            return result.rowcount
+
+    async def cleanup_loop(self) -> None:
+        """Периодически удаляет истёкшие ключи (запускается в lifespan)"""
+        while True:
+            try:
+                deleted = await self.cleanup_expired()
+                if deleted:
+                    logger.info(f"Idempotency keys cleanup: {deleted} expired")
+            except Exception as e:
+                logger.warning(f"Idempotency keys cleanup failed: {e}")
+            await asyncio.sleep(settings.IDEMPOTENCY_CLEANUP_INTERVAL)
+
+    @staticmethod
+    async def _replay_text(response_text: str) -> AsyncIterator[str]:
+        yield response_text
+
+    async def _wait_remote(self, user_id: uuid.UUID, key: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+        while loop.time() < deadline:
+            async with AsyncSessionLocal() as db:
+                row = (
+                    await db.execute(self.LOOKUP_SQL, {"user_id": user_id, "key": key})
+                ).one_or_none()
+
+            # ключ освобождён или воркер-владелец перестал продлевать аренду
+            if row is None or row.expired:
+                break
+            if row.status == "completed":
+                yield row.response_text
+                return
+            await asyncio.sleep(0.5)
+
+        yield "Предыдущая попытка не завершилась, отправь сообщение ещё раз.\n"
+
+
+idempotency = IdempotencyManager()
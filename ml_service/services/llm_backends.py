@@ -0,0 +1,124 @@
+"""
+Бэкенды LLM: общий интерфейс и детерминированная заглушка.
+
+Реализации:
+- HFClient (services/hf_gpt.py) — роутер HuggingFace;
+- OpenAICompatibleClient (там же) — любой сервер с /v1/chat/completions,
+  например llama.cpp или vLLM на CPU рядом с сервисом;
+- FakeLLMClient — ответ без сети, для тестов и бенчмарков.
+
+Какой бэкенд у какого профиля генерации (fast / strong), задаётся
+в настройках LLM_BACKEND / LLM_FAST_BACKEND (services/llm_router.py).
+
+Промпт — строка или готовый список сообщений (services/prompt.py).
+"""
+import asyncio
+import hashlib
+from collections import deque
+from typing import AsyncGenerator
+
+
+# сколько последних запросов держать для перцентилей
+LATENCY_WINDOW = 512
+
+
+def percentile(values, q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+class PromptCacheStats:
+    """
+    Сколько токенов промпта сервер модели взял из кэша префикса и время
+    до первого токена с попаданием в кэш и без (по usage в конце стрима).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.ttft_hit: deque = deque(maxlen=LATENCY_WINDOW)
+        self.ttft_miss: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, prompt_tokens: int | None, cached_tokens: int | None, ttft: float | None) -> None:
+        # бэкенд не сообщает о кэше — считать нечего
+        if cached_tokens is None:
+            return
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens or 0
+        self.cached_tokens += cached_tokens
+        if ttft is not None:
+            (self.ttft_hit if cached_tokens else self.ttft_miss).append(ttft)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "cached_share": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "ttft_hit_p50": percentile(self.ttft_hit, 0.5),
+            "ttft_miss_p50": percentile(self.ttft_miss, 0.5),
+        }
+
+
+class LLMBackend:
+    # Заглушки ask() при ошибке — их нельзя сохранять как настоящий ответ
+    BUSY_TEXT = "Сейчас я занят вычислениями, попробуй чуть позже."
+    EMPTY_TEXT = "Давай начнём с самых простых примеров и разберём их шаг за шагом."
+    FALLBACK_TEXTS = (BUSY_TEXT, EMPTY_TEXT)
+    # То же для ask_stream
+    STREAM_ERROR_TEXT = "Ошибка генерации ответа."
+    CONNECTION_ERROR_TEXT = "Ошибка соединения с моделью."
+    STREAM_ERROR_TEXTS = (STREAM_ERROR_TEXT, CONNECTION_ERROR_TEXT)
+
+    model: str
+
+    async def ask(self, prompt: str | list) -> str:
+        """Один абзац совета целиком"""
+        raise NotImplementedError
+
+    def ask_stream(self, prompt: str | list) -> AsyncGenerator[str, None]:
+        """Чистый текст ответа по кускам (без SSE и JSON)"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Счётчики бэкенда для /api/admin/models"""
+        return {}
+
+
+class FakeLLMClient(LLMBackend):
+    """
+    Детерминированный ответ без сети: один и тот же промпт — один и тот же
+    совет. delay_ms — пауза перед каждым чанком (имитация задержки модели).
+    """
+
+    ADVICE = (
+        "Начни с повторения основных определений по теме и реши пару простых задач.",
+        "Выдели полчаса в день на разбор ошибок из прошлых работ — это быстрее всего поднимает оценку.",
+        "Составь короткий конспект ключевых формул и проверь себя на задачах из последней контрольной.",
+        "Разбей подготовку на три коротких подхода и начни с темы, где было больше всего ошибок.",
+    )
+
+    def __init__(self, model: str = "fake", delay_ms: float = 0.0, chunk_words: int = 3):
+        self.model = model
+        self.delay = delay_ms / 1000
+        self.chunk_words = chunk_words
+
+    def answer(self, prompt: str | list) -> str:
+        if isinstance(prompt, list):
+            prompt = "\n".join(m["content"] for m in prompt)
+        digest = hashlib.blake2b(prompt.encode(), digest_size=4).digest()
+        return self.ADVICE[int.from_bytes(digest, "big") % len(self.ADVICE)]
+
+    async def ask(self, prompt: str | list) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.answer(prompt)
+
+    async def ask_stream(self, prompt: str | list) -> AsyncGenerator[str, None]:
+        words = self.answer(prompt).split(" ")
+        for i in range(0, len(words), self.chunk_words):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            chunk = " ".join(words[i:i + self.chunk_words])
+            yield chunk if i == 0 else " " + chunk
@@ -0,0 +1,207 @@
+"""
+Хеджирование стрима LLM.
+
+Если основной запрос не дал первого токена за задержку хеджирования
+(p95 времени до первого токена по последним запросам), тот же промпт
+уходит во второй эндпоинт или к другому провайдеру модели. Отдаётся
+поток, первым выдавший текст, проигравший отменяется. Число хеджей
+ограничено бюджетом: не больше LLM_HEDGE_BUDGET дополнительных запросов
+на один основной.
+
+Задержка считается по времени до первого токена основного потока. Если
+победил хедж, основной поток дочитывается до первого токена (и только
+тогда отменяется): иначе в выборку попадали бы самые быстрые ответы
+хеджа вместо медленного хвоста основного, и задержка сползала бы вниз.
+Если ответ хеджа закончился раньше, в выборку идёт прошедшее время —
+нижняя оценка, которая не меньше текущей задержки.
+
+Каждый поток читается в своей задаче и складывает чанки в общую очередь:
+генератор httpx целиком живёт в одной задаче, и отмена проигравшего —
+это просто cancel() его задачи.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator
+
+from loguru import logger
+
+from services.llm_backends import LATENCY_WINDOW, LLMBackend
+
+
+PRIMARY = "primary"
+SECONDARY = "secondary"
+
+# Маркер конца потока в очереди
+_END = object()
+
+# Сколько замеров нужно, прежде чем считать задержку по p95
+MIN_SAMPLES = 20
+# Сколько хеджей можно накопить про запас
+BUDGET_BURST = 5.0
+
+
+class HedgeBudget:
+    """Токен-бакет: каждый запрос добавляет ratio токена, хедж тратит один"""
+
+    def __init__(self, ratio: float, burst: float = BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def on_request(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class HedgedClient(LLMBackend):
+    """ask_stream основного бэкенда с хеджем во второй"""
+
+    def __init__(
+        self,
+        primary: LLMBackend,
+        secondary: LLMBackend,
+        delay: float,
+        min_delay: float,
+        percentile: float,
+        budget: float,
+    ):
+        self.primary = primary
+        self.secondary = secondary
+        self.model = primary.model
+        self.default_delay = delay
+        self.min_delay = min_delay
+        self.percentile = percentile
+        self.budget = HedgeBudget(budget)
+        # время до первого токена основного потока — от начала запроса
+        self.ttft: deque = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.hedged = 0
+        self.budget_denied = 0
+        self.wins = {PRIMARY: 0, SECONDARY: 0}
+        self.failures = 0
+
+    def hedge_delay(self) -> float:
+        if len(self.ttft) < MIN_SAMPLES:
+            return self.default_delay
+        ordered = sorted(self.ttft)
+        p = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+        return max(self.min_delay, p)
+
+    async def ask(self, prompt: str | list) -> str:
+        return await self.primary.ask(prompt)
+
+    @staticmethod
+    async def _pump(name: str, stream: AsyncIterator[str], queue: asyncio.Queue) -> None:
+        try:
+            async for chunk in stream:
+                await queue.put((name, chunk))
+        finally:
+            queue.put_nowait((name, _END))
+
+    async def ask_stream(self, prompt: str | list) -> AsyncIterator[str]:
+        self.requests += 1
+        self.budget.on_request()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: dict[str, asyncio.Task] = {}
+        done: set[str] = set()
+
+        def start(name: str, client: LLMBackend) -> None:
+            tasks[name] = asyncio.create_task(self._pump(name, client.ask_stream(prompt), queue))
+
+        def try_hedge() -> bool:
+            if not self.budget.try_acquire():
+                self.budget_denied += 1
+                return False
+            self.hedged += 1
+            logger.debug(f"Hedging LLM stream to {self.secondary.model}")
+            start(SECONDARY, self.secondary)
+            return True
+
+        started = time.monotonic()
+        deadline = started + self.hedge_delay()
+        start(PRIMARY, self.primary)
+        winner = None
+        error_text = None
+        primary_measured = False
+        try:
+            # ждём первый содержательный чанк от любого из потоков
+            while winner is None:
+                timeout = None
+                if SECONDARY not in tasks and deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    name, chunk = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    try_hedge()
+                    deadline = None
+                    continue
+
+                if chunk is _END or chunk in LLMBackend.STREAM_ERROR_TEXTS:
+                    # поток кончился или упал без текста — ждём другой
+                    if chunk is not _END:
+                        error_text = chunk
+                    done.add(name)
+                    if name == PRIMARY and SECONDARY not in tasks and deadline is not None:
+                        # основной упал до задержки — хедж работает как повтор
+                        deadline = None
+                        if try_hedge():
+                            continue
+                    if set(tasks) <= done:
+                        self.failures += 1
+                        if error_text:
+                            yield error_text
+                        return
+                    continue
+
+                if not chunk:
+                    continue
+
+                winner = name
+                self.wins[name] += 1
+                if winner == PRIMARY:
+                    self.ttft.append(time.monotonic() - started)
+                    primary_measured = True
+                    if SECONDARY in tasks:
+                        tasks[SECONDARY].cancel()
+                yield chunk
+
+            # дальше — только поток победителя; основной, если проиграл,
+            # ждём до его первого токена ради замера
+            while True:
+                name, chunk = await queue.get()
+                if name != winner:
+                    if chunk is _END or chunk in LLMBackend.STREAM_ERROR_TEXTS:
+                        done.add(name)
+                    elif chunk and not primary_measured:
+                        self.ttft.append(time.monotonic() - started)
+                        primary_measured = True
+                        tasks[PRIMARY].cancel()
+                    continue
+                if chunk is _END:
+                    return
+                yield chunk
+        finally:
+            if winner == SECONDARY and not primary_measured and PRIMARY not in done:
+                self.ttft.append(time.monotonic() - started)
+            for task in tasks.values():
+                task.cancel()
+
+    def stats(self) -> dict:
+        hedge = {
+            "secondary_model": self.secondary.model,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+            "budget_denied": self.budget_denied,
+            "wins": dict(self.wins),
+            "failures": self.failures,
+            "delay": round(self.hedge_delay(), 3),
+        }
+        return {**self.primary.stats(), "hedge": hedge}
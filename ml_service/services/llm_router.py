@@ -0,0 +1,144 @@
+"""
+Маршрутизация запросов между быстрой и сильной LLM.
+
+Короткий общий вопрос без истории уходит в LLM_FAST_MODEL (меньше время
+до первого токена), длинный промпт, долгая переписка или вопрос по
+содержанию («объясни», «реши», формулы) — в LLM_STRONG_MODEL.
+Классификация локальная, без обращения к моделям. Пока LLM_FAST_MODEL
+не задан, всё идёт в сильную модель.
+
+По каждому маршруту копятся счётчики задержки и качества
+(ошибки, пустые и оборванные ответы) — их видно в /api/admin/models.
+Сильная модель может хеджироваться вторым эндпоинтом (services/llm_hedging.py).
+Бэкенд каждого профиля (hf / openai / fake) — LLM_BACKEND и LLM_FAST_BACKEND.
+"""
+import time
+from collections import deque
+from typing import AsyncIterator, Dict
+
+from config import settings
+from services.advice import SPECIFIC_PATTERNS, normalize
+from services.hf_gpt import HFClient, OpenAICompatibleClient
+from services.llm_backends import LATENCY_WINDOW, FakeLLMClient, LLMBackend, percentile
+from services.prompt import prompt_length
+from services.llm_hedging import HedgedClient
+
+
+FAST = "fast"
+STRONG = "strong"
+
+def make_backend(kind: str, model: str, api_url: str | None = None) -> LLMBackend:
+    """hf — роутер HuggingFace, openai — OpenAI-совместимый сервер, fake — без сети"""
+    if kind == "hf":
+        return HFClient(model, api_url=api_url)
+    if kind == "openai":
+        return OpenAICompatibleClient(
+            model, api_url or settings.LLM_OPENAI_API_URL, settings.LLM_OPENAI_API_KEY
+        )
+    if kind == "fake":
+        return FakeLLMClient(model, delay_ms=settings.LLM_FAKE_DELAY_MS)
+    raise ValueError(f"Unknown LLM backend: {kind}")
+
+
+class RouteStats:
+    def __init__(self, model: str):
+        self.model = model
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.empty = 0
+        # клиент ушёл или генерацию вытеснили до конца ответа
+        self.aborted = 0
+        self.chars = 0
+        self.ttft: deque = deque(maxlen=LATENCY_WINDOW)
+        self.duration: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "requests": self.requests,
+            "completed": self.completed,
+            "errors": self.errors,
+            "empty": self.empty,
+            "aborted": self.aborted,
+            "avg_chars": round(self.chars / self.completed, 1) if self.completed else 0.0,
+            "ttft_p50": percentile(self.ttft, 0.5),
+            "ttft_p95": percentile(self.ttft, 0.95),
+            "duration_p50": percentile(self.duration, 0.5),
+            "duration_p95": percentile(self.duration, 0.95),
+        }
+
+
+class LLMRouter:
+    def __init__(self, fast_model: str, strong_model: str):
+        strong_backend = settings.LLM_BACKEND
+        fast_backend = settings.LLM_FAST_BACKEND or settings.LLM_BACKEND
+        self.clients: Dict[str, LLMBackend] = {STRONG: make_backend(strong_backend, strong_model)}
+        if settings.LLM_HEDGE_MODEL or settings.LLM_HEDGE_API_URL:
+            self.clients[STRONG] = HedgedClient(
+                self.clients[STRONG],
+                make_backend(
+                    strong_backend,
+                    settings.LLM_HEDGE_MODEL or strong_model,
+                    settings.LLM_HEDGE_API_URL or None,
+                ),
+                delay=settings.LLM_HEDGE_DELAY,
+                min_delay=settings.LLM_HEDGE_MIN_DELAY,
+                percentile=settings.LLM_HEDGE_PERCENTILE,
+                budget=settings.LLM_HEDGE_BUDGET,
+            )
+        if fast_model:
+            self.clients[FAST] = make_backend(fast_backend, fast_model)
+        self.routes = {route: RouteStats(client.model) for route, client in self.clients.items()}
+
+    def classify(self, question: str, prompt: str | list, history_messages: int = 0) -> str:
+        """fast или strong по длине промпта, типу вопроса и длине истории"""
+        if FAST not in self.clients:
+            return STRONG
+        if prompt_length(prompt) > settings.LLM_FAST_MAX_PROMPT_CHARS:
+            return STRONG
+        if history_messages > settings.LLM_FAST_MAX_HISTORY:
+            return STRONG
+        normalized = normalize(question)
+        if len(normalized.split()) > settings.LLM_FAST_MAX_QUESTION_WORDS:
+            return STRONG
+        if any(p.search(normalized) for p in SPECIFIC_PATTERNS):
+            return STRONG
+        return FAST
+
+    async def stream(self, route: str, prompt: str | list) -> AsyncIterator[str]:
+        """ask_stream выбранной модели со счётчиками маршрута"""
+        stats = self.routes[route]
+        stats.requests += 1
+        started = time.monotonic()
+        chars = 0
+        failed = finished = False
+        try:
+            async for chunk in self.clients[route].ask_stream(prompt):
+                if chunk in LLMBackend.STREAM_ERROR_TEXTS:
+                    failed = True
+                elif chars == 0 and chunk:
+                    stats.ttft.append(time.monotonic() - started)
+                chars += len(chunk)
+                yield chunk
+            finished = True
+        finally:
+            stats.duration.append(time.monotonic() - started)
+            if failed:
+                stats.errors += 1
+            elif not finished:
+                stats.aborted += 1
+            elif chars == 0:
+                stats.empty += 1
+            else:
+                stats.completed += 1
+                stats.chars += chars
+
+    def stats(self) -> dict:
+        result = {route: stats.to_dict() for route, stats in self.routes.items()}
+        for route, client in self.clients.items():
+            result[route].update(client.stats())
+        return result
+
+
+llm_router = LLMRouter(settings.LLM_FAST_MODEL, settings.LLM_STRONG_MODEL)
@@ -1,21 +1,159 @@
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Tuple
 import random
 
+import joblib
+import numpy as np
 
-def predict_topic_needs(features: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+from config import settings
+from services.batcher import MicroBatcher
+from services.model_registry import ModelRegistry
+from services.peer_index import peer_registry
+from services.topic_clusters import TopicClusterIndex
+from services.topic_features import TopicFeatures, columns_getter
+
+
+# Колонки, которые видит модель. Порядок фиксирован: его же использует обучение.
+# max_score не берём: в объединённых фичах он означает то оценку, то балл события
+FEATURE_COLUMNS: List[str] = [
+    "avg_score",
+    "min_score",
+    "total_works",
+    "fails",
+    "days_since_last_grade",
+    "days_until_event",
+    "is_test",
+    "is_exam",
+    "is_lab",
+    "is_control",
+    "is_final",
+]
+
+# Файл, который сервис грузил до появления реестра (запасной вариант)
+TOPIC_MODEL_FILE = "topic_needs.joblib"
+
+
+class TopicNeedModel:
     """
-    Принимает фичи по темам и возвращает:
-    - need_review: нужно ли повторить
-    - score: условная уверенность (0–1)
-    - cluster: псевдо-кластер (потом будет KMeans)
+    Обученный sklearn Pipeline (импьютер → скейлер → классификатор)
+    с вероятностью «тему нужно повторить».
+
+    Артефакт — словарь, сохранённый joblib.dump без сжатия:
+    {"pipeline", "feature_columns", "threshold", "version"}.
+    Загружается с mmap_mode="r": numpy-массивы не копируются в память
+    процесса, и воркеры uvicorn делят одни и те же страницы файла.
     """
 
+    def __init__(self, pipeline, feature_columns: List[str], threshold: float, version: str, path: str):
+        self.pipeline = pipeline
+        self.feature_columns = feature_columns
+        self.threshold = threshold
+        self.version = version
+        self.path = path
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, path: str) -> "TopicNeedModel":
+        artifact = joblib.load(path, mmap_mode="r")
+        return cls(
+            pipeline=artifact["pipeline"],
+            feature_columns=list(artifact.get("feature_columns", FEATURE_COLUMNS)),
+            threshold=float(artifact.get("threshold", 0.5)),
+            version=str(artifact.get("version", "unknown")),
+            path=path,
+        )
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Вероятность положительного класса для матрицы фич"""
+        return self.pipeline.predict_proba(X)[:, 1]
+
+
+topic_registry = ModelRegistry(
+    "topic_needs",
+    loader=TopicNeedModel.load,
+    legacy_file=TOPIC_MODEL_FILE,
+)
+
+
+def features_to_matrix(
+    features: List[TopicFeatures],
+    columns: List[str] = FEATURE_COLUMNS,
+) -> Tuple[List[str], np.ndarray]:
+    """Фичи по темам → (ключи тем, матрица float64 с NaN вместо None)"""
+    keys = [f.key for f in features]
+    getter = columns_getter(columns)
+    # None в массиве float64 становится NaN
+    X = np.array([getter(f) for f in features], dtype=np.float64).reshape(len(keys), len(columns))
+    return keys, X
+
+
+# Центроиды KMeans (training/train_topic_clusters.py); до первого обучения cluster = None
+cluster_registry = ModelRegistry("topic_clusters", loader=TopicClusterIndex.load)
+
+
+# Все реестры моделей воркера: lifespan обновляет их, /api/admin/models показывает
+model_registries = [topic_registry, cluster_registry, peer_registry]
+
+
+def models_version() -> str:
+    """Версии загруженных моделей одной строкой: с ними посчитаны ml_results и блок контекста"""
+    return ",".join(
+        f"{registry.name}:{registry.current.version if registry.current else '-'}"
+        for registry in model_registries
+    )
+
+
+def assign_clusters(features: List[TopicFeatures]) -> List[int | None]:
+    """Кластер состояния каждой темы — ближайший центроид"""
+    with cluster_registry.acquire() as index:
+        if index is None:
+            return [None] * len(features)
+        _, X = features_to_matrix(features, index.feature_columns)
+        return index.assign(X).tolist()
+
+
+topic_batcher = MicroBatcher(
+    lambda model, X: model.predict_proba(X),
+    max_rows=settings.INFERENCE_BATCH_MAX_ROWS,
+    window_ms=settings.INFERENCE_BATCH_WINDOW_MS,
+)
+
+
+def model_results(
+    model: TopicNeedModel,
+    keys: List[str],
+    proba: np.ndarray,
+    clusters: List[int | None],
+) -> Dict[str, Dict[str, Any]]:
+    return {
+        key: {
+            "need_review": bool(p >= model.threshold),
+            "score": round(float(p), 2),
+            "cluster": cluster,
+        }
+        for key, p, cluster in zip(keys, proba, clusters)
+    }
+
+
+def predict_with_model(
+    model: TopicNeedModel,
+    features: List[TopicFeatures],
+) -> Dict[str, Dict[str, Any]]:
+    keys, X = features_to_matrix(features, model.feature_columns)
+    if not keys:
+        return {}
+
+    # все темы студента — одним вызовом predict_proba
+    return model_results(model, keys, model.predict_proba(X), assign_clusters(features))
+
+
+def predict_with_heuristic(features: List[TopicFeatures]) -> Dict[str, Dict[str, Any]]:
     result = {}
 
-    for topic, data in features.items():
-        avg_score = data.get("avg_score")
-        fails = data.get("fails", 0)
-        days_until = data.get("days_until_event")
+    for data, cluster in zip(features, assign_clusters(features)):
+        avg_score = data.avg_score
+        fails = data.fails or 0
+        days_until = data.days_until_event
 
         # простая эвристика, без магии
         need_review = False
@@ -29,10 +167,42 @@ def predict_topic_needs(features: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[s
         if days_until is not None and days_until <= 3:
             need_review = True
 
-        result[topic] = {
+        result[data.key] = {
             "need_review": need_review,
             "score": round(random.uniform(0.3, 0.9), 2),
-            "cluster": random.randint(0, 2),
+            "cluster": cluster,
         }
 
     return result
+
+
+def predict_topic_needs(features: List[TopicFeatures]) -> Dict[str, Dict[str, Any]]:
+    """
+    Принимает фичи по темам и возвращает:
+    - need_review: нужно ли повторить
+    - score: условная уверенность (0–1)
+    - cluster: кластер состояния темы (KMeans, 0 — самые проблемные), None без центроидов
+
+    Если обученная модель загружена — скоринг ею, иначе эвристика.
+    """
+    with topic_registry.acquire() as model:
+        if model is not None:
+            return predict_with_model(model, features)
+
+    return predict_with_heuristic(features)
+
+
+async def predict_topic_needs_batched(features: List[TopicFeatures]) -> Dict[str, Dict[str, Any]]:
+    """
+    То же, что predict_topic_needs, но строки фич уходят в общий батч
+    с параллельными запросами (topic_batcher), а predict считается в потоке.
+    """
+    with topic_registry.acquire() as model:
+        if model is not None:
+            keys, X = features_to_matrix(features, model.feature_columns)
+            if not keys:
+                return {}
+            proba = await topic_batcher.submit(model, X)
+            return model_results(model, keys, proba, assign_clusters(features))
+
+    return predict_with_heuristic(features)
@@ -0,0 +1,164 @@
+"""
+Реестр версий моделей с горячей заменой без рестарта uvicorn.
+
+Версии лежат в MODEL_PATH/<name>/<version>/, какая из них активна —
+записано в таблице model_versions. Воркер периодически сверяется с
+таблицей, грузит новую версию в фоновом потоке и атомарно подменяет
+ссылку между запросами. Старая версия живёт, пока её держат запросы,
+начатые до замены (acquire()).
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import text
+
+from config import settings
+from db.session import AsyncSessionLocal
+
+
+ACTIVE_VERSION_SQL = text("""
+    SELECT version, path
+    FROM model_versions
+    WHERE name = :name AND is_active
+    ORDER BY activated_at DESC NULLS LAST
+    LIMIT 1
+""")
+
+
+def array_footprint(obj: Any, _seen: set | None = None) -> int:
+    """Сколько байт занимают numpy-массивы внутри объекта (эстиматора, индекса)"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(array_footprint(v, seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(array_footprint(v, seen) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return array_footprint(vars(obj), seen)
+    return 0
+
+
+class LoadedModel:
+    def __init__(self, version: str, path: str, model: Any, load_seconds: float):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.in_flight = 0
+
+    def status(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+            "in_flight": self.in_flight,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else None,
+            "array_bytes": array_footprint(self.model),
+        }
+
+
+class ModelRegistry:
+    def __init__(self, name: str, loader: Callable[[str], Any], legacy_file: str | None = None):
+        self.name = name
+        self.loader = loader
+        # файл, который грузился до появления реестра — запасной вариант
+        self.legacy_file = legacy_file
+        self.current: LoadedModel | None = None
+        self.retiring: list[LoadedModel] = []
+        self._lock = asyncio.Lock()
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Модель для одного запроса; после замены она доживёт до конца запроса"""
+        entry = self.current
+        if entry is None:
+            yield None
+            return
+
+        entry.in_flight += 1
+        try:
+            yield entry.model
+        finally:
+            entry.in_flight -= 1
+            if entry is not self.current and entry.in_flight == 0:
+                self._retire(entry)
+
+    def _retire(self, entry: LoadedModel) -> None:
+        if entry in self.retiring:
+            self.retiring.remove(entry)
+            logger.info(f"Model {self.name}:{entry.version} released")
+
+    async def _resolve_active(self) -> tuple[str, str] | None:
+        try:
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(ACTIVE_VERSION_SQL, {"name": self.name})).one_or_none()
+        except Exception as e:
+            logger.warning(f"Model registry lookup failed for {self.name}: {e}")
+            row = None
+
+        if row is not None:
+            return row.version, os.path.join(settings.MODEL_PATH, row.path)
+
+        if self.legacy_file:
+            path = os.path.join(settings.MODEL_PATH, self.legacy_file)
+            if os.path.exists(path):
+                return f"legacy-{int(os.path.getmtime(path))}", path
+
+        return None
+
+    async def refresh(self) -> bool:
+        """Сверить активную версию с реестром; при изменении загрузить и подменить"""
+        async with self._lock:
+            active = await self._resolve_active()
+            if active is None:
+                return False
+
+            version, path = active
+            if self.current is not None and self.current.version == version:
+                return False
+
+            started = time.perf_counter()
+            try:
+                # загрузка (joblib, mmap) — в потоке, чтобы не стопорить стримы
+                model = await asyncio.to_thread(self.loader, path)
+            except Exception as e:
+                logger.error(f"Failed to load {self.name}:{version} from {path}: {e}")
+                return False
+
+            entry = LoadedModel(version, path, model, time.perf_counter() - started)
+            previous, self.current = self.current, entry
+
+            if previous is not None:
+                if previous.in_flight:
+                    self.retiring.append(previous)
+                logger.info(f"Model {self.name} swapped {previous.version} -> {version}")
+            else:
+                logger.info(f"Model {self.name}:{version} loaded in {entry.load_seconds:.2f}s")
+            return True
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(settings.MODEL_REGISTRY_POLL_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Model registry refresh failed for {self.name}: {e}")
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "active": self.current.status() if self.current else None,
+            "retiring": [entry.status() for entry in self.retiring],
+        }
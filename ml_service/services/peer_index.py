@@ -0,0 +1,142 @@
+"""
+«Студенты как ты»: поиск соседей по профилю оценок тем.
+
+Офлайн (training/build_peer_index.py) по каждому студенту строится вектор
+средних оценок по самым частым темам на дату среза и прирост оценки по этим
+темам после среза. Векторы стандартизуются, сжимаются PCA до нескольких
+компонент и раскладываются по спискам грубого KMeans (IVF): запрос
+перебирает только nprobe ближайших списков. BallTree в десятках измерений
+вырождается в перебор, а IVF даёт сотни микросекунд при recall ~0.95.
+Артефакт — только массивы NumPy, грузится через mmap, и по k ближайшим соседям собирает короткую
+подсказку: какие темы похожие студенты потом подтянули. В Django за этим
+не ходим — всё уже в индексе.
+"""
+from typing import Dict, List
+
+import joblib
+import numpy as np
+
+from config import settings
+from services.model_registry import ModelRegistry
+from services.topic_features import TopicFeatures
+
+
+class PeerIndex:
+    def __init__(
+        self,
+        topics: List[str],
+        fill: np.ndarray,
+        scale: np.ndarray,
+        components: np.ndarray | None,
+        center: np.ndarray | None,
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        points: np.ndarray,
+        gains: np.ndarray,
+        nprobe: int,
+        min_topics: int,
+        improved_gain: float,
+        version: str,
+    ):
+        self.topics = topics
+        self.columns: Dict[str, int] = {key: i for i, key in enumerate(topics)}
+        self.fill = np.asarray(fill, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        # проекция PCA: y = (z - center) @ components.T
+        self.components = None if components is None else np.asarray(components, dtype=np.float64)
+        self.center = None if center is None else np.asarray(center, dtype=np.float64)
+        # списки IVF: точки списка l — points[offsets[l]:offsets[l + 1]]
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroid_norms = (self.centroids ** 2).sum(axis=1)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.points = points
+        self.point_norms = (np.asarray(points, dtype=np.float32) ** 2).sum(axis=1)
+        # прирост средней соседа по теме после среза (NaN — нет данных),
+        # строки в том же порядке, что points
+        self.gains = gains
+        self.nprobe = min(nprobe, len(self.centroids))
+        self.min_topics = min_topics
+        self.improved_gain = improved_gain
+        self.version = version
+
+    @classmethod
+    def load(cls, path: str) -> "PeerIndex":
+        artifact = joblib.load(path, mmap_mode="r")
+        return cls(
+            topics=list(artifact["topics"]),
+            fill=artifact["fill"],
+            scale=artifact["scale"],
+            components=artifact.get("components"),
+            center=artifact.get("center"),
+            centroids=artifact["centroids"],
+            offsets=artifact["offsets"],
+            points=artifact["points"],
+            gains=artifact["gains"],
+            nprobe=int(artifact.get("nprobe", 8)),
+            min_topics=int(artifact.get("min_topics", 3)),
+            improved_gain=float(artifact.get("improved_gain", 0.5)),
+            version=str(artifact.get("version", "unknown")),
+        )
+
+    def profile(self, features: List[TopicFeatures]) -> np.ndarray | None:
+        """Вектор средних оценок студента по темам индекса (None — мало общих тем)"""
+        vector = np.full(len(self.topics), np.nan)
+        for f in features:
+            column = self.columns.get(f.key)
+            if column is not None and f.avg_score is not None:
+                vector[column] = f.avg_score
+        if np.count_nonzero(~np.isnan(vector)) < self.min_topics:
+            return None
+        return vector
+
+    def neighbours(self, vector: np.ndarray, k: int) -> np.ndarray:
+        """Индексы (строки points/gains) k приближённо ближайших соседей"""
+        # пропуски → среднее по теме, т.е. 0 после стандартизации
+        z = (np.where(np.isnan(vector), self.fill, vector) - self.fill) / self.scale
+        if self.components is not None:
+            z = (z - self.center) @ self.components.T
+        z = z.astype(np.float32)
+
+        lists = np.argpartition(self.centroid_norms - 2 * (self.centroids @ z), self.nprobe - 1)[:self.nprobe]
+        candidates = np.concatenate([
+            np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists
+        ])
+        # ||p - z||² без ||z||², он одинаков для всех кандидатов
+        distances = self.point_norms[candidates] - 2 * (self.points[candidates] @ z)
+        k = min(k, len(candidates))
+        if k == 0:
+            return candidates
+        return candidates[np.argpartition(distances, k - 1)[:k]]
+
+    def hint(self, features: List[TopicFeatures], k: int, limit: int = 2) -> str | None:
+        vector = self.profile(features)
+        if vector is None:
+            return None
+
+        gains = np.asarray(self.gains[self.neighbours(vector, k)], dtype=np.float64)
+        improved = np.nan_to_num(gains, nan=-np.inf) >= self.improved_gain
+        counts = improved.sum(axis=0)
+
+        # только темы, где у самого студента средняя ниже 4
+        weak = np.nan_to_num(vector, nan=np.inf) < 4
+        candidates = np.flatnonzero(weak & (counts > 0))
+        if len(candidates) == 0:
+            return None
+
+        best = candidates[np.argsort(-counts[candidates], kind="stable")][:limit]
+        parts = [
+            f"{self.topics[c]} (+{np.nanmean(gains[improved[:, c], c]):.1f} балла у {counts[c]} из {len(gains)})"
+            for c in best
+        ]
+        return "Студенты с похожими оценками позже подтянули: " + "; ".join(parts) + "."
+
+
+peer_registry = ModelRegistry("peer_index", loader=PeerIndex.load)
+
+
+def peer_hint(features: List[TopicFeatures]) -> str | None:
+    """Подсказка по соседям для build_student_context (None — индекса нет или мало данных)"""
+    with peer_registry.acquire() as index:
+        if index is None:
+            return None
+        return index.hint(features, settings.PEER_INDEX_K)
@@ -0,0 +1,53 @@
+"""
+Чтение того, что заранее посчитал training/precompute_upcoming.py.
+
+Задача (раз в час в течение дня) считает фичи, результаты модели и
+постоянный блок данных студента (services/prompt.py) для студентов
+с контрольными и экзаменами в ближайшие дни и кладёт их в
+student_precomputed. При промахе кэша фич (services/feature_cache.py)
+воркер сначала смотрит туда: запрос по ключу в своей БД вместо двух
+походов в Core API, инференса и сборки контекста.
+
+Запись старше STUDENT_PRECOMPUTED_MAX_AGE не используется: свежесть
+нельзя сверить с Django без того же похода в Core API, поэтому
+устаревание ограничено возрастом записи.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from config import settings
+from db.models.student_precomputed import StudentPrecomputed
+from db.session import AsyncSessionLocal
+from services.ml_model import models_version
+from services.topic_features import TopicFeatures
+
+
+class PrecomputedContext:
+    """ml_results и постоянный блок контекста, посчитанные вместе с фичами"""
+
+    __slots__ = ("ml_results", "student_context", "model_version")
+
+    def __init__(self, ml_results: Dict[str, Dict[str, Any]], student_context: str, model_version: str):
+        self.ml_results = ml_results
+        self.student_context = student_context
+        self.model_version = model_version
+
+    @property
+    def current(self) -> bool:
+        """Посчитано теми же моделями, что загружены сейчас (после замены — считаем заново)"""
+        return self.model_version == models_version()
+
+
+async def load_precomputed(user_id: uuid.UUID) -> tuple[List[TopicFeatures], PrecomputedContext] | None:
+    """Непросроченная и не слишком старая запись студента или None"""
+    async with AsyncSessionLocal() as db:
+        row = await db.get(StudentPrecomputed, user_id)
+    if row is None:
+        return None
+    now = datetime.now(timezone.utc)
+    max_age = timedelta(seconds=settings.STUDENT_PRECOMPUTED_MAX_AGE)
+    if row.expires_at <= now or row.computed_at + max_age <= now:
+        return None
+    features = [TopicFeatures.from_dict(data) for data in row.features]
+    return features, PrecomputedContext(row.ml_results, row.student_context, row.model_version)
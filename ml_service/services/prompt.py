@@ -0,0 +1,130 @@
+"""
+Промпт как список сообщений в порядке, удобном для кэша префикса у провайдера.
+
+    system:    постоянная инструкция + данные студента
+    user/...:  история чата (только дописывается)
+    user:      вопрос и темы, связанные с ним
+
+Всё, что зависит от вопроса, стоит в последнем сообщении, а блок данных
+студента зависит только от его фич (срочные темы и темы «повторить», без
+ранжирования по вопросу). В истории вопрос записан без тем, связанных
+с ним, поэтому промпт прошлого хода остаётся префиксом нового целиком,
+кроме этого хвоста, и сервер модели переиспользует его KV-кэш. Окно
+истории (history_window) сдвигается блоками, а не на каждом ходу.
+"""
+from typing import Any, Dict, List
+
+from services.student_context import build_student_context
+from services.topic_features import TopicFeatures
+from services.topic_relevance import TopicIndex, is_urgent
+
+
+SYSTEM_PROMPT = (
+    "Ты — поддерживающий AI-репетитор. "
+    "Дай короткий, полезный совет студенту. "
+    "Один абзац, на русском, сразу к делу. "
+    "Можно использовать Markdown.\n"
+    "Напиши один совет (30-50 слов) для этого студента на русском языке. "
+    "Совет должен быть конкретным и мотивирующим. "
+    "Если данных по другим предметам нет, опирайся только на то, что известно."
+)
+
+
+def stable_topics(
+    features: List[TopicFeatures],
+    ml_results: Dict[str, Dict[str, Any]],
+    k: int,
+    urgent_days: int,
+) -> List[TopicFeatures]:
+    """
+    Темы постоянного блока: все срочные и первые k «повторить» в исходном
+    порядке. От вопроса не зависят (k <= 0 — все темы).
+    """
+    if k <= 0:
+        return features
+    chosen, review = [], 0
+    for f in features:
+        if is_urgent(f, urgent_days):
+            chosen.append(f)
+        elif review < k and ml_results.get(f.key, {}).get("need_review"):
+            chosen.append(f)
+            review += 1
+    return chosen
+
+
+def student_blocks(
+    features: List[TopicFeatures],
+    ml_results: Dict[str, Dict[str, Any]],
+    index: TopicIndex,
+    message: str,
+    peer_hint: str | None,
+    k: int,
+    urgent_days: int,
+    stable_context: str | None = None,
+) -> tuple[str, str]:
+    """
+    (постоянный блок данных студента, темы, связанные с вопросом).
+    stable_context — постоянный блок, собранный заранее из тех же фич
+    и ml_results (student_precomputed): тогда он не собирается заново.
+    """
+    stable = stable_topics(features, ml_results, k, urgent_days)
+    in_stable = {id(f) for f in stable}
+    related = [f for f in index.relevant(message, k) if id(f) not in in_stable]
+    if stable_context is None:
+        stable_context = build_student_context(stable, ml_results, peer_hint)
+    return stable_context, build_student_context(related, ml_results)
+
+
+def history_start(total: int, max_turns: int) -> int:
+    """
+    С какого хода начинается окно истории из total ходов. Старые ходы
+    отбрасываются блоками по max_turns // 2: начало истории, а с ним и
+    префикс промпта, меняется раз в несколько ходов, а не на каждом.
+    В окне не больше max_turns ходов.
+    """
+    if max_turns <= 0 or total <= max_turns:
+        return 0
+    step = max(1, max_turns // 2)
+    return (total - max_turns + step - 1) // step * step
+
+
+def history_window(history: List[tuple], max_turns: int) -> List[tuple]:
+    """Последние ходы чата для промпта (см. history_start)"""
+    return history[history_start(len(history), max_turns):]
+
+
+def build_messages(
+    student_context: str,
+    question: str,
+    related_context: str = "",
+    history: List[tuple[str | None, str | None]] = (),
+) -> List[Dict[str, str]]:
+    """history — пары (вопрос, ответ) до текущего вопроса, от старых к новым"""
+    messages = [{
+        "role": "system",
+        "content": f"{SYSTEM_PROMPT}\n\nИнформация о студенте:\n{student_context}",
+    }]
+    for user_message, ai_response in history:
+        if user_message:
+            messages.append({"role": "user", "content": question_text(user_message)})
+        if ai_response:
+            messages.append({"role": "assistant", "content": ai_response})
+
+    # темы — после вопроса: в истории следующего хода вопрос записан так же
+    # (без тем), и префиксом нового промпта остаётся всё, кроме них
+    content = question_text(question)
+    if related_context:
+        content += f"\n\nТемы, связанные с вопросом: {related_context}"
+    messages.append({"role": "user", "content": content})
+    return messages
+
+
+def question_text(question: str) -> str:
+    return f'Вопрос студента:\n"{question}"'
+
+
+def prompt_length(prompt: str | List[Dict[str, str]]) -> int:
+    """Длина промпта в символах (строка или список сообщений)"""
+    if isinstance(prompt, str):
+        return len(prompt)
+    return sum(len(m["content"]) for m in prompt)
@@ -0,0 +1,42 @@
+from typing import Any, Dict, List
+
+from services.topic_features import TopicFeatures
+
+
+def build_student_context(
+    features: List[TopicFeatures],
+    ml_results: Dict[str, Dict[str, Any]],
+    peer_hint: str | None = None,
+) -> str:
+    parts = []
+
+    for data in features:
+        avg = data.avg_score
+        fails = data.fails
+        days = data.days_until_event
+        is_test = data.is_test
+        is_exam = data.is_exam
+
+        line = f"Тема: {data.key}. "
+        if avg is not None:
+            line += f"Средняя оценка {avg}. "
+        if fails:
+            line += f"Провалов {fails}. "
+        if days is not None:
+            if is_exam:
+                line += f"Экзамен через {days} дней. "
+            elif is_test:
+                line += f"Контрольная через {days} дней. "
+
+        parts.append(line)
+
+    # только по темам, попавшим в промпт
+    for data in features:
+        ml = ml_results.get(data.key)
+        if ml and ml.get("need_review"):
+            parts.append(f"По теме {data.key} модель советует повторить материал.")
+
+    if peer_hint:
+        parts.append(peer_hint)
+
+    return " ".join(parts)
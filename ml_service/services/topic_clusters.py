@@ -0,0 +1,59 @@
+"""
+Назначение кластера состояния темы по ближайшему центроиду.
+
+Центроиды считает офлайн training/train_topic_clusters.py; здесь только
+NumPy: пропуски → медианы, стандартизация и argmin квадрата расстояния
+до k центроидов (матрица k × d из нескольких строк).
+"""
+from typing import Any, Dict, List
+
+import joblib
+import numpy as np
+
+
+class TopicClusterIndex:
+    def __init__(
+        self,
+        fill: np.ndarray,
+        mean: np.ndarray,
+        scale: np.ndarray,
+        centroids: np.ndarray,
+        feature_columns: List[str],
+        profiles: List[Dict[str, Any]],
+        version: str,
+    ):
+        self.fill = np.asarray(fill, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        # ||c||² считаем один раз при загрузке
+        self.centroid_norms = (self.centroids ** 2).sum(axis=1)
+        self.feature_columns = feature_columns
+        self.profiles = profiles
+        self.version = version
+
+    @classmethod
+    def load(cls, path: str) -> "TopicClusterIndex":
+        artifact = joblib.load(path, mmap_mode="r")
+        return cls(
+            fill=artifact["fill"],
+            mean=artifact["mean"],
+            scale=artifact["scale"],
+            centroids=artifact["centroids"],
+            feature_columns=list(artifact["feature_columns"]),
+            profiles=list(artifact.get("profiles", [])),
+            version=str(artifact.get("version", "unknown")),
+        )
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.centroids)
+
+    def assign(self, X: np.ndarray) -> np.ndarray:
+        """Номер ближайшего центроида для каждой строки X (NaN — пропуск)"""
+        if len(X) == 0:
+            return np.empty(0, dtype=np.int64)
+        Z = (np.where(np.isnan(X), self.fill, X) - self.mean) / self.scale
+        # ||z - c||² = ||z||² - 2 z·c + ||c||²; ||z||² на argmin не влияет
+        distances = self.centroid_norms - 2.0 * (Z @ self.centroids.T)
+        return distances.argmin(axis=1)
@@ -0,0 +1,153 @@
+"""
+Компактные фичи по темам.
+
+Вместо словаря из ~20 строковых ключей на тему — объект со __slots__,
+а названия предметов и тем хранятся один раз на процесс в словаре
+vocabulary и в фичах представлены целыми id. Так фичи дёшево держать
+в кэше по пользователям (services/feature_cache.py).
+"""
+import sys
+from operator import attrgetter
+from typing import Any, Dict, List
+
+
+class Vocabulary:
+    """Интернированные названия предметов и тем ↔ целые id (на процесс)"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+
+    def id(self, name: str) -> int:
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name = sys.intern(name)
+            name_id = len(self._names)
+            self._ids[name] = name_id
+            self._names.append(name)
+        return name_id
+
+    def name(self, name_id: int) -> str:
+        return self._names[name_id]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+# Названия предметов и тем — конечный набор из учебного плана,
+# поэтому словарь не чистится
+vocabulary = Vocabulary()
+
+
+# Поля из оценок (extract_grade_features)
+GRADE_FIELDS = (
+    "avg_score",
+    "min_score",
+    "max_score",
+    "total_works",
+    "fails",
+    "days_since_last_grade",
+)
+
+# Поля из расписания (extract_schedule_features); max_score события
+# хранится отдельно от максимальной оценки
+SCHEDULE_FIELDS = (
+    "weekday",
+    "starts_at_min",
+    "ends_at_min",
+    "teacher_department",
+    "is_test",
+    "is_exam",
+    "is_lab",
+    "is_control",
+    "is_final",
+    "days_until_event",
+)
+
+
+class TopicFeatures:
+    """
+    Фичи одной темы студента. Поля, которых нет в источнике
+    (например, оценки по теме без оценок), равны None.
+    """
+
+    __slots__ = ("subject_id", "topic_id", "event_max_score") + GRADE_FIELDS + SCHEDULE_FIELDS
+
+    def __init__(self, subject_id: int, topic_id: int):
+        self.subject_id = subject_id
+        self.topic_id = topic_id
+        self.event_max_score = None
+        for field in GRADE_FIELDS + SCHEDULE_FIELDS:
+            setattr(self, field, None)
+
+    @classmethod
+    def from_parts(
+        cls,
+        subject: str,
+        topic: str,
+        grade: Dict[str, Any] | None = None,
+        schedule: Dict[str, Any] | None = None,
+    ) -> "TopicFeatures":
+        """Собрать тему из словарей extract_grade_features / extract_schedule_features"""
+        features = cls(vocabulary.id(subject), vocabulary.id(topic))
+        if grade:
+            for field in GRADE_FIELDS:
+                setattr(features, field, grade.get(field))
+        if schedule:
+            for field in SCHEDULE_FIELDS:
+                setattr(features, field, schedule.get(field))
+            features.event_max_score = schedule.get("max_score")
+        return features
+
+    @property
+    def subject(self) -> str:
+        return vocabulary.name(self.subject_id)
+
+    @property
+    def topic(self) -> str:
+        return vocabulary.name(self.topic_id)
+
+    @property
+    def key(self) -> str:
+        """Ключ темы в промпте и в результатах модели"""
+        return f"{self.subject} :: {self.topic}"
+
+    def __getstate__(self):
+        # id из vocabulary действительны только в этом процессе,
+        # поэтому в другой процесс (cpu_executor) уходят названия
+        values = tuple(getattr(self, field) for field in GRADE_FIELDS + SCHEDULE_FIELDS)
+        return self.subject, self.topic, self.event_max_score, values
+
+    def __setstate__(self, state):
+        subject, topic, self.event_max_score, values = state
+        self.subject_id = vocabulary.id(subject)
+        self.topic_id = vocabulary.id(topic)
+        for field, value in zip(GRADE_FIELDS + SCHEDULE_FIELDS, values):
+            setattr(self, field, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"subject": self.subject, "topic": self.topic}
+        for field in GRADE_FIELDS + SCHEDULE_FIELDS:
+            data[field] = getattr(self, field)
+        data["event_max_score"] = self.event_max_score
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TopicFeatures":
+        """Обратно из to_dict (фичи, сохранённые в student_precomputed)"""
+        features = cls(vocabulary.id(data["subject"]), vocabulary.id(data["topic"]))
+        for field in GRADE_FIELDS + SCHEDULE_FIELDS:
+            setattr(features, field, data.get(field))
+        features.event_max_score = data.get("event_max_score")
+        return features
+
+    def __repr__(self) -> str:
+        return f"TopicFeatures({self.key!r})"
+
+
+def columns_getter(columns: List[str]):
+    """Функция TopicFeatures → кортеж значений колонок (для матрицы фич)"""
+    getter = attrgetter(*columns)
+    if len(columns) == 1:
+        return lambda features: (getter(features),)
+    return getter
@@ -0,0 +1,81 @@
+"""
+Выбор тем студента, релевантных вопросу, — чтобы не класть в промпт все темы
+(см. services/prompt.py).
+
+TopicIndex — TF-IDF по символьным 3-граммам названий предмета и темы
+(опечатки и падежи «интеграл»/«интегралам» дают общие n-граммы).
+Индекс строится один раз на пользователя, когда фичи попадают в кэш
+(services/feature_cache.py), и живёт вместе с ними.
+"""
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from services.topic_features import TopicFeatures
+
+
+NGRAM = 3
+
+
+def char_ngrams(text: str) -> Counter:
+    """Символьные n-граммы слов с границами: «тема» → « те», «тем», «ема», «ма »"""
+    grams: Counter = Counter()
+    for word in text.lower().replace("ё", "е").split():
+        word = f" {word} "
+        for i in range(len(word) - NGRAM + 1):
+            grams[word[i:i + NGRAM]] += 1
+    return grams
+
+
+def is_urgent(features: TopicFeatures, urgent_days: int) -> bool:
+    """Контрольная или экзамен по теме в ближайшие urgent_days дней"""
+    has_event = features.is_exam or features.is_test or features.is_control or features.is_final
+    days = features.days_until_event
+    return bool(has_event) and days is not None and 0 <= days <= urgent_days
+
+
+class TopicIndex:
+    def __init__(self, features: List[TopicFeatures]):
+        self.features = features
+
+        docs = [char_ngrams(f"{f.subject} {f.topic}") for f in features]
+        df = Counter(gram for doc in docs for gram in doc)
+        n = len(docs)
+        self.idf = {gram: math.log((1 + n) / (1 + count)) + 1 for gram, count in df.items()}
+
+        # обратный индекс n-грамма → [(номер темы, нормированный вес)]
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+        for i, doc in enumerate(docs):
+            weights = {gram: tf * self.idf[gram] for gram, tf in doc.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for gram, w in weights.items():
+                self.postings[gram].append((i, w / norm))
+
+    def scores(self, message: str) -> List[float]:
+        """Косинусная близость вопроса к каждой теме (в порядке features)"""
+        scores = [0.0] * len(self.features)
+        query = {
+            gram: tf * self.idf[gram]
+            for gram, tf in char_ngrams(message).items()
+            if gram in self.idf
+        }
+        norm = math.sqrt(sum(w * w for w in query.values()))
+        if not norm:
+            return scores
+        for gram, qw in query.items():
+            for i, w in self.postings[gram]:
+                scores[i] += qw / norm * w
+        return scores
+
+    def relevant(self, message: str, k: int) -> List[TopicFeatures]:
+        """До k тем, близких к вопросу (с ненулевой близостью), в исходном порядке"""
+        if k <= 0:
+            return []
+        scores = self.scores(message)
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score > 0),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+        chosen = set(ranked[:k])
+        return [f for i, f in enumerate(self.features) if i in chosen]
@@ -0,0 +1,193 @@
+"""
+Индекс «студенты как ты» для services/peer_index.py.
+
+Колонки — --topics самых массовых тем (по числу студентов с оценками).
+Для каждого студента: взвешенная средняя по теме до даты среза
+(сейчас минус --horizon-days) и прирост средней после среза. Профили
+«до среза» стандартизуются, сжимаются PCA до --components измерений
+(оценки по темам сильно коррелируют) и раскладываются по --lists спискам
+MiniBatchKMeans (IVF). Приросты хранятся в том же порядке, чтобы по
+соседям сказать, какие темы они подтянули.
+
+Запуск из ml_service/:
+
+    python -m training.build_peer_index --topics 64 --horizon-days 60 --activate
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from loguru import logger
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+
+from config import settings
+from training.registry import register_version
+from training.train_topic_model import iter_student_chunks, save_version
+
+
+MODEL_NAME = "peer_index"
+MODELS_DIR = os.path.join(settings.MODEL_PATH, MODEL_NAME)
+
+TOP_TOPICS_SQL = """
+SELECT trim(subj.title) AS subject, trim(g.topic) AS topic, count(DISTINCT g.student_id) AS students
+FROM grades_grade g
+JOIN core_subject subj ON subj.id = g.subject_id
+WHERE trim(g.topic) <> '' AND g.value IS NOT NULL
+GROUP BY 1, 2
+ORDER BY students DESC
+LIMIT %(limit)s
+"""
+
+
+def top_topics(conn, limit: int) -> list[str]:
+    with conn.cursor() as cur:
+        cur.execute(TOP_TOPICS_SQL, {"limit": limit})
+        # тот же ключ, что TopicFeatures.key
+        return [f"{subject} :: {topic}" for subject, topic, _ in cur.fetchall()]
+
+
+def student_profiles(df: pd.DataFrame, columns: dict[str, int], cutoff: pd.Timestamp) -> tuple[np.ndarray, np.ndarray]:
+    """Порция оценок → (средние до среза, средние после) формы (студенты × темы)"""
+    key = df["subject"] + " :: " + df["topic"]
+    column = key.map(columns)
+    value = df["value"].astype(np.float64)
+    weight = df["weight"].astype(np.float64)
+    keep = column.notna() & value.notna()
+
+    frame = pd.DataFrame({
+        "student_id": df["student_id"][keep],
+        "column": column[keep].astype(np.int64),
+        "after": (pd.to_datetime(df["work_date"][keep]) > cutoff),
+        "vw": (value * weight)[keep],
+        "w": weight[keep],
+    })
+    sums = frame.groupby(["after", "student_id", "column"]).agg(vw=("vw", "sum"), w=("w", "sum"))
+    avg = (sums["vw"] / sums["w"]).where(sums["w"] > 0)
+
+    students = pd.Index(frame["student_id"].unique())
+    shape = (len(students), len(columns))
+    before, after = np.full(shape, np.nan), np.full(shape, np.nan)
+    for is_after, target in ((False, before), (True, after)):
+        if is_after not in avg.index.get_level_values(0):
+            continue
+        part = avg.xs(is_after, level="after")
+        rows = students.get_indexer(part.index.get_level_values("student_id"))
+        target[rows, part.index.get_level_values("column").to_numpy()] = part.to_numpy()
+    return before, after
+
+
+def build(args) -> str:
+    started = time.time()
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    cutoff = pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=args.horizon_days))
+
+    conn = psycopg2.connect(settings.DJANGO_DATABASE_DSN)
+    try:
+        topics = top_topics(conn, args.topics)
+        columns = {key: i for i, key in enumerate(topics)}
+
+        befores, afters = [], []
+        for df in iter_student_chunks(conn, None, args.chunk_size):
+            before, after = student_profiles(df, columns, cutoff)
+            befores.append(before)
+            afters.append(after)
+    finally:
+        conn.close()
+
+    if not befores:
+        raise SystemExit("Нет данных для индекса")
+
+    before = np.vstack(befores)
+    after = np.vstack(afters)
+    # в индекс попадают студенты, у которых до среза достаточно общих тем
+    enough = np.count_nonzero(~np.isnan(before), axis=1) >= args.min_topics
+    before, after = before[enough], after[enough]
+    if len(before) == 0:
+        raise SystemExit("Нет студентов с достаточной историей")
+
+    fill = np.nan_to_num(np.nanmean(before, axis=0), nan=0.0)
+    scale = np.nan_to_num(np.nanstd(before, axis=0), nan=1.0)
+    scale[scale == 0] = 1.0
+    Z = (np.where(np.isnan(before), fill, before) - fill) / scale
+
+    components = center = None
+    explained = 1.0
+    if 0 < args.components < Z.shape[1]:
+        pca = PCA(n_components=args.components, random_state=42).fit(Z)
+        components, center = pca.components_, pca.mean_
+        explained = float(pca.explained_variance_ratio_.sum())
+        Z = pca.transform(Z)
+
+    n_lists = max(1, min(args.lists, len(Z) // 20))
+    coarse = MiniBatchKMeans(n_clusters=n_lists, n_init=3, batch_size=4096, random_state=42).fit(Z)
+    # точки одного списка лежат подряд
+    order = np.argsort(coarse.labels_, kind="stable")
+    offsets = np.r_[0, np.cumsum(np.bincount(coarse.labels_, minlength=n_lists))]
+    points = np.ascontiguousarray(Z[order], dtype=np.float32)
+    gains = np.ascontiguousarray((after - before)[order], dtype=np.float32)
+
+    metrics = {
+        "version": version,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "cutoff": cutoff.isoformat(),
+        "students": int(len(Z)),
+        "topics": len(topics),
+        "components": int(Z.shape[1]),
+        "explained_variance": round(explained, 4),
+        "lists": n_lists,
+        "students_with_gain": int(np.count_nonzero((np.nan_to_num(gains, nan=0) >= args.improved_gain).any(axis=1))),
+        "duration_sec": round(time.time() - started, 1),
+    }
+    artifact = {
+        "topics": topics,
+        "fill": fill,
+        "scale": scale,
+        "components": components,
+        "center": center,
+        "centroids": coarse.cluster_centers_.astype(np.float32),
+        "offsets": offsets,
+        "points": points,
+        "gains": gains,
+        "nprobe": args.nprobe,
+        "min_topics": args.min_topics,
+        "improved_gain": args.improved_gain,
+        "version": version,
+    }
+    path = save_version(version, artifact, metrics, models_dir=MODELS_DIR)
+    logger.info(f"Saved peer index {version} to {path}: {json.dumps(metrics)}")
+
+    register_version(
+        MODEL_NAME,
+        version,
+        os.path.join(MODEL_NAME, version, "model.joblib"),
+        metrics,
+        activate=args.activate,
+    )
+    if args.activate:
+        logger.info(f"Activated peer index {version}")
+
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Индекс похожих студентов")
+    parser.add_argument("--topics", type=int, default=64, help="сколько самых массовых тем брать в профиль")
+    parser.add_argument("--horizon-days", type=int, default=60, help="сколько дней после среза смотреть прирост")
+    parser.add_argument("--min-topics", type=int, default=3, help="минимум тем с оценками в профиле")
+    parser.add_argument("--improved-gain", type=float, default=0.5, help="какой прирост средней считать улучшением")
+    parser.add_argument("--components", type=int, default=8, help="размерность после PCA (0 — без PCA)")
+    parser.add_argument("--lists", type=int, default=256, help="списков IVF")
+    parser.add_argument("--nprobe", type=int, default=8, help="сколько списков перебирать на запрос")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--activate", action="store_true", help="сделать новую версию активной")
+    build(parser.parse_args())
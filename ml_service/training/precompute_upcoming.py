@@ -0,0 +1,281 @@
+"""
+Расчёт фич и контекста заранее для студентов с близкими контрольными.
+
+Берёт из Django студентов, у групп которых в ближайшие --horizon-days дней
+контрольная, тест, экзамен или итоговая работа (due_date), и для каждого
+считает то же, что воркер на холодном пути /message: фичи по темам
+(build_topic_features по оценкам и расписанию в форме ответов Core API),
+результаты модели и постоянный блок данных студента для промпта.
+Результат — в таблицу student_precomputed; воркер читает её при промахе
+кэша фич (services/precomputed.py), и в часы пик чат не ходит в Core API.
+
+Запись живёт --ttl-hours (по умолчанию STUDENT_PRECOMPUTED_MAX_AGE,
+2 часа) и не дольше конца дня (days_until_event и days_since_last_grade
+посчитаны на сегодня): оценки, выставленные после расчёта, воркер увидит
+после её истечения. Поэтому задачу запускают не раз в сутки, а каждый
+час в течение учебного дня. После замены модели воркер записью не
+пользуется для ml_results — только для фич.
+
+Ответы Core API здесь собираются SQL-запросами по базе Django. Чтобы
+они не разошлись с сериализаторами Django незаметно, перед расчётом
+фичи студента PRECOMPUTE_CHECK_USERNAME считаются обоими путями
+(Core API и SQL) и сравниваются; при расхождении задача ничего не пишет.
+
+Запуск из ml_service/, например из cron в 0 7-21 * * *:
+
+    python -m training.precompute_upcoming --horizon-days 7
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time as timer
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import psycopg2
+from loguru import logger
+from sqlalchemy import text
+
+from api.auth.service import auth_login
+from config import settings
+from db.session import engine as async_engine
+from services.django_client import close_client
+from services.features import build_topic_features, collect_student_features
+from services.ml_model import model_registries, models_version, predict_topic_needs
+from services.peer_index import peer_hint
+from services.prompt import stable_topics
+from services.student_context import build_student_context
+from training.registry import get_engine
+
+
+STUDENTS_SQL = """
+SELECT DISTINCT sg.student_id
+FROM schedule_schedule s
+JOIN core_student_groups sg ON sg.group_id = s.group_id
+WHERE (s.is_test OR s.is_exam OR s.is_control_work OR s.is_final)
+  AND s.due_date BETWEEN current_date AND current_date + %(days)s
+ORDER BY sg.student_id
+"""
+
+# Расписание групп студента — как /my-schedule (ScheduleSerializer)
+SCHEDULE_SQL = """
+SELECT
+    sg.student_id,
+    subj.title AS subject,
+    t.department,
+    s.topic,
+    s.weekday,
+    s.starts_at,
+    s.ends_at,
+    s.due_date,
+    s.max_score,
+    s.is_test,
+    s.is_exam,
+    s.is_lab_work,
+    s.is_control_work,
+    s.is_final,
+    s.teacher_id
+FROM schedule_schedule s
+JOIN core_student_groups sg ON sg.group_id = s.group_id
+JOIN core_subject subj ON subj.id = s.subject_id
+LEFT JOIN core_teacher t ON t.id = s.teacher_id
+WHERE sg.student_id = ANY(%(students)s::uuid[])
+ORDER BY sg.student_id, s.weekday, s.starts_at
+"""
+
+# Оценки студента — как /my-grades (блок на предмет)
+GRADES_SQL = """
+SELECT g.student_id, g.subject_id, subj.title AS subject, g.topic, g.value, g.weight, g.work_date
+FROM grades_grade g
+JOIN core_subject subj ON subj.id = g.subject_id
+WHERE g.student_id = ANY(%(students)s::uuid[])
+ORDER BY g.student_id, g.subject_id, g.work_date, g.created_at
+"""
+
+CLEANUP_SQL = text("DELETE FROM student_precomputed WHERE expires_at < now()")
+
+UPSERT_SQL = text("""
+    INSERT INTO student_precomputed
+        (external_user_id, features, ml_results, student_context, model_version, computed_at, expires_at)
+    VALUES
+        (:external_user_id, CAST(:features AS jsonb), CAST(:ml_results AS jsonb),
+         :student_context, :model_version, now(), :expires_at)
+    ON CONFLICT (external_user_id) DO UPDATE SET
+        features = EXCLUDED.features,
+        ml_results = EXCLUDED.ml_results,
+        student_context = EXCLUDED.student_context,
+        model_version = EXCLUDED.model_version,
+        computed_at = EXCLUDED.computed_at,
+        expires_at = EXCLUDED.expires_at
+""")
+
+
+def upcoming_students(conn, days: int, limit: int | None) -> list[str]:
+    with conn.cursor() as cur:
+        cur.execute(STUDENTS_SQL, {"days": days})
+        students = [row[0] for row in cur.fetchall()]
+    return students[:limit] if limit else students
+
+
+def load_payloads(conn, students: list[str]) -> tuple[dict, dict]:
+    """student_id → (расписание, оценки) в форме ответов Core API"""
+    schedules: dict[str, list] = defaultdict(list)
+    grades: dict[str, dict] = defaultdict(dict)
+
+    with conn.cursor() as cur:
+        cur.execute(SCHEDULE_SQL, {"students": students})
+        for (student_id, subject, department, topic, weekday, starts_at, ends_at, due_date,
+             max_score, is_test, is_exam, is_lab_work, is_control_work, is_final, teacher_id) in cur:
+            item = {
+                "subject": {"title": subject},
+                "topic": topic,
+                "weekday": weekday,
+                "starts_at": starts_at.isoformat() if starts_at else None,
+                "ends_at": ends_at.isoformat() if ends_at else None,
+                "due_date": due_date.isoformat() if due_date else None,
+                "max_score": max_score,
+                "is_test": is_test,
+                "is_exam": is_exam,
+                "is_lab_work": is_lab_work,
+                "is_control_work": is_control_work,
+                "is_final": is_final,
+            }
+            if teacher_id is not None:
+                item["teacher"] = {"department": department}
+            schedules[str(student_id)].append(item)
+
+        cur.execute(GRADES_SQL, {"students": students})
+        for student_id, subject_id, subject, topic, value, weight, work_date in cur:
+            block = grades[str(student_id)].setdefault(subject_id, {"subject": {"title": subject}, "grades": []})
+            block["grades"].append({
+                "topic": topic,
+                "value": value,
+                "weight": weight,
+                "work_date": work_date.isoformat() if work_date else None,
+            })
+
+    return schedules, {student: list(blocks.values()) for student, blocks in grades.items()}
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+async def check_payloads(conn) -> list[str]:
+    """
+    Фичи студента PRECOMPUTE_CHECK_USERNAME через Core API и через
+    load_payloads; возвращает ключи тем, которые разошлись. Порядок тем
+    не сравнивается: /my-grades отдаёт оценки без сортировки.
+    """
+    login = await auth_login(settings.PRECOMPUTE_CHECK_USERNAME, settings.PRECOMPUTE_CHECK_PASSWORD)
+    student_id = str(login["user_id"])
+
+    expected = {f.key: f.to_dict() for f in await collect_student_features(login["access"])}
+    schedules, grades = load_payloads(conn, [student_id])
+    actual = {
+        f.key: f.to_dict()
+        for f in build_topic_features(schedules.get(student_id, []), grades.get(student_id, []))
+    }
+
+    return sorted(
+        key for key in expected.keys() | actual.keys()
+        if key not in expected or key not in actual
+        or any(not _same(expected[key][field], actual[key][field]) for field in expected[key])
+    )
+
+
+def precompute_student(schedule: list, grades: list) -> tuple[list, dict, str]:
+    """Тот же холодный путь, что у /message: фичи → модель → постоянный блок промпта"""
+    features = build_topic_features(schedule, grades)
+    ml_results = predict_topic_needs(features)
+    stable = stable_topics(features, ml_results, settings.PROMPT_TOPICS_K, settings.PROMPT_URGENT_DAYS)
+    context = build_student_context(stable, ml_results, peer_hint(features))
+    return [f.to_dict() for f in features], ml_results, context
+
+
+def expires_at(ttl_hours: float) -> datetime:
+    now = datetime.now().astimezone()
+    midnight = datetime.combine(date.today() + timedelta(days=1), time.min).astimezone()
+    return min(now + timedelta(hours=ttl_hours), midnight)
+
+
+async def precompute(args) -> int:
+    started = timer.time()
+
+    # те же модели, что загрузит воркер (model_versions / MODEL_PATH)
+    for registry in model_registries:
+        await registry.refresh()
+    version = models_version()
+    await async_engine.dispose()
+
+    django = psycopg2.connect(settings.DJANGO_DATABASE_DSN)
+    engine = get_engine()
+    saved = 0
+    try:
+        if settings.PRECOMPUTE_CHECK_USERNAME:
+            drift = await check_payloads(django)
+            if drift:
+                logger.error(
+                    f"SQL payloads differ from Core API for {len(drift)} topics "
+                    f"(e.g. {drift[:3]}), nothing saved — update load_payloads"
+                )
+                raise SystemExit(1)
+            logger.info("SQL payloads match Core API")
+        else:
+            logger.warning("PRECOMPUTE_CHECK_USERNAME is not set, SQL payloads are not checked against Core API")
+
+        students = upcoming_students(django, args.horizon_days, args.limit)
+        logger.info(f"Students with events in {args.horizon_days} days: {len(students)}, models: {version}")
+
+        with engine.begin() as conn:
+            conn.execute(CLEANUP_SQL)
+
+        expires = expires_at(args.ttl_hours)
+        for i in range(0, len(students), args.chunk):
+            chunk = students[i:i + args.chunk]
+            schedules, grades = load_payloads(django, chunk)
+            rows = []
+            for student_id in chunk:
+                features, ml_results, context = precompute_student(
+                    schedules.get(student_id, []), grades.get(student_id, [])
+                )
+                rows.append({
+                    "external_user_id": student_id,
+                    "features": json.dumps(features, ensure_ascii=False),
+                    "ml_results": json.dumps(ml_results, ensure_ascii=False),
+                    "student_context": context,
+                    "model_version": version,
+                    "expires_at": expires,
+                })
+            with engine.begin() as conn:
+                conn.execute(UPSERT_SQL, rows)
+            saved += len(rows)
+            logger.info(f"Precomputed {saved}/{len(students)} students")
+    finally:
+        django.close()
+        await close_client()
+
+    logger.info(f"Saved {saved} precomputed students until {expires:%Y-%m-%d %H:%M}, {timer.time() - started:.1f}s")
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фичи и контекст студентов с близкими контрольными")
+    parser.add_argument("--horizon-days", type=int, default=7, help="события с due_date в ближайшие N дней")
+    parser.add_argument(
+        "--ttl-hours",
+        type=float,
+        default=settings.STUDENT_PRECOMPUTED_MAX_AGE / 3600,
+        help="сколько живёт запись (не дольше конца дня)",
+    )
+    parser.add_argument("--chunk", type=int, default=500, help="студентов за один запрос к Django")
+    parser.add_argument("--limit", type=int, default=None, help="сколько студентов обработать (для пробного запуска)")
+    asyncio.run(precompute(parser.parse_args()))
@@ -0,0 +1,140 @@
+"""
+Генерация готовых советов для services/advice.py.
+
+Для каждой темы из оценок и расписания Django и каждого состояния темы
+(BUCKETS) один раз спрашиваем сильную модель и кладём ответ в таблицу
+advice_templates. Свежие советы (моложе --stale-days) не перегенерируются.
+Воркеры перечитывают таблицу сами (ADVICE_REFRESH_INTERVAL).
+
+Запуск из ml_service/, например раз в сутки:
+
+    python -m training.refresh_advice_templates --concurrency 4 --stale-days 7
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import psycopg2
+from loguru import logger
+from sqlalchemy import text
+
+from config import settings
+from services.advice import BUCKETS
+from services.llm_backends import LLMBackend
+from services.llm_router import make_backend
+from training.registry import get_engine
+
+
+TOPICS_SQL = """
+SELECT trim(subj.title) AS subject, trim(g.topic) AS topic
+FROM grades_grade g
+JOIN core_subject subj ON subj.id = g.subject_id
+WHERE trim(g.topic) <> ''
+UNION
+SELECT trim(subj.title), trim(s.topic)
+FROM schedule_schedule s
+JOIN core_subject subj ON subj.id = s.subject_id
+WHERE trim(s.topic) <> ''
+ORDER BY 1, 2
+"""
+
+FRESH_SQL = text("""
+    SELECT subject, topic, bucket FROM advice_templates
+    WHERE updated_at > now() - make_interval(days => :days)
+""")
+
+UPSERT_SQL = text("""
+    INSERT INTO advice_templates (id, subject, topic, bucket, text, model, updated_at)
+    VALUES (:id, :subject, :topic, :bucket, :text, :model, now())
+    ON CONFLICT (subject, topic, bucket) DO UPDATE SET
+        text = EXCLUDED.text,
+        model = EXCLUDED.model,
+        updated_at = EXCLUDED.updated_at
+""")
+
+PROMPT = """
+Предмет: {subject}
+Тема: {topic}
+Состояние студента по теме: {state}
+
+Студент спрашивает, как ему подготовиться по этой теме и с чего начать.
+Напиши один совет (30-50 слов) на русском языке.
+Совет должен быть конкретным и мотивирующим и подходить любому студенту в таком состоянии.
+"""
+
+
+def load_topics(limit: int | None) -> list[tuple[str, str]]:
+    conn = psycopg2.connect(settings.DJANGO_DATABASE_DSN)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(TOPICS_SQL)
+            topics = cur.fetchall()
+    finally:
+        conn.close()
+    return topics[:limit] if limit else topics
+
+
+async def generate(client: LLMBackend, jobs: list[tuple[str, str, str]], concurrency: int) -> list[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(subject: str, topic: str, bucket: str) -> dict | None:
+        async with semaphore:
+            advice = await client.ask(PROMPT.format(subject=subject, topic=topic, state=BUCKETS[bucket]))
+        # заглушку при ошибке модели не сохраняем — попробуем в следующий запуск
+        if not advice or advice in LLMBackend.FALLBACK_TEXTS:
+            return None
+        return {
+            "id": uuid.uuid4(),
+            "subject": subject,
+            "topic": topic,
+            "bucket": bucket,
+            "text": advice,
+            "model": client.model,
+        }
+
+    results = await asyncio.gather(*(one(*job) for job in jobs))
+    return [row for row in results if row is not None]
+
+
+def refresh(args) -> int:
+    started = time.time()
+    engine = get_engine()
+
+    with engine.connect() as conn:
+        fresh = {tuple(r) for r in conn.execute(FRESH_SQL, {"days": args.stale_days})}
+
+    jobs = [
+        (subject, topic, bucket)
+        for subject, topic in load_topics(args.limit)
+        for bucket in BUCKETS
+        if (subject, topic, bucket) not in fresh
+    ]
+    logger.info(f"Advice templates to generate: {len(jobs)} (fresh: {len(fresh)})")
+    if not jobs:
+        return 0
+
+    client = make_backend(settings.LLM_BACKEND, settings.LLM_STRONG_MODEL)
+    rows = asyncio.run(generate(client, jobs, args.concurrency))
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(UPSERT_SQL, rows)
+
+    logger.info(
+        f"Saved {len(rows)} advice templates, failed {len(jobs) - len(rows)}, "
+        f"{time.time() - started:.1f}s"
+    )
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Готовые советы по состоянию темы")
+    parser.add_argument("--concurrency", type=int, default=4, help="параллельных запросов к модели")
+    parser.add_argument("--stale-days", type=int, default=7, help="через сколько дней перегенерировать совет")
+    parser.add_argument("--limit", type=int, default=None, help="сколько тем обработать (для пробного запуска)")
+    refresh(parser.parse_args())
@@ -0,0 +1,106 @@
+"""
+Регистрация и активация версий моделей в таблице model_versions.
+
+Воркеры ML-сервиса подхватывают активную версию сами, без рестарта
+(services/model_registry.py). Запуск из ml_service/:
+
+    python -m training.registry list topic_needs
+    python -m training.registry activate topic_needs 20261019T120000Z
+"""
+import argparse
+import json
+import os
+import sys
+import uuid
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import create_engine, text
+
+from config import settings
+
+
+def get_engine():
+    # как и Alembic, используем синхронный драйвер
+    return create_engine(settings.DATABASE_URL.replace("+asyncpg", "+psycopg2"))
+
+
+def register_version(name: str, version: str, path: str, metrics: dict, activate: bool = False) -> None:
+    """path — относительно MODEL_PATH"""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO model_versions (id, name, version, path, metrics, is_active, created_at)
+                VALUES (:id, :name, :version, :path, CAST(:metrics AS jsonb), false, now())
+                ON CONFLICT (name, version) DO UPDATE SET
+                    path = EXCLUDED.path,
+                    metrics = EXCLUDED.metrics
+            """),
+            {
+                "id": uuid.uuid4(),
+                "name": name,
+                "version": version,
+                "path": path,
+                "metrics": json.dumps(metrics, ensure_ascii=False, default=str),
+            },
+        )
+        if activate:
+            _activate(conn, name, version)
+
+
+def activate_version(name: str, version: str) -> None:
+    with get_engine().begin() as conn:
+        _activate(conn, name, version)
+
+
+def _activate(conn, name: str, version: str) -> None:
+    conn.execute(
+        text("UPDATE model_versions SET is_active = false WHERE name = :name AND is_active"),
+        {"name": name},
+    )
+    result = conn.execute(
+        text("""
+            UPDATE model_versions
+            SET is_active = true, activated_at = now()
+            WHERE name = :name AND version = :version
+        """),
+        {"name": name, "version": version},
+    )
+    if result.rowcount == 0:
+        raise SystemExit(f"Версия {name}:{version} не зарегистрирована")
+
+
+def list_versions(name: str) -> list[dict]:
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT version, path, is_active, created_at, activated_at, metrics
+                FROM model_versions
+                WHERE name = :name
+                ORDER BY created_at DESC
+            """),
+            {"name": name},
+        )
+        return [dict(row._mapping) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Реестр версий моделей")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = sub.add_parser("list")
+    list_parser.add_argument("name")
+
+    activate_parser = sub.add_parser("activate")
+    activate_parser.add_argument("name")
+    activate_parser.add_argument("version")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        for row in list_versions(args.name):
+            marker = "*" if row["is_active"] else " "
+            print(f"{marker} {row['version']}  {row['path']}  {json.dumps(row['metrics'], default=str)}")
+    else:
+        activate_version(args.name, args.version)
+        print(f"{args.name}:{args.version} активна")
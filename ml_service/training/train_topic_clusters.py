@@ -0,0 +1,198 @@
+"""
+Кластеризация состояний (студент, тема) по всей истории оценок.
+
+Для каждой темы студента считается текущее состояние — те же колонки
+FEATURE_COLUMNS, что сервис получает из Core API. Из потока состояний
+набирается ограниченная случайная выборка (--sample-rows), на ней
+обучаются импьютер, скейлер и KMeans. Кластеры упорядочены по средней
+оценке центроида: 0 — самые проблемные темы.
+
+В артефакт попадают только массивы NumPy (медианы, mean/scale, центроиды),
+сервис назначает кластер поиском ближайшего центроида без sklearn
+(services/topic_clusters.py). Результат пишется в
+MODEL_PATH/topic_clusters/<version>/ и регистрируется в model_versions.
+
+Запуск из ml_service/:
+
+    python -m training.train_topic_clusters --clusters 4 --activate
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from loguru import logger
+from sklearn.cluster import KMeans
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+from config import settings
+from services.ml_model import FEATURE_COLUMNS
+from training.registry import register_version
+from training.train_topic_model import GROUP_KEYS, Reservoir, iter_student_chunks, save_version
+
+
+MODEL_NAME = "topic_clusters"
+MODELS_DIR = os.path.join(settings.MODEL_PATH, MODEL_NAME)
+
+
+def current_state_features(df: pd.DataFrame, now: pd.Timestamp) -> pd.DataFrame:
+    """
+    Состояние каждой (студент, предмет, тема) на момент now —
+    векторный аналог extract_grade_features + extract_schedule_features.
+    """
+    value = df["value"].astype(np.float64)
+    weight = df["weight"].astype(np.float64)
+    has_value = value.notna()
+
+    grouped = df.assign(
+        _vw=(value * weight).where(has_value, 0.0),
+        _w=weight.where(has_value, 0.0),
+        _n=has_value.astype(np.int64),
+        _fail=(value < 4).astype(np.int64),
+        _value=value,
+        _date=pd.to_datetime(df["work_date"]),
+        _due=pd.to_datetime(df["due_date"]),
+    ).groupby(GROUP_KEYS, sort=False)
+
+    state = grouped.agg(
+        vw=("_vw", "sum"),
+        w=("_w", "sum"),
+        total_works=("_n", "sum"),
+        fails=("_fail", "sum"),
+        min_score=("_value", "min"),
+        last_date=("_date", "max"),
+        due_date=("_due", "first"),
+        is_test=("is_test", "first"),
+        is_exam=("is_exam", "first"),
+        is_lab=("is_lab_work", "first"),
+        is_control=("is_control_work", "first"),
+        is_final=("is_final", "first"),
+    )
+
+    features = pd.DataFrame(
+        {
+            "avg_score": (state["vw"] / state["w"]).where(state["w"] > 0).round(3),
+            "min_score": state["min_score"],
+            "total_works": state["total_works"].astype(np.float64),
+            "fails": state["fails"].astype(np.float64),
+            "days_since_last_grade": (now - state["last_date"]).dt.days,
+            "days_until_event": (state["due_date"] - now.normalize()).dt.days,
+            "is_test": state["is_test"].eq(True).astype(np.float64),
+            "is_exam": state["is_exam"].eq(True).astype(np.float64),
+            "is_lab": state["is_lab"].eq(True).astype(np.float64),
+            "is_control": state["is_control"].eq(True).astype(np.float64),
+            "is_final": state["is_final"].eq(True).astype(np.float64),
+        }
+    )
+    return features[FEATURE_COLUMNS].astype(np.float64)
+
+
+def fit_clusters(X: np.ndarray, n_clusters: int) -> dict:
+    impute = SimpleImputer(strategy="median", keep_empty_features=True).fit(X)
+    X_imp = impute.transform(X)
+    scale = StandardScaler().fit(X_imp)
+    Z = scale.transform(X_imp)
+
+    kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit(Z)
+
+    # центроиды в исходных единицах — для упорядочивания и описания кластеров
+    centers = scale.inverse_transform(kmeans.cluster_centers_)
+    order = np.argsort(centers[:, FEATURE_COLUMNS.index("avg_score")])
+    sizes = np.bincount(kmeans.labels_, minlength=n_clusters)[order]
+
+    return {
+        "fill": impute.statistics_.astype(np.float64),
+        "mean": scale.mean_.astype(np.float64),
+        # нулевой разброс колонки StandardScaler заменяет на 1
+        "scale": scale.scale_.astype(np.float64),
+        "centroids": np.ascontiguousarray(kmeans.cluster_centers_[order], dtype=np.float64),
+        "profiles": [
+            {
+                "cluster": cluster,
+                "share": round(float(sizes[cluster] / sizes.sum()), 4),
+                "center": {
+                    col: round(float(v), 3)
+                    for col, v in zip(FEATURE_COLUMNS, centers[order][cluster])
+                },
+            }
+            for cluster in range(n_clusters)
+        ],
+        "inertia": float(kmeans.inertia_),
+    }
+
+
+def train(args) -> str:
+    started = time.time()
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    # как datetime.utcnow() в extract_grade_features
+    now = pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None))
+
+    reservoir = Reservoir(args.sample_rows, len(FEATURE_COLUMNS))
+    states = 0
+
+    conn = psycopg2.connect(settings.DJANGO_DATABASE_DSN)
+    try:
+        for df in iter_student_chunks(conn, None, args.chunk_size):
+            X = current_state_features(df, now).to_numpy()
+            reservoir.add(X, np.zeros(len(X), dtype=np.int64))
+            states += len(X)
+    finally:
+        conn.close()
+
+    X, _ = reservoir.data()
+    if len(X) < args.clusters:
+        raise SystemExit("Недостаточно данных для кластеризации")
+
+    fitted = fit_clusters(X, args.clusters)
+    profiles = fitted.pop("profiles")
+    inertia = fitted.pop("inertia")
+
+    metrics = {
+        "version": version,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "states": states,
+        "sample_rows": int(len(X)),
+        "clusters": args.clusters,
+        "inertia": round(inertia, 3),
+        "profiles": profiles,
+        "feature_columns": FEATURE_COLUMNS,
+        "duration_sec": round(time.time() - started, 1),
+    }
+    artifact = {
+        **fitted,
+        "profiles": profiles,
+        "feature_columns": FEATURE_COLUMNS,
+        "version": version,
+    }
+    path = save_version(version, artifact, metrics, models_dir=MODELS_DIR)
+    logger.info(f"Saved topic clusters {version} to {path}: {json.dumps(profiles, ensure_ascii=False)}")
+
+    register_version(
+        MODEL_NAME,
+        version,
+        os.path.join(MODEL_NAME, version, "model.joblib"),
+        metrics,
+        activate=args.activate,
+    )
+    if args.activate:
+        logger.info(f"Activated topic clusters {version}")
+
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Кластеризация состояний тем студентов")
+    parser.add_argument("--clusters", type=int, default=3)
+    parser.add_argument("--sample-rows", type=int, default=200000, help="размер выборки для KMeans")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--activate", action="store_true", help="сделать новую версию активной")
+    train(parser.parse_args())
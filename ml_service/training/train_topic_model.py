@@ -0,0 +1,405 @@
+"""
+Обучение модели «тему нужно повторить» на истории оценок из базы Django.
+
+Оценки (вместе с подходящей строкой расписания) читаются серверным
+курсором psycopg2 порциями по --chunk-size строк, поэтому память не
+зависит от размера истории. Для каждой оценки считаются фичи «на момент
+до неё» — те же, что extract_grade_features / extract_schedule_features
+дают в онлайне, только «сегодня» = дата работы. Метка: оценка < 4.
+
+Модель — Pipeline(SimpleImputer → StandardScaler → SGDClassifier(log_loss)),
+скейлер и классификатор учатся через partial_fit. Результат пишется в
+MODEL_PATH/topic_needs/<version>/ (model.joblib + metrics.json)
+и регистрируется в таблице model_versions.
+
+Запуск из ml_service/:
+
+    python -m training.train_topic_model                  # полное обучение
+    python -m training.train_topic_model --incremental    # дообучение на новых оценках
+    python -m training.train_topic_model --activate       # сразу сделать активной
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Iterator
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+import joblib
+import numpy as np
+import pandas as pd
+import psycopg2
+from loguru import logger
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import log_loss, precision_recall_fscore_support, roc_auc_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from config import settings
+from services.ml_model import FEATURE_COLUMNS
+from training.registry import register_version
+
+
+MODEL_NAME = "topic_needs"
+MODELS_DIR = os.path.join(settings.MODEL_PATH, MODEL_NAME)
+GROUP_KEYS = ["student_id", "subject", "topic"]
+
+# Оценки в хронологическом порядке внутри (студент, предмет, тема)
+# + самая поздняя строка расписания этой темы в группах студента
+GRADES_SQL = """
+SELECT
+    g.student_id,
+    trim(subj.title) AS subject,
+    trim(g.topic) AS topic,
+    g.value,
+    g.weight,
+    g.work_date,
+    g.created_at,
+    sch.is_test,
+    sch.is_exam,
+    sch.is_lab_work,
+    sch.is_control_work,
+    sch.is_final,
+    sch.due_date
+FROM grades_grade g
+JOIN core_subject subj ON subj.id = g.subject_id
+LEFT JOIN LATERAL (
+    SELECT s.is_test, s.is_exam, s.is_lab_work, s.is_control_work, s.is_final, s.due_date
+    FROM schedule_schedule s
+    JOIN core_student_groups sg
+      ON sg.group_id = s.group_id AND sg.student_id = g.student_id
+    WHERE s.subject_id = g.subject_id AND trim(s.topic) = trim(g.topic)
+    ORDER BY s.due_date DESC NULLS LAST
+    LIMIT 1
+) sch ON true
+WHERE trim(g.topic) <> ''
+{incremental_filter}
+ORDER BY g.student_id, subject, topic, g.work_date NULLS FIRST, g.created_at
+"""
+
+# Только темы, где появились новые оценки (вся их история нужна для фич).
+# Тема сравнивается по тому же ключу, что и группа в GRADES_SQL: иначе
+# новая оценка по «Тема » перечитала бы лишь часть истории «Тема»
+INCREMENTAL_FILTER = """
+  AND EXISTS (
+    SELECT 1 FROM grades_grade n
+    JOIN core_subject nsubj ON nsubj.id = n.subject_id
+    WHERE n.student_id = g.student_id
+      AND trim(nsubj.title) = trim(subj.title)
+      AND trim(n.topic) = trim(g.topic)
+      AND n.created_at > %(since)s
+  )
+"""
+
+
+# ======================
+# Чтение из Django
+# ======================
+def iter_student_chunks(conn, since: datetime | None, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Порции строк, не разрывающие студента: хвост последнего студента
+    переносится в следующую порцию, чтобы групповые cumsum были полными.
+    """
+    query = GRADES_SQL.format(incremental_filter=INCREMENTAL_FILTER if since else "")
+
+    # именованный курсор psycopg2 = серверный курсор Postgres
+    with conn.cursor(name="topic_model_grades") as cur:
+        cur.itersize = chunk_size
+        cur.execute(query, {"since": since})
+
+        carry = None
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            df = pd.DataFrame(rows, columns=[d[0] for d in cur.description])
+            if carry is not None:
+                df = pd.concat([carry, df], ignore_index=True)
+
+            tail = df["student_id"] == df["student_id"].iloc[-1]
+            carry = df[tail].reset_index(drop=True)
+            ready = df[~tail]
+            if len(ready):
+                yield ready.reset_index(drop=True)
+
+        if carry is not None and len(carry):
+            yield carry
+
+
+# ======================
+# Фичи
+# ======================
+def point_in_time_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Векторная версия extract_grade_features + extract_schedule_features
+    для каждой оценки по предыдущим оценкам той же темы.
+    """
+    value = df["value"].astype(np.float64)
+    weight = df["weight"].astype(np.float64)
+    work_date = pd.to_datetime(df["work_date"])
+    due_date = pd.to_datetime(df["due_date"])
+
+    grouped = df.assign(
+        _vw=value * weight,
+        _w=weight,
+        _fail=(value < 4).astype(np.int64),
+        _value=value,
+        _date=work_date,
+    ).groupby(GROUP_KEYS, sort=False)
+
+    # cumsum минус текущая строка = сумма по предыдущим оценкам
+    prev_vw = grouped["_vw"].cumsum() - value * weight
+    prev_w = grouped["_w"].cumsum() - weight
+    prev_fails = grouped["_fail"].cumsum() - (value < 4).astype(np.int64)
+
+    prev_value = grouped["_value"].shift()
+    prev_date = grouped["_date"].shift()
+    keys = [df[k] for k in GROUP_KEYS]
+    prev_min = prev_value.groupby(keys, sort=False).cummin()
+    prev_last_date = prev_date.groupby(keys, sort=False).cummax()
+
+    features = pd.DataFrame(
+        {
+            "avg_score": (prev_vw / prev_w).where(prev_w > 0).round(3),
+            "min_score": prev_min,
+            "total_works": grouped.cumcount().astype(np.float64),
+            "fails": prev_fails.astype(np.float64),
+            "days_since_last_grade": (work_date - prev_last_date).dt.days,
+            "days_until_event": (due_date - work_date).dt.days,
+            "is_test": df["is_test"].eq(True).astype(np.float64),
+            "is_exam": df["is_exam"].eq(True).astype(np.float64),
+            "is_lab": df["is_lab_work"].eq(True).astype(np.float64),
+            "is_control": df["is_control_work"].eq(True).astype(np.float64),
+            "is_final": df["is_final"].eq(True).astype(np.float64),
+        }
+    )
+    return features[FEATURE_COLUMNS].astype(np.float64)
+
+
+def holdout_mask(student_ids: pd.Series, ratio: float) -> np.ndarray:
+    """Стабильное разбиение по студентам: один студент всегда в одной выборке"""
+    hashed = pd.util.hash_pandas_object(student_ids.astype(str), index=False).to_numpy()
+    return (hashed % 1000) < int(ratio * 1000)
+
+
+class Reservoir:
+    """Ограниченная случайная выборка строк валидации (для метрик)"""
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 42):
+        self.capacity = capacity
+        self.X = np.empty((capacity, n_features))
+        self.y = np.empty(capacity, dtype=np.int64)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X: np.ndarray, y: np.ndarray) -> None:
+        n = len(y)
+        if n == 0:
+            return
+        positions = np.arange(self.seen, self.seen + n)
+        self.seen += n
+
+        fill = positions < self.capacity
+        self.X[positions[fill]] = X[fill]
+        self.y[positions[fill]] = y[fill]
+
+        rest = ~fill
+        if rest.any():
+            slots = self.rng.integers(0, positions[rest] + 1)
+            keep = slots < self.capacity
+            self.X[slots[keep]] = X[rest][keep]
+            self.y[slots[keep]] = y[rest][keep]
+
+    def data(self) -> tuple[np.ndarray, np.ndarray]:
+        size = min(self.seen, self.capacity)
+        return self.X[:size], self.y[:size]
+
+
+# ======================
+# Обучение
+# ======================
+def new_pipeline() -> Pipeline:
+    return Pipeline(
+        [
+            ("impute", SimpleImputer(strategy="median", keep_empty_features=True)),
+            ("scale", StandardScaler()),
+            ("clf", SGDClassifier(loss="log_loss", alpha=1e-4, random_state=42)),
+        ]
+    )
+
+
+def partial_fit(pipeline: Pipeline, X: np.ndarray, y: np.ndarray) -> None:
+    impute, scale, clf = (pipeline.named_steps[s] for s in ("impute", "scale", "clf"))
+    if not hasattr(impute, "statistics_"):
+        # медианы для пропусков берём с первой порции
+        impute.fit(X)
+    X_imp = impute.transform(X)
+    scale.partial_fit(X_imp)
+    clf.partial_fit(scale.transform(X_imp), y, classes=np.array([0, 1]))
+
+
+def evaluate(pipeline: Pipeline, X: np.ndarray, y: np.ndarray) -> dict:
+    if len(y) == 0 or len(np.unique(y)) < 2:
+        return {"rows": int(len(y)), "threshold": 0.5}
+
+    proba = pipeline.predict_proba(X)[:, 1]
+
+    # порог с лучшим F1 на валидации
+    best_threshold, best_f1 = 0.5, -1.0
+    for threshold in np.linspace(0.05, 0.95, 19):
+        _, _, f1, _ = precision_recall_fscore_support(
+            y, proba >= threshold, average="binary", zero_division=0
+        )
+        if f1 > best_f1:
+            best_threshold, best_f1 = float(threshold), float(f1)
+
+    precision, recall, _, _ = precision_recall_fscore_support(
+        y, proba >= best_threshold, average="binary", zero_division=0
+    )
+    return {
+        "rows": int(len(y)),
+        "positive_rate": round(float(y.mean()), 4),
+        "roc_auc": round(float(roc_auc_score(y, proba)), 4),
+        "log_loss": round(float(log_loss(y, proba, labels=[0, 1])), 4),
+        "f1": round(best_f1, 4),
+        "precision": round(float(precision), 4),
+        "recall": round(float(recall), 4),
+        "threshold": round(best_threshold, 2),
+    }
+
+
+def latest_version() -> str | None:
+    if not os.path.isdir(MODELS_DIR):
+        return None
+    versions = sorted(
+        v for v in os.listdir(MODELS_DIR)
+        if os.path.exists(os.path.join(MODELS_DIR, v, "model.joblib"))
+    )
+    return versions[-1] if versions else None
+
+
+def load_version(version: str) -> tuple[dict, dict]:
+    path = os.path.join(MODELS_DIR, version)
+    artifact = joblib.load(os.path.join(path, "model.joblib"))
+    with open(os.path.join(path, "metrics.json")) as f:
+        metrics = json.load(f)
+    return artifact, metrics
+
+
+def save_version(version: str, artifact: dict, metrics: dict, models_dir: str = MODELS_DIR) -> str:
+    path = os.path.join(models_dir, version)
+    os.makedirs(path, exist_ok=True)
+    # без сжатия: сервис грузит артефакт через mmap_mode="r"
+    joblib.dump(artifact, os.path.join(path, "model.joblib"))
+    with open(os.path.join(path, "metrics.json"), "w") as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2, default=str)
+    return path
+
+
+def train(args) -> str:
+    started = time.time()
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    parent_version = None
+    since = None
+    if args.incremental:
+        parent_version = args.base_version or latest_version()
+        if parent_version is None:
+            raise SystemExit("Нет предыдущей версии для --incremental")
+        artifact, parent_metrics = load_version(parent_version)
+        pipeline = artifact["pipeline"]
+        since = datetime.fromisoformat(parent_metrics["watermark"])
+        logger.info(f"Incremental training from {parent_version}, grades after {since}")
+    else:
+        pipeline = new_pipeline()
+
+    reservoir = Reservoir(args.eval_max_rows, len(FEATURE_COLUMNS))
+    watermark = since
+    train_rows = positives = chunks = 0
+
+    conn = psycopg2.connect(settings.DJANGO_DATABASE_DSN)
+    try:
+        for df in iter_student_chunks(conn, since, args.chunk_size):
+            chunks += 1
+            X = point_in_time_features(df).to_numpy()
+            y = (df["value"].to_numpy(dtype=np.float64) < 4).astype(np.int64)
+
+            created_at = pd.to_datetime(df["created_at"], utc=True)
+            chunk_max = created_at.max().to_pydatetime()
+            if watermark is None or chunk_max > watermark:
+                watermark = chunk_max
+
+            # при дообучении старые оценки нужны только как история для фич
+            labeled = np.ones(len(df), dtype=bool)
+            if since is not None:
+                labeled = (created_at > pd.Timestamp(since)).to_numpy()
+
+            holdout = holdout_mask(df["student_id"], args.holdout_ratio)
+            reservoir.add(X[labeled & holdout], y[labeled & holdout])
+
+            train_mask = labeled & ~holdout
+            if train_mask.any():
+                partial_fit(pipeline, X[train_mask], y[train_mask])
+                train_rows += int(train_mask.sum())
+                positives += int(y[train_mask].sum())
+
+            if chunks % 10 == 0:
+                logger.info(f"chunk {chunks}: {train_rows} training rows")
+    finally:
+        conn.close()
+
+    if train_rows == 0:
+        raise SystemExit("Нет данных для обучения")
+
+    eval_metrics = evaluate(pipeline, *reservoir.data())
+    metrics = {
+        "version": version,
+        "parent_version": parent_version,
+        "incremental": bool(args.incremental),
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "watermark": watermark.isoformat() if watermark else None,
+        "train_rows": train_rows,
+        "train_positive_rate": round(positives / train_rows, 4),
+        "validation": eval_metrics,
+        "feature_columns": FEATURE_COLUMNS,
+        "duration_sec": round(time.time() - started, 1),
+    }
+
+    artifact = {
+        "pipeline": pipeline,
+        "feature_columns": FEATURE_COLUMNS,
+        "threshold": eval_metrics["threshold"],
+        "version": version,
+    }
+    path = save_version(version, artifact, metrics)
+    logger.info(f"Saved topic model {version} to {path}: {json.dumps(eval_metrics)}")
+
+    # воркеры подхватят активную версию сами, без рестарта
+    register_version(
+        MODEL_NAME,
+        version,
+        os.path.join(MODEL_NAME, version, "model.joblib"),
+        metrics,
+        activate=args.activate,
+    )
+    if args.activate:
+        logger.info(f"Activated topic model {version}")
+
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обучение модели повторения тем")
+    parser.add_argument("--incremental", action="store_true", help="дообучить последнюю версию на новых оценках")
+    parser.add_argument("--base-version", help="версия для --incremental (по умолчанию последняя)")
+    parser.add_argument("--activate", action="store_true", help="сделать новую версию активной")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--holdout-ratio", type=float, default=0.1)
+    parser.add_argument("--eval-max-rows", type=int, default=200000)
+    train(parser.parse_args())